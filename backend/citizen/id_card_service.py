@@ -1,7 +1,6 @@
 from django.template.loader import render_to_string
 from django.conf import settings
 import os
-from weasyprint import HTML
 from .qr_generator import save_qr_code
 
 class IDCardPrintService:
@@ -34,7 +33,9 @@ class IDCardPrintService:
         # Render HTML template
         html_string = render_to_string('id_card_template.html', context)
         
-        # Convert HTML to PDF
+        # Convert HTML to PDF. WeasyPrint is imported here, on the first
+        # card printed, so workers that never print do not load it
+        from weasyprint import HTML
         html = HTML(string=html_string, base_url=settings.MEDIA_ROOT)
         pdf = html.write_pdf()
         
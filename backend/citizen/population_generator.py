@@ -0,0 +1,471 @@
+import csv
+import time
+from io import StringIO
+import numpy as np
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from location.models import Ward
+from .models.citizen import Citizen
+from .models.id_sequence_tracker import IDSequenceTracker
+
+# Share of the population with each value, roughly following national
+# census and survey figures. Shares are normalised when sampling.
+GENDERS = {'Male': 50.5, 'Female': 49.5}
+RELIGIONS = {'Islam': 50, 'Christianity': 47, 'Traditional': 2, 'Other': 1}
+ETHNICITIES = {
+    'Hausa': 30, 'Yoruba': 15.5, 'Igbo': 15.2, 'Fulani': 6, 'Kanuri': 2.4,
+    'Tiv': 2.4, 'Ijaw': 1.8, 'Ibibio': 1.8, 'Other': 24.9,
+}
+
+# Age bands (first age, last age) and their share of the population
+AGE_BANDS = {
+    (0, 4): 16, (5, 9): 14, (10, 14): 12, (15, 19): 10.5, (20, 24): 9,
+    (25, 29): 8, (30, 34): 7, (35, 39): 6, (40, 44): 5, (45, 49): 4,
+    (50, 54): 3, (55, 59): 2.5, (60, 64): 2, (65, 69): 1.5, (70, 79): 1.2, (80, 99): 0.3,
+}
+
+EDUCATION_LEVELS = {'None': 25, 'Primary': 25, 'Secondary': 30, 'Tertiary': 8, 'University': 10, 'Postgraduate': 2}
+SECTORS = {
+    'Agriculture': 35, 'Trade': 20, 'Manufacturing': 7, 'Public Service': 8, 'Education': 6,
+    'Health': 4, 'Transport': 6, 'ICT': 3, 'Other': 11,
+}
+EMPLOYMENT_STATUSES = {'Employed': 45, 'Self-employed': 30, 'Unemployed': 20, 'Student': 5}
+INCOME_LEVELS = {'Low': 60, 'Middle': 32, 'High': 8}
+QUALIFICATIONS = {'None': 30, 'SSCE': 35, 'OND': 10, 'HND': 8, 'BSc': 13, 'MSc': 3.5, 'PhD': 0.5}
+HEALTH_CONDITIONS = {'None': 80, 'Hypertension': 7, 'Diabetes': 3, 'Asthma': 3, 'Sickle Cell': 2, 'Other': 5}
+DISABILITIES = {'None': 95, 'Visual': 1.5, 'Hearing': 1, 'Physical': 2, 'Intellectual': 0.5}
+BLOOD_GROUPS = {'O+': 50, 'A+': 22, 'B+': 20, 'AB+': 3, 'O-': 2, 'A-': 1, 'B-': 1, 'AB-': 1}
+IMMUNIZATION_STATUSES = {'Complete': 55, 'Partial': 30, 'None': 15}
+MARITAL_STATUSES = {'Single': 30, 'Married': 58, 'Divorced': 4, 'Widowed': 8}
+FAMILY_TYPES = {'Nuclear': 50, 'Extended': 42, 'Single Parent': 8}
+INTEREST_TYPES = {'Sport': 60, 'Cultural': 40}
+SPORTS = {'Football': 55, 'Athletics': 10, 'Basketball': 8, 'Boxing': 7, 'Table Tennis': 10, 'Wrestling': 10}
+CULTURAL_ACTIVITIES = {'Music': 35, 'Dance': 25, 'Drama': 10, 'Festivals': 20, 'Arts and Crafts': 10}
+
+FIRST_NAMES = {
+    'Male': ['Abubakar', 'Chinedu', 'Emeka', 'Ibrahim', 'Musa', 'Oluwaseun', 'Tunde', 'Usman', 'Yakubu', 'Segun'],
+    'Female': ['Aisha', 'Amina', 'Chiamaka', 'Fatima', 'Funmilayo', 'Ngozi', 'Halima', 'Kemi', 'Zainab', 'Ifeoma'],
+}
+LAST_NAMES = [
+    'Adeyemi', 'Bello', 'Eze', 'Garba', 'Ibrahim', 'Mohammed', 'Nwosu', 'Obi', 'Okafor',
+    'Olawale', 'Suleiman', 'Usman', 'Yusuf', 'Abdullahi', 'Okeke', 'Balogun',
+]
+STREETS = ['Market Road', 'Station Road', 'Hospital Road', 'School Road', 'Palace Road', 'Church Street', 'Mosque Street']
+
+# Related records of a citizen, with the fields the generator fills
+RELATED_FIELDS = {
+    'education': ['level'],
+    'occupation': ['sector', 'employment_status', 'income_level', 'qualification'],
+    'health': ['condition', 'disability', 'blood_group', 'immunization_status'],
+    'family': ['household_size', 'marital_status', 'children_count', 'family_type'],
+    'interests': ['interest_type', 'sport_name', 'cultural_activity'],
+}
+
+# Highest sequence number of the six-digit ID sequence
+MAX_SEQUENCE_NUMBER = 999999
+
+
+def luhn_check_digits(numbers, width):
+    """
+    Compute Luhn check digits for an array of numbers
+    
+    Matches CitizenIDGenerator._calculate_check_digit, which only sees the
+    digits of an ID (year code and sequence number).
+    
+    Args:
+        numbers (numpy.ndarray): Integer digit strings as numbers
+        width (int): Number of digits, counting leading zeros
+    
+    Returns:
+        numpy.ndarray: Check digits
+    """
+    total = np.zeros(len(numbers), dtype=np.int64)
+    for position in range(width):
+        digit = (numbers // 10 ** position) % 10
+        if position % 2 == 1:
+            digit = digit * 2
+            digit = np.where(digit > 9, digit - 9, digit)
+        total += digit
+    return (10 - total % 10) % 10
+
+
+class PopulationGenerator:
+    """
+    Service for loading reproducible synthetic citizens for benchmarks
+    
+    Citizens are spread over the existing wards with skewed state, LGA and
+    ward sizes, and get related education, occupation, health, family and
+    interest records. IDs are issued per LGA and registration year exactly
+    as CitizenIDGenerator would, and the sequence trackers are moved past
+    them. On PostgreSQL rows are streamed in with COPY; other databases
+    fall back to bulk_create.
+    """
+    
+    def __init__(self, seed=0, chunk_size=100000, registration_years=5):
+        self.rng = np.random.default_rng(seed)
+        self.chunk_size = chunk_size
+        self.registration_years = registration_years
+        self.today = timezone.now().date()
+        self.now = timezone.now()
+    
+    def generate(self, count, on_chunk_done=None):
+        """
+        Generate and load citizens
+        
+        Args:
+            count (int): Number of citizens
+            on_chunk_done: Called with (loaded, count, seconds) after each chunk
+        
+        Returns:
+            dict: Summary with the number of citizens, interests and trackers
+        """
+        start = time.perf_counter()
+        wards = self._load_wards()
+        
+        with transaction.atomic():
+            trackers = self._lock_trackers(wards)
+            next_ids = {
+                name: (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+                for name, model in self._models().items()
+            }
+            
+            loaded = 0
+            interest_count = 0
+            while loaded < count:
+                size = min(self.chunk_size, count - loaded)
+                interest_count += self._load_chunk(size, wards, trackers, next_ids)
+                loaded += size
+                if on_chunk_done:
+                    on_chunk_done(loaded, count, time.perf_counter() - start)
+            
+            self._save_trackers(trackers)
+            self._reset_sequences()
+        
+        return {
+            'citizen_count': count,
+            'interest_count': interest_count,
+            'tracker_count': int((trackers['last'] > trackers['start']).sum()),
+            'duration': time.perf_counter() - start,
+        }
+    
+    def _models(self):
+        """
+        Get the models loaded, by the citizen relation they fill
+        """
+        models = {'citizen': Citizen}
+        for name in RELATED_FIELDS:
+            models[name] = Citizen._meta.get_field(name).related_model
+        return models
+    
+    def _load_wards(self):
+        """
+        Get every ward with its LGA, state and their codes, and a
+        population weight
+        """
+        rows = list(Ward.objects.values_list(
+            'pk', 'lga_id', 'lga__state_id', 'lga__code', 'lga__state__code'
+        ).order_by('pk'))
+        if not rows:
+            raise ValueError('No wards found; load the location hierarchy first')
+        
+        ward_ids, lga_ids, state_ids, lga_codes, state_codes = (np.array(column) for column in zip(*rows))
+        
+        # States, LGAs within a state and wards within an LGA differ a lot
+        # in size; a lognormal weight per level gives that skew
+        _, state_index = np.unique(state_ids, return_inverse=True)
+        _, lga_index = np.unique(lga_ids, return_inverse=True)
+        state_weights = self.rng.lognormal(0, 0.5, state_index.max() + 1)
+        lga_weights = self.rng.lognormal(0, 0.6, lga_index.max() + 1)
+        weights = state_weights[state_index] * lga_weights[lga_index] * self.rng.lognormal(0, 0.8, len(rows))
+        
+        # Normalise per LGA before applying the LGA and state weights, so
+        # LGAs with many wards are not automatically the largest
+        wards_per_lga = np.bincount(lga_index)
+        weights = weights / wards_per_lga[lga_index]
+        
+        # IDs are numbered per state and LGA code pair
+        codes, code_index = np.unique(
+            np.char.add(np.char.add(state_codes.astype(str), '-'), lga_codes.astype(str)),
+            return_inverse=True
+        )
+        
+        return {
+            'ward_id': ward_ids,
+            'lga_id': lga_ids,
+            'state_id': state_ids,
+            'code_index': code_index,
+            'codes': [code.split('-') for code in codes],
+            'probability': weights / weights.sum(),
+        }
+    
+    def _lock_trackers(self, wards):
+        """
+        Lock the sequence trackers of every LGA code and registration year
+        """
+        years = [f'{(self.today.year - offset) % 100:02d}' for offset in range(self.registration_years)]
+        state_codes = np.array([state for state, _ in wards['codes']], dtype=object)
+        lga_codes = np.array([lga for _, lga in wards['codes']], dtype=object)
+        lga_count = len(wards['codes'])
+        
+        existing = {
+            (tracker.state_code, tracker.lga_code, tracker.year_code): tracker
+            for tracker in IDSequenceTracker.objects.select_for_update().filter(
+                lga_code__in=set(lga_codes), year_code__in=years
+            )
+        }
+        
+        # Last sequence number per (code pair, year)
+        last = np.zeros((lga_count, len(years)), dtype=np.int64)
+        for lga in range(lga_count):
+            for year_index, year_code in enumerate(years):
+                tracker = existing.get((state_codes[lga], lga_codes[lga], year_code))
+                if tracker:
+                    last[lga, year_index] = tracker.last_sequence_number
+        
+        return {
+            'years': years,
+            'lga_codes': lga_codes,
+            'state_codes': state_codes,
+            'existing': existing,
+            'start': last.copy(),
+            'last': last,
+        }
+    
+    def _save_trackers(self, trackers):
+        """
+        Move the sequence trackers past the issued IDs
+        """
+        created = []
+        updated = []
+        issued = np.argwhere(trackers['last'] > trackers['start'])
+        for lga, year_index in issued:
+            key = (trackers['state_codes'][lga], trackers['lga_codes'][lga], trackers['years'][year_index])
+            last_sequence_number = int(trackers['last'][lga, year_index])
+            tracker = trackers['existing'].get(key)
+            if tracker:
+                tracker.last_sequence_number = last_sequence_number
+                tracker.updated_at = timezone.now()
+                updated.append(tracker)
+            else:
+                created.append(IDSequenceTracker(
+                    state_code=key[0],
+                    lga_code=key[1],
+                    year_code=key[2],
+                    last_sequence_number=last_sequence_number
+                ))
+        
+        IDSequenceTracker.objects.bulk_create(created, batch_size=1000)
+        IDSequenceTracker.objects.bulk_update(updated, ['last_sequence_number', 'updated_at'], batch_size=1000)
+    
+    def _issue_ids(self, code_index, year_index, trackers):
+        """
+        Issue the next IDs of each citizen's LGA and registration year
+        """
+        years = len(trackers['years'])
+        keys = code_index * years + year_index
+        last = trackers['last'].reshape(-1)
+        
+        # Number citizens within each key in order, continuing the tracker
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        group_start = np.searchsorted(sorted_keys, sorted_keys, side='left')
+        sequence = np.empty(len(keys), dtype=np.int64)
+        sequence[order] = last[sorted_keys] + np.arange(len(keys)) - group_start + 1
+        
+        np.add.at(last, keys, 1)
+        if last.max() > MAX_SEQUENCE_NUMBER:
+            raise ValueError('An LGA ran out of sequence numbers; spread registrations over more years')
+        
+        year_codes = np.array(trackers['years'])[year_index]
+        check_digits = luhn_check_digits(year_codes.astype(np.int64) * 10 ** 6 + sequence, 8)
+        return [
+            f'NG-{state}-{lga}-{year}-{number:06d}-{check}'
+            for state, lga, year, number, check in zip(
+                trackers['state_codes'][code_index], trackers['lga_codes'][code_index],
+                year_codes, sequence.tolist(), check_digits.tolist()
+            )
+        ]
+    
+    def _choice(self, shares, size):
+        """
+        Sample values with the given shares
+        """
+        values = list(shares)
+        weights = np.array(list(shares.values()), dtype=np.float64)
+        return np.array(values, dtype=object)[self.rng.choice(len(values), size=size, p=weights / weights.sum())]
+    
+    def _ages(self, size):
+        """
+        Sample ages in whole years from the age bands
+        """
+        bands = list(AGE_BANDS)
+        weights = np.array(list(AGE_BANDS.values()))
+        band = self.rng.choice(len(bands), size=size, p=weights / weights.sum())
+        first = np.array([first for first, _ in bands])[band]
+        last = np.array([last for _, last in bands])[band]
+        return first + (self.rng.random(size) * (last - first + 1)).astype(np.int64)
+    
+    def _load_chunk(self, size, wards, trackers, next_ids):
+        """
+        Generate one chunk of citizens with their related records and load it
+        
+        Returns:
+            int: Number of interest rows loaded
+        """
+        rng = self.rng
+        today = np.datetime64(self.today, 'D')
+        
+        ward = rng.choice(len(wards['ward_id']), size=size, p=wards['probability'])
+        gender = self._choice(GENDERS, size)
+        ages = self._ages(size)
+        date_of_birth = today - (ages * 365.25 + rng.integers(0, 365, size)).astype('timedelta64[D]')
+        
+        # Registrations are spread over the last few years, never before birth
+        year_index = rng.integers(0, self.registration_years, size)
+        registration_date = today - (year_index * 365 + rng.integers(0, 365, size)).astype('timedelta64[D]')
+        registration_date = np.maximum(registration_date, date_of_birth)
+        registration_year = registration_date.astype('datetime64[Y]').astype(np.int64) + 1970
+        year_index = np.clip(self.today.year - registration_year, 0, self.registration_years - 1)
+        
+        unique_ids = self._issue_ids(wards['code_index'][ward], year_index, trackers)
+        
+        first_names = np.where(
+            gender == 'Male',
+            np.array(FIRST_NAMES['Male'], dtype=object)[rng.integers(0, 10, size)],
+            np.array(FIRST_NAMES['Female'], dtype=object)[rng.integers(0, 10, size)]
+        )
+        last_names = np.array(LAST_NAMES, dtype=object)[rng.integers(0, len(LAST_NAMES), size)]
+        citizen_ids = np.arange(next_ids['citizen'], next_ids['citizen'] + size)
+        next_ids['citizen'] += size
+        
+        adult = ages >= 18
+        children_count = np.where(adult, rng.poisson(2.5, size), 0)
+        values = {
+            'education': {
+                'level': np.where(ages < 6, 'None', self._choice(EDUCATION_LEVELS, size)),
+            },
+            'occupation': {
+                'sector': np.where(adult, self._choice(SECTORS, size), None),
+                'employment_status': np.select(
+                    [ages < 18, ages >= 65], ['Student', 'Retired'], self._choice(EMPLOYMENT_STATUSES, size)
+                ),
+                'income_level': np.where(adult, self._choice(INCOME_LEVELS, size), None),
+                'qualification': np.where(adult, self._choice(QUALIFICATIONS, size), 'None'),
+            },
+            'health': {
+                'condition': self._choice(HEALTH_CONDITIONS, size),
+                'disability': self._choice(DISABILITIES, size),
+                'blood_group': self._choice(BLOOD_GROUPS, size),
+                'immunization_status': self._choice(IMMUNIZATION_STATUSES, size),
+            },
+            'family': {
+                'household_size': np.clip(rng.poisson(4.5, size) + 1, 1, 20),
+                'marital_status': np.where(adult, self._choice(MARITAL_STATUSES, size), 'Single'),
+                'children_count': np.clip(children_count, 0, 20),
+                'family_type': self._choice(FAMILY_TYPES, size),
+            },
+        }
+        
+        citizen_columns = {
+            'unique_id': unique_ids,
+            'first_name': first_names,
+            'last_name': last_names,
+            'gender': gender,
+            'date_of_birth': date_of_birth.astype(object),
+            'phone_number': [f'080{number:08d}' for number in citizen_ids.tolist()],
+            'email': [
+                f'{first.lower()}.{last.lower()}{number}@example.com'
+                for first, last, number in zip(first_names, last_names, citizen_ids.tolist())
+            ],
+            'address': [
+                f'{number} {street}'
+                for number, street in zip(rng.integers(1, 200, size).tolist(), rng.choice(STREETS, size))
+            ],
+            'religion': self._choice(RELIGIONS, size),
+            'ethnicity': self._choice(ETHNICITIES, size),
+            'residence_state_id': wards['state_id'][ward],
+            'residence_lga_id': wards['lga_id'][ward],
+            'residence_ward_id': wards['ward_id'][ward],
+            'registration_date': registration_date.astype(object),
+            'created_at': [self.now] * size,
+            'updated_at': [self.now] * size,
+        }
+        
+        # One-to-one records referenced from the citizen row are loaded
+        # first, records pointing at the citizen after it
+        after_citizens = []
+        for name, fields in values.items():
+            field = Citizen._meta.get_field(name)
+            if field.concrete:
+                related_ids = np.arange(next_ids[name], next_ids[name] + size)
+                next_ids[name] += size
+                self._load(field.related_model, {'pk': related_ids, **fields})
+                citizen_columns[field.attname] = related_ids
+            else:
+                after_citizens.append((field, {field.field.attname: citizen_ids, **fields}))
+        
+        self._load(Citizen, {'pk': citizen_ids, **citizen_columns})
+        for field, columns in after_citizens:
+            self._load(field.related_model, columns)
+        
+        # Up to two interests each, sport or cultural
+        interest_counts = rng.choice(3, size=size, p=[0.4, 0.4, 0.2])
+        interest_total = int(interest_counts.sum())
+        interest_type = self._choice(INTEREST_TYPES, interest_total)
+        interests = Citizen._meta.get_field('interests')
+        self._load(interests.related_model, {
+            interests.field.attname: np.repeat(citizen_ids, interest_counts),
+            'interest_type': interest_type,
+            'sport_name': np.where(interest_type == 'Sport', self._choice(SPORTS, interest_total), None),
+            'cultural_activity': np.where(
+                interest_type == 'Cultural', self._choice(CULTURAL_ACTIVITIES, interest_total), None
+            ),
+        })
+        
+        return interest_total
+    
+    def _load(self, model, columns):
+        """
+        Load rows given as {field attname or 'pk': values} into a model's table
+        
+        Columns the model does not have are skipped.
+        """
+        attnames = {field.attname: field for field in model._meta.concrete_fields}
+        attnames['pk'] = model._meta.pk
+        columns = {name: values for name, values in columns.items() if name in attnames}
+        names = list(columns)
+        rows = zip(*(
+            values.tolist() if isinstance(values, np.ndarray) else values
+            for values in columns.values()
+        ))
+        
+        if connection.vendor == 'postgresql':
+            buffer = StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            
+            column_sql = ', '.join(connection.ops.quote_name(attnames[name].column) for name in names)
+            with connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f'COPY {connection.ops.quote_name(model._meta.db_table)} ({column_sql}) '
+                    f'FROM STDIN WITH (FORMAT csv)',
+                    buffer
+                )
+            return
+        
+        model.objects.bulk_create(
+            [model(**dict(zip(names, row))) for row in rows],
+            batch_size=1000
+        )
+    
+    def _reset_sequences(self):
+        """
+        Move the primary key sequences past the explicitly assigned ids
+        """
+        statements = connection.ops.sequence_reset_sql(no_style(), list(self._models().values()))
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
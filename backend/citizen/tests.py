@@ -6,6 +6,11 @@ from rest_framework.test import APIClient
 from rest_framework import status
 from citizen.models import Citizen, IDSequenceTracker
 from citizen.id_generator import CitizenIDGenerator
+from citizen.population_generator import PopulationGenerator, luhn_check_digits
+from location.models import State, LocalGovernmentArea, Ward
+from django.core.management import call_command
+from io import StringIO
+import numpy as np
 import json
 
 class CitizenIDGeneratorTestCase(TestCase):
@@ -456,5 +461,98 @@ class SecurityTestCase(TestCase):
         # Django's template system will automatically escape this when rendered
 
 
+class PopulationGeneratorTestCase(TestCase):
+    """
+    Test cases for the synthetic population generator
+    """
+    
+    def setUp(self):
+        """
+        Set up two states with two LGAs of two wards each
+        """
+        for state_code in ['LA', 'KN']:
+            state = State.objects.create(name=state_code, code=state_code)
+            for lga_code in ['IK', 'ET']:
+                lga = LocalGovernmentArea.objects.create(state=state, name=lga_code, code=lga_code)
+                for index in range(2):
+                    Ward.objects.create(lga=lga, name=f'{lga_code} {index}')
+        
+        self.id_generator = CitizenIDGenerator()
+    
+    def test_check_digits_match_generator(self):
+        """
+        Test that vectorised check digits match CitizenIDGenerator
+        """
+        numbers = np.array([25000001, 24123456, 99999999, 1])
+        expected = [
+            self.id_generator._calculate_check_digit(f'NG-LA-IK-{number:08d}')
+            for number in numbers
+        ]
+        self.assertEqual(luhn_check_digits(numbers, 8).tolist(), expected)
+    
+    def test_generate_population(self):
+        """
+        Test that citizens get valid unique IDs and related records
+        """
+        summary = PopulationGenerator(seed=1, chunk_size=40).generate(100)
+        
+        self.assertEqual(summary['citizen_count'], 100)
+        self.assertEqual(Citizen.objects.count(), 100)
+        
+        unique_ids = list(Citizen.objects.values_list('unique_id', flat=True))
+        self.assertEqual(len(set(unique_ids)), 100)
+        self.assertTrue(all(self.id_generator.validate_id(unique_id) for unique_id in unique_ids))
+        
+        # Every citizen lives in a ward of its LGA and state
+        for citizen in Citizen.objects.select_related('residence_ward__lga')[:20]:
+            self.assertEqual(citizen.residence_ward.lga_id, citizen.residence_lga_id)
+            self.assertEqual(citizen.residence_ward.lga.state_id, citizen.residence_state_id)
+            self.assertIsNotNone(citizen.occupation.employment_status)
+            self.assertIsNotNone(citizen.family.household_size)
+        self.assertTrue(Citizen.objects.filter(interests__isnull=False).exists())
+    
+    def test_trackers_continue_sequences(self):
+        """
+        Test that trackers end at the last issued sequence number, and
+        later runs continue from them
+        """
+        PopulationGenerator(seed=1).generate(50)
+        PopulationGenerator(seed=2).generate(20)
+        
+        self.assertGreater(IDSequenceTracker.objects.count(), 0)
+        for tracker in IDSequenceTracker.objects.all():
+            prefix = f'NG-{tracker.state_code}-{tracker.lga_code}-{tracker.year_code}-'
+            sequences = [
+                int(unique_id.split('-')[4])
+                for unique_id in Citizen.objects.filter(
+                    unique_id__startswith=prefix
+                ).values_list('unique_id', flat=True)
+            ]
+            self.assertEqual(sorted(sequences), list(range(1, tracker.last_sequence_number + 1)))
+    
+    def test_generation_is_reproducible(self):
+        """
+        Test that the same seed gives the same population
+        """
+        PopulationGenerator(seed=7).generate(30)
+        first = list(Citizen.objects.order_by('pk').values_list('gender', 'date_of_birth', 'residence_ward_id'))
+        Citizen.objects.all().delete()
+        
+        PopulationGenerator(seed=7).generate(30)
+        second = list(Citizen.objects.order_by('pk').values_list('gender', 'date_of_birth', 'residence_ward_id'))
+        
+        self.assertEqual(first, second)
+    
+    def test_command(self):
+        """
+        Test the generate_population command
+        """
+        out = StringIO()
+        call_command('generate_population', '25', seed=3, stdout=out)
+        
+        self.assertIn('Generated 25 citizens', out.getvalue())
+        self.assertEqual(Citizen.objects.count(), 25)
+
+
 if __name__ == '__main__':
     unittest.main()
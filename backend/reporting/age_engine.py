@@ -0,0 +1,151 @@
+from .lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Age groups in display order with the youngest completed age they cover
+AGE_GROUPS = [
+    ('0-5', 0),
+    ('6-12', 6),
+    ('13-18', 13),
+    ('19-25', 19),
+    ('26-35', 26),
+    ('36-50', 36),
+    ('51-65', 51),
+    ('65+', 66),
+]
+
+AGE_GROUP_LABELS = [label for label, _ in AGE_GROUPS]
+
+# Ages above this are treated as data entry errors and left ungrouped
+MAX_AGE = 120
+
+def to_datetime64(dates):
+    """
+    Convert dates (date objects, strings, None) to a datetime64[D] array
+    
+    Args:
+        dates: Sequence or Series of dates; missing values become NaT
+    
+    Returns:
+        numpy.ndarray: Array of dtype datetime64[D]
+    """
+    if isinstance(dates, pd.Series):
+        dates = dates.to_numpy()
+    return np.asarray(dates, dtype='datetime64[D]')
+
+def completed_years(dates, today):
+    """
+    Calculate exact completed years of age as of today
+    
+    A birthday on 29 February is reached on 1 March in non-leap years.
+    
+    Args:
+        dates: Dates of birth
+        today (date): Reference date
+    
+    Returns:
+        numpy.ndarray: Ages as float64, NaN where the date is missing
+    """
+    dob = to_datetime64(dates)
+    missing = np.isnat(dob)
+    
+    # Split into calendar year, month and day without leaving NumPy
+    month_start = dob.astype('datetime64[M]')
+    years = dob.astype('datetime64[Y]').astype(np.int64) + 1970
+    months = month_start.astype(np.int64) % 12 + 1
+    days = (dob - month_start).astype(np.int64) + 1
+    
+    # One year less if this year's birthday is still to come
+    birthday_pending = months * 100 + days > today.month * 100 + today.day
+    ages = (today.year - years - birthday_pending).astype(np.float64)
+    ages[missing] = np.nan
+    
+    return ages
+
+def _birth_date_cutoff(today, years):
+    """
+    Latest date of birth that is at least the given number of years old
+    """
+    year = today.year - years
+    try:
+        return np.datetime64(today.replace(year=year), 'D')
+    except ValueError:
+        # Today is 29 February and the target year is not a leap year
+        return np.datetime64(today.replace(year=year, day=28), 'D')
+
+def age_group_boundaries(today):
+    """
+    Birth-date boundaries of the age groups, oldest first
+    
+    A date of birth on or before ``boundaries[i]`` is at least as old as
+    the i-th boundary age: MAX_AGE + 1, then each group's lower age from
+    the oldest group down to 0.
+    
+    Args:
+        today (date): Reference date
+    
+    Returns:
+        numpy.ndarray: Ascending datetime64[D] boundaries
+    """
+    ages = [MAX_AGE + 1] + [min_age for _, min_age in reversed(AGE_GROUPS)]
+    return np.array([_birth_date_cutoff(today, age) for age in ages], dtype='datetime64[D]')
+
+def age_group_codes(dates, today, boundaries=None):
+    """
+    Map dates of birth to age group codes
+    
+    Args:
+        dates: Dates of birth
+        today (date): Reference date
+        boundaries (numpy.ndarray): Precomputed age_group_boundaries(today)
+    
+    Returns:
+        numpy.ndarray: Index into AGE_GROUP_LABELS, -1 for missing, future
+        or implausible dates of birth
+    """
+    dob = to_datetime64(dates)
+    if boundaries is None:
+        boundaries = age_group_boundaries(today)
+    
+    # Number of boundaries strictly before each date of birth: 0 is older
+    # than MAX_AGE, len(AGE_GROUPS) + 1 is born after today
+    position = np.searchsorted(boundaries, dob, side='left')
+    
+    codes = len(AGE_GROUPS) - position
+    invalid = (position == 0) | (position > len(AGE_GROUPS)) | np.isnat(dob)
+    codes[invalid] = -1
+    
+    return codes
+
+def assign_age_groups(dates, today, boundaries=None):
+    """
+    Map dates of birth to an ordered Categorical of age group labels
+    
+    Args:
+        dates: Dates of birth
+        today (date): Reference date
+        boundaries (numpy.ndarray): Precomputed age_group_boundaries(today)
+    
+    Returns:
+        pandas.Categorical: Age groups, NaN where no group applies
+    """
+    return pd.Categorical.from_codes(
+        age_group_codes(dates, today, boundaries),
+        categories=AGE_GROUP_LABELS,
+        ordered=True
+    )
+
+def order_age_groups(rows, key='age_group'):
+    """
+    Sort report rows by age group from youngest to oldest
+    
+    Args:
+        rows: Iterable of dicts holding an age group label under ``key``
+        key (str): Name of the age group field
+    
+    Returns:
+        list: Rows in age order; unknown labels go last
+    """
+    position = {label: index for index, label in enumerate(AGE_GROUP_LABELS)}
+    return sorted(rows, key=lambda row: position.get(row[key], len(AGE_GROUP_LABELS)))
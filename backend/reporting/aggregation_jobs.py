@@ -0,0 +1,363 @@
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django import db
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import AggregationJob, JOB_QUEUED, JOB_RUNNING, JOB_COMPLETED, JOB_FAILED
+from .parallel_aggregator import ParallelAggregator
+
+# Key of the PostgreSQL advisory lock serialising job submissions
+SUBMISSION_LOCK_KEY = 0x52505447
+
+# In-process executor used when Celery is not configured
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class ScopeConflict(Exception):
+    """
+    Raised when a submission overlaps an active job it cannot be merged into
+    """
+    
+    def __init__(self, job):
+        super().__init__(f'Aggregation job {job.job_id} is already running for an overlapping scope')
+        self.job = job
+
+
+def active_jobs():
+    """
+    Get the queued and running jobs
+    
+    Running jobs whose heartbeat has not moved within
+    ``AGGREGATION_JOB_STALE_MINUTES`` are treated as dead, so a killed
+    worker does not block its scope forever.
+    """
+    stale_after = timedelta(minutes=getattr(settings, 'AGGREGATION_JOB_STALE_MINUTES', 10))
+    return AggregationJob.objects.filter(
+        Q(status=JOB_QUEUED) | Q(status=JOB_RUNNING, updated_at__gte=timezone.now() - stale_after)
+    )
+
+
+def _covers(job, state_id, lga_id):
+    """
+    Check whether a job's scope contains another scope
+    """
+    if job.state_id is None:
+        return True
+    if job.state_id != state_id:
+        return False
+    return job.lga_id is None or job.lga_id == lga_id
+
+
+def _overlapping(state_id, lga_id):
+    """
+    Get the active jobs whose scope shares any ward with a scope
+    """
+    if state_id is None:
+        return active_jobs()
+    
+    overlap = Q(state__isnull=True) | Q(state_id=state_id, lga__isnull=True)
+    overlap |= Q(state_id=state_id, lga_id=lga_id) if lga_id else Q(state_id=state_id)
+    return active_jobs().filter(overlap)
+
+
+def _lock_submissions():
+    """
+    Serialise job submissions until the current transaction ends
+    
+    SQLite has no advisory locks; its submissions are serialised by
+    _create_unless_overlapping instead.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [SUBMISSION_LOCK_KEY])
+
+
+def _create_unless_overlapping(overlapping, user, state_id, lga_id):
+    """
+    Create a job for a scope unless an active job overlaps it
+    
+    On SQLite the check and the insert are a single INSERT ... SELECT
+    ... WHERE NOT EXISTS, which takes the database's write lock before
+    looking for overlapping jobs, so two submissions cannot both insert.
+    
+    Args:
+        overlapping (QuerySet): Active jobs overlapping the scope
+        user: Submitting user
+        state_id (int): State to aggregate, or None for the whole registry
+        lga_id (int): LGA of the state to aggregate
+    
+    Returns:
+        AggregationJob: The new job, or None when an active job overlaps
+    """
+    submitted_by = user if user and user.is_authenticated else None
+    
+    if connection.vendor != 'sqlite':
+        if overlapping.exists():
+            return None
+        return AggregationJob.objects.create(state_id=state_id, lga_id=lga_id, submitted_by=submitted_by)
+    
+    opts = AggregationJob._meta
+    values = {
+        'state': state_id,
+        'lga': lga_id,
+        'status': JOB_QUEUED,
+        'submitted_by': submitted_by.pk if submitted_by else None,
+        'submission_count': 1,
+        'progress': '{}',
+        'created_at': connection.ops.adapt_datetimefield_value(timezone.now()),
+        'updated_at': connection.ops.adapt_datetimefield_value(timezone.now()),
+    }
+    columns = ', '.join(connection.ops.quote_name(opts.get_field(name).column) for name in values)
+    subquery, params = overlapping.values('pk').query.sql_with_params()
+    
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {connection.ops.quote_name(opts.db_table)} ({columns}) '
+            f'SELECT {", ".join(["%s"] * len(values))} WHERE NOT EXISTS ({subquery})',
+            [*values.values(), *params]
+        )
+        if not cursor.rowcount:
+            return None
+        job_id = cursor.lastrowid
+    
+    return AggregationJob.objects.get(pk=job_id)
+
+
+def submit_job(user=None, state_id=None, lga_id=None):
+    """
+    Queue an aggregation of a scope, or join an active job covering it
+    
+    Args:
+        user: Submitting user
+        state_id (int): State to aggregate, or None for the whole registry
+        lga_id (int): LGA of the state to aggregate
+    
+    Returns:
+        tuple: (job, created) where created is False when the submission
+        was merged into an active job
+    
+    Raises:
+        ScopeConflict: An active job overlaps the scope without covering it
+    """
+    state_id = int(state_id) if state_id else None
+    lga_id = int(lga_id) if lga_id and state_id else None
+    
+    with transaction.atomic():
+        _lock_submissions()
+        
+        # One queryset, so the check and the lookup share a stale cutoff
+        overlapping = _overlapping(state_id, lga_id)
+        job = _create_unless_overlapping(overlapping, user, state_id, lga_id)
+        if job is None:
+            # Submissions are serialised from here, so the overlapping job
+            # is still there
+            job = overlapping.order_by('created_at').first()
+            if not _covers(job, state_id, lga_id):
+                raise ScopeConflict(job)
+            
+            AggregationJob.objects.filter(pk=job.pk).update(
+                submission_count=F('submission_count') + 1
+            )
+            job.refresh_from_db()
+            return job, False
+        
+        # Workers must not pick the job up before it is visible to them
+        transaction.on_commit(lambda: enqueue_job(job))
+    
+    return job, True
+
+
+def enqueue_job(job):
+    """
+    Hand a job to Celery, or to the in-process executor without a broker
+    """
+    if getattr(settings, 'CELERY_BROKER_URL', None):
+        try:
+            from .tasks import run_aggregation_job
+            run_aggregation_job.delay(job.job_id)
+        except Exception as e:
+            # Celery missing or the broker unreachable; run it here instead
+            job.progress = {**job.progress, 'enqueue_error': str(e)}
+        else:
+            AggregationJob.objects.filter(pk=job.pk).update(runner='celery')
+            return
+    
+    AggregationJob.objects.filter(pk=job.pk).update(runner='thread', progress=job.progress)
+    _get_executor().submit(_run_in_thread, job.job_id)
+
+
+def _get_executor():
+    """
+    Get the process's job executor, one job at a time
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='aggregation-job')
+        return _executor
+
+
+def _run_in_thread(job_id):
+    """
+    Run a job on an executor thread and release its connections
+    """
+    try:
+        run_job(job_id)
+    finally:
+        db.connections.close_all()
+
+
+class JobProgress:
+    """
+    Records a job's stage and partition progress as the aggregation runs
+    """
+    
+    def __init__(self, job):
+        self.job = job
+        self.progress = {'stages': [], 'partitions': []}
+    
+    def on_stage(self, name, partitions):
+        """
+        Close the running stage and open the next one
+        """
+        now = timezone.now()
+        if self.progress['stages']:
+            self._finish_stage(now)
+        
+        self.progress['stages'].append({'name': name, 'started_at': now.isoformat(), 'finished_at': None})
+        if name == 'partitions':
+            self.progress['partitions'] = [
+                {
+                    'state_id': partition.state_id,
+                    'lga_id': partition.lga_id,
+                    'citizen_count': partition.citizen_count,
+                    'status': JOB_QUEUED,
+                }
+                for partition in partitions
+            ]
+        self._save(stage=name)
+    
+    def on_partition_done(self, result):
+        """
+        Record a finished partition
+        """
+        for partition in self.progress['partitions']:
+            if (partition['state_id'], partition['lga_id']) == (result['state_id'], result['lga_id']):
+                partition.update(
+                    status=JOB_COMPLETED if result['success'] else JOB_FAILED,
+                    duration=round(result['duration'], 3),
+                    attempts=result['attempts'],
+                    error=result['error']
+                )
+        self._save()
+    
+    def finish(self, status, error=None):
+        """
+        Close the running stage and record the job's outcome
+        """
+        now = timezone.now()
+        if self.progress['stages']:
+            self._finish_stage(now)
+        self._save(status=status, error=error, finished_at=now)
+    
+    def _finish_stage(self, now):
+        """
+        Mark the running stage finished
+        """
+        stage = self.progress['stages'][-1]
+        if stage['finished_at'] is None:
+            stage['finished_at'] = now.isoformat()
+    
+    def _save(self, **fields):
+        """
+        Write the progress, moving updated_at, the job's heartbeat
+        """
+        AggregationJob.objects.filter(pk=self.job.pk).update(
+            progress=self.progress, updated_at=timezone.now(), **fields
+        )
+
+
+class JobHeartbeat:
+    """
+    Moves a running job's heartbeat on a timer
+    
+    Progress only lands when a stage or partition finishes, so a single
+    slow partition would otherwise let a live job look dead.
+    """
+    
+    def __init__(self, job, interval=None):
+        self.job = job
+        self.interval = interval or getattr(settings, 'AGGREGATION_JOB_HEARTBEAT_SECONDS', 60)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f'aggregation-job-{job.pk}-heartbeat', daemon=True)
+    
+    def __enter__(self):
+        self.thread.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+    
+    def beat(self):
+        """
+        Move updated_at while the job is still running
+        """
+        AggregationJob.objects.filter(pk=self.job.pk, status=JOB_RUNNING).update(updated_at=timezone.now())
+    
+    def _run(self):
+        """
+        Beat until stopped, then release the thread's connections
+        """
+        try:
+            while not self.stopped.wait(self.interval):
+                self.beat()
+        finally:
+            db.connections.close_all()
+
+
+def run_job(job_id):
+    """
+    Run a queued aggregation job
+    
+    Returns:
+        AggregationJob: The job after the run, or None when it was already
+        picked up elsewhere
+    """
+    # Claim the job so a redelivered task does not run it twice
+    claimed = AggregationJob.objects.filter(pk=job_id, status=JOB_QUEUED).update(
+        status=JOB_RUNNING, started_at=timezone.now()
+    )
+    if not claimed:
+        return None
+    
+    job = AggregationJob.objects.get(pk=job_id)
+    progress = JobProgress(job)
+    
+    try:
+        aggregator = ParallelAggregator(
+            workers=getattr(settings, 'AGGREGATION_JOB_WORKERS', 1),
+            memory_target_mb=getattr(settings, 'AGGREGATION_MEMORY_TARGET_MB', None)
+        )
+        with JobHeartbeat(job):
+            summary = aggregator.run(
+                state_id=job.state_id,
+                lga_id=job.lga_id,
+                on_partition_done=progress.on_partition_done,
+                on_stage=progress.on_stage
+            )
+    except Exception:
+        progress.finish(JOB_FAILED, error=traceback.format_exc())
+    else:
+        if summary['failed']:
+            progress.finish(JOB_FAILED, error=f"{len(summary['failed'])} partition(s) failed after retries")
+        else:
+            progress.finish(JOB_COMPLETED)
+    
+    job.refresh_from_db()
+    return job
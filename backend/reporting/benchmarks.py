@@ -0,0 +1,423 @@
+import json
+import os
+import platform
+import statistics
+import string
+import subprocess
+import sys
+import time
+from fnmatch import fnmatch
+import django
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from citizen.id_generator import CitizenIDGenerator
+from citizen.models import Citizen
+from citizen.population_generator import PopulationGenerator
+from location.models import State, LocalGovernmentArea, Ward
+from .charts import CHART_CONTENT_TYPES, render_chart
+from .crosstabs import CROSS_TABS
+from .data_aggregator import DataAggregator
+from .lazy_imports import HEAVY_MODULES
+from .report_cache import ReportCache
+from .report_generator import ReportGenerator
+
+# Location hierarchy seeded when the database has no wards
+SEED_STATES = 6
+SEED_LGAS_PER_STATE = 5
+SEED_WARDS_PER_LGA = 10
+
+# Calls per timed run of the cheap per-call benchmarks
+ID_BATCH = 1000
+QR_BATCH = 20
+PDF_BATCH = 3
+DETAIL_BATCH = 20
+
+
+# Run in a fresh interpreter: start Django and load every view through the
+# URL conf as a web worker does, then list the heavy modules it imported
+STARTUP_SCRIPT = '''
+import json, sys, django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps([name for name in %r if name in sys.modules]))
+''' % (HEAVY_MODULES,)
+
+
+class BenchmarkSkipped(Exception):
+    """
+    Raised by a benchmark that cannot run in this environment
+    """
+
+
+class BenchmarkSuite:
+    """
+    Times the registry's hot paths against a synthetic population
+    
+    Each scale seeds its own population inside a transaction that is
+    rolled back afterwards, runs every selected benchmark ``repeat`` times
+    after ``warmup`` untimed runs, and reports the timings per call.
+    """
+    
+    def __init__(self, repeat=5, warmup=1, seed=0, only=None):
+        self.repeat = repeat
+        self.warmup = warmup
+        self.seed = seed
+        self.only = only or []
+    
+    def cases(self):
+        """
+        Get (name, calls per run, function) for every benchmark
+        """
+        cases = [
+            ('startup.web_worker', 1, self.web_worker_startup),
+            ('citizen.generate_id', ID_BATCH, self.generate_ids),
+            ('citizen.validate_id', ID_BATCH, self.validate_ids),
+            ('citizen.qr_code', QR_BATCH, self.qr_codes),
+            ('citizen.id_card_pdf', PDF_BATCH, self.id_card_pdfs),
+            ('citizen.api_list', 1, self.citizen_list),
+            ('citizen.api_detail', DETAIL_BATCH, self.citizen_details),
+        ]
+        for name in ['demographics', 'occupations', 'healthcare', 'family_structures', 'interests']:
+            cases.append((f'aggregate.{name}', 1, self._aggregate(name)))
+        for name in ['demographic', 'occupation', 'healthcare', 'family', 'interests']:
+            cases.append((f'report.{name}', 1, self._report(f'generate_{name}_report')))
+        for tab_name in CROSS_TABS:
+            cases.append((f'report.crosstab.{tab_name}', 1, self._crosstab(tab_name)))
+        cases.append(('report.executive_dashboard', 1, self._report('generate_executive_dashboard')))
+        cases.append(('report.cached_executive_dashboard', 1, self.cached_dashboard))
+        for chart_format in CHART_CONTENT_TYPES:
+            cases.append((f'chart.{chart_format}', 1, self._charts(chart_format)))
+        for report_type in ['demographic', 'occupation', 'healthcare', 'family', 'interests']:
+            cases.append((f'export_csv.{report_type}', 1, self._export(report_type)))
+        
+        if self.only:
+            cases = [case for case in cases if any(fnmatch(case[0], pattern) for pattern in self.only)]
+        return cases
+    
+    def run(self, scales, on_result=None):
+        """
+        Run the suite at each data scale
+        
+        Args:
+            scales (list): Numbers of citizens to benchmark with
+            on_result: Called with (scale, name, result) after each benchmark
+        
+        Returns:
+            dict: Machine-readable results, keyed by scale then benchmark
+        """
+        results = {
+            'created_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'numpy': np.__version__,
+                'database': connection.vendor,
+                'machine': platform.machine(),
+            },
+            'repeat': self.repeat,
+            'scales': {},
+        }
+        
+        for scale in scales:
+            scale_results = {}
+            
+            # Seeded data is never kept
+            with transaction.atomic():
+                self._seed(scale)
+                
+                for name, calls, function in self.cases():
+                    result = self._measure(function, calls)
+                    scale_results[name] = result
+                    if on_result:
+                        on_result(scale, name, result)
+                
+                transaction.set_rollback(True)
+            
+            results['scales'][str(scale)] = scale_results
+        
+        return results
+    
+    def _measure(self, function, calls):
+        """
+        Time a benchmark function
+        """
+        durations = []
+        output = None
+        try:
+            # A failing benchmark only rolls back its own savepoint
+            with transaction.atomic():
+                for _ in range(self.warmup):
+                    function()
+                
+                for _ in range(self.repeat):
+                    start = time.perf_counter()
+                    output = function()
+                    durations.append(time.perf_counter() - start)
+        except BenchmarkSkipped as e:
+            return {'status': 'skipped', 'reason': str(e)}
+        except ImportError as e:
+            return {'status': 'skipped', 'reason': f'missing dependency: {e.name}'}
+        except Exception as e:
+            return {'status': 'error', 'reason': f'{type(e).__name__}: {e}'}
+        
+        per_call = [duration / calls for duration in durations]
+        result = {
+            'status': 'ok',
+            'calls': calls,
+            'runs': len(durations),
+            'median': statistics.median(per_call),
+            'mean': statistics.mean(per_call),
+            'min': min(per_call),
+            'max': max(per_call),
+            'p95': float(np.percentile(per_call, 95)),
+        }
+        
+        # Benchmarks may measure more than time, e.g. payload size
+        if isinstance(output, dict):
+            result.update(output)
+        return result
+    
+    def _seed(self, scale):
+        """
+        Load the scale's population and the fixtures the benchmarks use
+        """
+        if not Ward.objects.exists():
+            self._seed_locations()
+        
+        PopulationGenerator(seed=self.seed).generate(scale)
+        
+        self.today = timezone.now().date()
+        self.charts = None
+        
+        # Reports cached at the previous scale were built from rolled back rows
+        ReportCache().invalidate(self.today)
+        self.state_code, self.lga_code = LocalGovernmentArea.objects.values_list(
+            'state__code', 'code'
+        ).first()
+        self.citizen_ids = list(Citizen.objects.order_by('pk').values_list('pk', flat=True)[:DETAIL_BATCH])
+        self.unique_ids = list(Citizen.objects.values_list('unique_id', flat=True)[:ID_BATCH])
+        self.unique_ids = (self.unique_ids * (ID_BATCH // max(len(self.unique_ids), 1) + 1))[:ID_BATCH]
+        
+        self.user = User.objects.create_superuser(
+            username=f'benchmark-{scale}', email='benchmark@example.com', password=None
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+    
+    def _seed_locations(self):
+        """
+        Create a small location hierarchy with unique two-letter codes
+        """
+        codes = iter(a + b for a in string.ascii_uppercase for b in string.ascii_uppercase)
+        for _ in range(SEED_STATES):
+            state_code = next(codes)
+            state = State.objects.create(name=f'State {state_code}', code=state_code)
+            for _ in range(SEED_LGAS_PER_STATE):
+                lga_code = next(codes)
+                lga = LocalGovernmentArea.objects.create(state=state, name=f'LGA {lga_code}', code=lga_code)
+                Ward.objects.bulk_create([
+                    Ward(lga=lga, name=f'Ward {lga_code}{index}') for index in range(SEED_WARDS_PER_LGA)
+                ])
+    
+    def web_worker_startup(self):
+        """
+        Start a web worker's interpreter and measure its imports with
+        ``python -X importtime``
+        """
+        env = {
+            **os.environ,
+            'PYTHONPATH': os.pathsep.join(path for path in sys.path if path),
+            'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE,
+        }
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+            capture_output=True, text=True, env=env, timeout=300
+        )
+        if completed.returncode:
+            raise RuntimeError(f'worker failed to start: {completed.stderr.strip().splitlines()[-1]}')
+        
+        return {
+            'import_seconds': import_time(completed.stderr),
+            'heavy_modules': json.loads(completed.stdout.strip().splitlines()[-1]),
+        }
+    
+    def generate_ids(self):
+        """
+        Issue a batch of citizen IDs
+        """
+        generator = CitizenIDGenerator()
+        for _ in range(ID_BATCH):
+            generator.generate_id(self.state_code, self.lga_code)
+    
+    def validate_ids(self):
+        """
+        Validate a batch of citizen IDs
+        """
+        generator = CitizenIDGenerator()
+        for unique_id in self.unique_ids:
+            generator.validate_id(unique_id)
+    
+    def qr_codes(self):
+        """
+        Render a batch of QR codes
+        """
+        from citizen.qr_generator import generate_qr_code
+        for unique_id in self.unique_ids[:QR_BATCH]:
+            generate_qr_code(unique_id)
+    
+    def id_card_pdfs(self):
+        """
+        Render a batch of ID card PDFs
+        """
+        from citizen.id_card_service import IDCardPrintService
+        service = IDCardPrintService()
+        for citizen in Citizen.objects.filter(pk__in=self.citizen_ids[:PDF_BATCH]):
+            service.generate_id_card_pdf(citizen)
+    
+    def citizen_list(self):
+        """
+        Fetch the first page of the citizen list endpoint
+        """
+        self._get(reverse('citizen-list'))
+    
+    def citizen_details(self):
+        """
+        Fetch a batch of citizens from the detail endpoint
+        """
+        for citizen_id in self.citizen_ids:
+            self._get(reverse('citizen-detail', args=[citizen_id]))
+    
+    def _aggregate(self, name):
+        """
+        Benchmark one aggregate_* method over the whole registry
+        """
+        def run():
+            getattr(DataAggregator(stat_date=self.today), f'aggregate_{name}')()
+        return run
+    
+    def _report(self, method):
+        """
+        Benchmark one national report
+        """
+        def run():
+            result = getattr(ReportGenerator(), method)(report_date=self.today)
+            if not result['success']:
+                raise BenchmarkSkipped(result['message'])
+        return run
+    
+    def _crosstab(self, tab_name):
+        """
+        Benchmark one national cross-tab report
+        """
+        def run():
+            result = ReportGenerator().generate_crosstab_report(tab_name, report_date=self.today)
+            if not result['success']:
+                raise BenchmarkSkipped(result['message'])
+        return run
+    
+    def cached_dashboard(self):
+        """
+        Fetch the national executive dashboard from the report cache
+        """
+        params = {'report_date': self.today.isoformat(), 'charts': 'none'}
+        response = self.client.get(reverse('reports-executive-dashboard'), params)
+        
+        # Only the first call generates the dashboard, normally in warmup
+        if response.status_code == 200 and response.get('X-Report-Cache') == 'miss':
+            response = self.client.get(reverse('reports-executive-dashboard'), params)
+        if response.get('X-Report-Cache') != 'hit':
+            raise BenchmarkSkipped('Aggregation metadata does not allow caching the dashboard')
+        len(response.content)
+    
+    def _charts(self, chart_format):
+        """
+        Benchmark drawing the national demographic report's charts in one
+        format, bypassing the chart cache, and measure their payload
+        """
+        def run():
+            # Chart data comes from the first run at this scale
+            if self.charts is None:
+                result = ReportGenerator().generate_demographic_report(report_date=self.today)
+                if not result['success']:
+                    raise BenchmarkSkipped(result['message'])
+                self.charts = [section['chart'] for section in result['report']['sections']]
+            
+            images = [render_chart(chart, chart_format) for chart in self.charts]
+            return {
+                'charts': len(images),
+                'bytes': sum(len(image) for image in images),
+            }
+        return run
+    
+    def _export(self, report_type):
+        """
+        Benchmark one CSV export
+        """
+        def run():
+            self._get(reverse('reports-export-csv'), {
+                'type': report_type,
+                'report_date': self.today.isoformat(),
+            })
+        return run
+    
+    def _get(self, url, params=None):
+        """
+        Request an endpoint and read the whole response
+        """
+        response = self.client.get(url, params)
+        if response.status_code != 200:
+            raise RuntimeError(f'{url} returned {response.status_code}')
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        else:
+            len(response.content)
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """
+    Find the benchmarks slower than their baseline
+    
+    Args:
+        results (dict): Results of BenchmarkSuite.run()
+        baseline (dict): Earlier results to compare with
+        threshold (float): Allowed slowdown, e.g. 0.2 for 20%
+    
+    Returns:
+        list: (scale, name, baseline median, median, ratio) for every
+        benchmark whose median grew by more than the threshold
+    """
+    regressions = []
+    for scale, scale_results in results['scales'].items():
+        baseline_results = baseline.get('scales', {}).get(scale, {})
+        for name, result in scale_results.items():
+            previous = baseline_results.get(name)
+            if result['status'] != 'ok' or not previous or previous.get('status') != 'ok':
+                continue
+            ratio = result['median'] / previous['median'] if previous['median'] else 1.0
+            if ratio > 1 + threshold:
+                regressions.append((scale, name, previous['median'], result['median'], ratio))
+    return regressions
+
+
+def import_time(importtime_output):
+    """
+    Sum the self times in ``python -X importtime`` output
+    
+    Returns:
+        float: Seconds spent importing modules
+    """
+    total_us = 0
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us = line.split(':', 1)[1].split('|')[0].strip()
+        if self_us.isdigit():
+            total_us += int(self_us)
+    return total_us / 1e6
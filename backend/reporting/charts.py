@@ -0,0 +1,213 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from django.conf import settings
+from .lazy_imports import lazy_import, preload
+
+# matplotlib and seaborn are only imported once a chart is drawn, which is
+# normally in a chart pool process rather than the web worker
+matplotlib = lazy_import('matplotlib')
+sns = lazy_import('seaborn')
+
+# Bump whenever render_chart() draws differently, so cached images of the
+# old style are no longer used
+CHART_STYLE_VERSION = 1
+
+# Process pool charts are drawn in, started on first use
+_executor = None
+_executor_lock = threading.Lock()
+
+# Image formats charts can be rendered in and their content types. SVG is
+# the default: bar and pie charts are a few dozen shapes, which draw faster
+# and usually smaller as vectors than as pixels
+CHART_CONTENT_TYPES = {
+    'svg': 'image/svg+xml',
+    'png': 'image/png',
+    'webp': 'image/webp',
+}
+DEFAULT_CHART_FORMAT = 'svg'
+
+# Extra savefig() options per format: no timestamp in SVGs, and lossy
+# WebP at a quality that keeps labels sharp
+SAVE_OPTIONS = {
+    'svg': {'metadata': {'Date': None}},
+    'webp': {'pil_kwargs': {'quality': 90}},
+}
+
+# matplotlib settings applied before the first chart is drawn: SVG text
+# stays text instead of one path per glyph, and SVG element ids get a
+# fixed salt so they do not change between renders
+RC_PARAMS = {
+    'svg.fonttype': 'none',
+    'svg.hashsalt': 'reporting-charts',
+}
+
+def pie_chart(field, stats, title):
+    """
+    Describe a pie chart of a report section's totals
+    
+    Args:
+        field (str): Field the totals are grouped by; also the chart's id
+        stats (list): Rows with the field and a 'total'
+        title (str): Chart title
+    
+    Returns:
+        dict: Chart spec that render_chart() can draw
+    """
+    return {
+        'id': field,
+        'type': 'pie',
+        'title': title,
+        'labels': [stat[field] for stat in stats],
+        'values': [stat['total'] for stat in stats],
+    }
+
+def bar_chart(field, stats, title, xlabel, rotate_labels=True):
+    """
+    Describe a bar chart of a report section's totals
+    
+    Args:
+        field (str): Field the totals are grouped by; also the chart's id
+        stats (list): Rows with the field and a 'total'
+        title (str): Chart title
+        xlabel (str): Label of the category axis
+        rotate_labels (bool): Slant the category labels
+    
+    Returns:
+        dict: Chart spec that render_chart() can draw
+    """
+    return {
+        'id': field,
+        'type': 'bar',
+        'title': title,
+        'labels': [stat[field] for stat in stats],
+        'values': [stat['total'] for stat in stats],
+        'xlabel': xlabel,
+        'rotate_labels': rotate_labels,
+    }
+
+def render_chart(chart, image_format=DEFAULT_CHART_FORMAT):
+    """
+    Draw a chart spec
+    
+    Each chart gets its own Figure on an Agg canvas instead of pyplot's
+    global state, so charts can be drawn concurrently and a failed chart
+    leaves no open figure behind.
+    
+    Args:
+        chart (dict): Spec from pie_chart() or bar_chart()
+        image_format (str): One of CHART_CONTENT_TYPES
+    
+    Returns:
+        bytes: The encoded image
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    matplotlib.rcParams.update(RC_PARAMS)
+    
+    if chart['type'] == 'pie':
+        figure = Figure(figsize=(8, 6))
+        axes = figure.subplots()
+        axes.pie(
+            chart['values'],
+            labels=chart['labels'],
+            autopct='%1.1f%%',
+            startangle=90
+        )
+        axes.axis('equal')
+    else:
+        figure = Figure(figsize=(10, 6))
+        axes = figure.subplots()
+        sns.barplot(x=chart['labels'], y=chart['values'], ax=axes)
+        axes.set_xlabel(chart['xlabel'])
+        axes.set_ylabel('Count')
+        if chart['rotate_labels']:
+            axes.tick_params(axis='x', labelrotation=45)
+    axes.set_title(chart['title'])
+    
+    # Save chart to buffer
+    buffer = BytesIO()
+    FigureCanvasAgg(figure).print_figure(buffer, format=image_format, **SAVE_OPTIONS.get(image_format, {}))
+    return buffer.getvalue()
+
+def submit_render(chart, image_format=DEFAULT_CHART_FORMAT):
+    """
+    Start drawing a chart in the chart worker pool
+    
+    Returns:
+        Future: Resolves to the encoded image; already resolved when
+        REPORT_CHART_WORKERS is 0 and charts are drawn in the caller
+    """
+    executor = _get_executor()
+    if executor is None:
+        future = Future()
+        try:
+            future.set_result(render_chart(chart, image_format))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    
+    try:
+        return executor.submit(render_chart, chart, image_format)
+    except BrokenProcessPool:
+        # A worker died; replace the pool and try once more
+        _reset_executor(executor)
+        return _get_executor().submit(render_chart, chart, image_format)
+
+def _get_executor():
+    """
+    Get the process's chart worker pool, or None to draw in the caller
+    
+    Workers are spawned rather than forked, so they never inherit the web
+    process's threads or database connections.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, 'REPORT_CHART_WORKERS', min(4, os.cpu_count() or 1))
+            if workers < 1:
+                return None
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=preload,
+                initargs=(['numpy', 'matplotlib', 'seaborn'],)
+            )
+        return _executor
+
+def _reset_executor(broken):
+    """
+    Drop a broken worker pool so the next call starts a new one
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False)
+
+def chart_key(chart, image_format=DEFAULT_CHART_FORMAT):
+    """
+    Get the cache key of a chart's image
+    
+    The key hashes everything that is drawn (chart type, title, labels,
+    values and axis settings) with the style version and image format, so
+    identical data gives the same key whichever report or scope it is in.
+    """
+    drawn = {key: value for key, value in chart.items() if key != 'id'}
+    digest = hashlib.sha256(
+        json.dumps([CHART_STYLE_VERSION, image_format, drawn], sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return f'reporting:chart:{digest}'
+
+def strip_charts(report):
+    """
+    Drop the chart specs from a report or dashboard, leaving its data
+    """
+    for entry in report.get('sections', []) + report.get('charts', []):
+        entry.pop('chart', None)
+    return report
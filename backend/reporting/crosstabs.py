@@ -0,0 +1,81 @@
+from .lazy_imports import lazy_import
+from .vocabularies import KNOWN_CATEGORIES
+
+np = lazy_import('numpy')
+
+# Cross-tabs produced by the demographic aggregation pass. Each dimension
+# is a frame column and the field name it is reported under.
+CROSS_TABS = {
+    'age_gender': {
+        'title': 'Population Pyramid (Age Group by Gender)',
+        'dimensions': [('age_group', 'age_group'), ('gender', 'gender')],
+    },
+    'education_gender': {
+        'title': 'Education Level by Gender',
+        'dimensions': [('education__level', 'education_level'), ('gender', 'gender')],
+    },
+    'employment_age': {
+        'title': 'Employment Status by Age Group',
+        'dimensions': [('occupation__employment_status', 'employment_status'), ('age_group', 'age_group')],
+    },
+    'age_gender_religion': {
+        'title': 'Age Group by Gender and Religion',
+        'dimensions': [('age_group', 'age_group'), ('gender', 'gender'), ('religion', 'religion')],
+    },
+}
+
+def crosstab_columns(tab_name):
+    """
+    Get the frame columns a cross-tab is counted over
+    """
+    return [column for column, _ in CROSS_TABS[tab_name]['dimensions']]
+
+def crosstab_fields(tab_name):
+    """
+    Get the field names a cross-tab's values are reported under
+    """
+    return [field for _, field in CROSS_TABS[tab_name]['dimensions']]
+
+def count_combinations(location_codes, location_count, codes, sizes):
+    """
+    Count rows per location and combination of dimension codes
+    
+    The location and dimension codes are combined into one flat cell index
+    so the whole cross-tab is a single np.bincount.
+    
+    Args:
+        location_codes (numpy.ndarray): Location index of each row
+        location_count (int): Number of distinct locations
+        codes (list): One code array per dimension, -1 for missing values
+        sizes (list): Number of possible codes of each dimension
+    
+    Returns:
+        tuple: (cells, counts) where cells is a tuple of arrays (location
+        code, then one code per dimension) for every non-empty cell
+    """
+    # Rows missing any of the dimensions fall outside the cross-tab
+    observed = np.ones(len(location_codes), dtype=bool)
+    for dimension_codes in codes:
+        observed &= dimension_codes >= 0
+    
+    shape = (location_count, *sizes)
+    flat = np.ravel_multi_index(
+        [location_codes[observed]] + [dimension_codes[observed] for dimension_codes in codes],
+        shape
+    )
+    
+    cell_counts = np.bincount(flat, minlength=int(np.prod(shape)))
+    filled = np.flatnonzero(cell_counts)
+    
+    return np.unravel_index(filled, shape), cell_counts[filled]
+
+def order_values(column, values):
+    """
+    Sort dimension values into their display order
+    
+    Known values keep the order of KNOWN_CATEGORIES; others follow
+    alphabetically.
+    """
+    known = KNOWN_CATEGORIES.get(column, [])
+    position = {value: index for index, value in enumerate(known)}
+    return sorted(values, key=lambda value: (position.get(value, len(known)), str(value)))
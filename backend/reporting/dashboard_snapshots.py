@@ -0,0 +1,53 @@
+from django.db import transaction
+from django.db.models import Q
+from .models import DashboardSnapshot, DemographicStats, LEVEL_STATE, LEVEL_NATIONAL
+from .report_generator import ReportGenerator
+
+def write_dashboard_snapshots(stat_date, state_id=None, cube_store=None):
+    """
+    Store the executive dashboard's figures for a date, nationally and per
+    state
+    
+    Figures are computed from the stats cubes the run has just rebuilt,
+    which serve every state from one load per stats family.
+    
+    Args:
+        stat_date (date): Date just aggregated
+        state_id (int): Only replace this state's snapshot and the national
+            one, as after a single state's run; every state with stats is
+            replaced if not given
+        cube_store (CubeStore): Cube store to compute from
+    
+    Returns:
+        int: Number of snapshots written
+    """
+    generator = ReportGenerator(cube_store=cube_store)
+    cube = generator.cubes.get(DemographicStats, stat_date)
+    
+    snapshots = []
+    if cube is not None:
+        state_ids = [int(state_id)] if state_id else cube.state_ids()
+        snapshots.append(DashboardSnapshot(
+            stat_date=stat_date,
+            level=LEVEL_NATIONAL,
+            **generator.dashboard_figures(None, stat_date)
+        ))
+        snapshots.extend(
+            DashboardSnapshot(
+                stat_date=stat_date,
+                level=LEVEL_STATE,
+                state_id=snapshot_state_id,
+                **generator.dashboard_figures(snapshot_state_id, stat_date)
+            )
+            for snapshot_state_id in state_ids
+        )
+    
+    # Replace the scope's snapshots in one go so readers never see it empty
+    with transaction.atomic():
+        replaced = DashboardSnapshot.objects.filter(stat_date=stat_date)
+        if state_id:
+            replaced = replaced.filter(Q(level=LEVEL_NATIONAL) | Q(state_id=state_id))
+        replaced.delete()
+        DashboardSnapshot.objects.bulk_create(snapshots)
+    
+    return len(snapshots)
@@ -1,41 +1,110 @@
-from django.db import connection
+from django.db import connection, transaction
 from django.utils import timezone
 from datetime import datetime, timedelta
-import pandas as pd
-import numpy as np
+from functools import partial
 from .models import (
     DemographicStats, OccupationStats, HealthcareStats, 
-    FamilyStats, InterestStats, ReportMetadata
+    FamilyStats, InterestStats, CrossTabStats, HouseholdStats, ReportMetadata,
+    LEVEL_WARD, LEVEL_LGA, LEVEL_STATE, LEVEL_NATIONAL
 )
+from .age_engine import age_group_boundaries, assign_age_groups, to_datetime64
+from .vocabularies import VocabularyRegistry, HOUSEHOLD_SIZE_GROUPS, CHILDREN_COUNT_GROUPS
+from .crosstabs import CROSS_TABS, crosstab_columns, count_combinations
+from .star_schema import FactStore, FACT_FAMILIES
+from .instrumentation import StageTimings
+from .report_cache import ReportCache
+from .olap_cube import bump_stats_version
+from .dashboard_snapshots import write_dashboard_snapshots
+from .lazy_imports import lazy_import
 from citizen.models import Citizen
+from itertools import islice
+from django.conf import settings
 from django.db import models
 
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+# Stats tables written by the aggregator
+STATS_MODELS = [
+    DemographicStats, OccupationStats, HealthcareStats, FamilyStats, InterestStats, CrossTabStats,
+    HouseholdStats
+]
+
+# Location columns every aggregation is grouped by
+LOCATION_COLUMNS = ['residence_state_id', 'residence_lga_id', 'residence_ward_id']
+
+# Rough in-memory cost of one value fetched from the database, covering the
+# Python row objects and the DataFrame built from them
+BYTES_PER_VALUE = 200
+
+# Rows fetched and converted to arrays at a time while a frame is read
+READ_BATCH_SIZE = 2000
+
+# Model field types read as text and encoded to vocabulary codes
+TEXT_FIELD_TYPES = {'CharField', 'TextField'}
+
 class DataAggregator:
     """
     Service for aggregating citizen data for reporting and analytics
     """
     
-    def __init__(self):
-        self.today = timezone.now().date()
+    def __init__(self, stat_date=None, record_metadata=True, chunk_size=None,
+                 memory_target_mb=None, write_rollups=True):
+        self.today = stat_date or timezone.now().date()
+        
+        # Age group boundaries only depend on the stat date
+        self.age_boundaries = age_group_boundaries(self.today)
+        
+        # Dimension values are grouped as integer codes from these
+        self.vocabularies = VocabularyRegistry()
+        
+        # Stats families are written to the star-schema fact table
+        self.facts = FactStore()
+        
+        # Stage timings of the current aggregation call
+        self.timings = StageTimings()
+        
+        # Parallel workers leave metadata bookkeeping and rollups to the driver
+        self.record_metadata = record_metadata
+        self.write_rollups = write_rollups
+        
+        # Streaming mode reads citizens in keyset-paginated chunks so peak
+        # memory depends on the chunk size rather than the registry size
+        self.chunk_size = chunk_size or getattr(settings, 'AGGREGATION_CHUNK_SIZE', None)
+        self.memory_target_mb = memory_target_mb or getattr(settings, 'AGGREGATION_MEMORY_TARGET_MB', None)
     
     def aggregate_all_data(self):
         """
         Run all aggregation processes
         """
-        self.aggregate_demographics()
-        self.aggregate_occupations()
-        self.aggregate_healthcare()
-        self.aggregate_family_structures()
-        self.aggregate_interests()
+        self.aggregate_scope()
         
         # Update report metadata
         self._update_report_metadata("all_aggregations")
     
-    def aggregate_demographics(self, state_id=None, lga_id=None):
+    def aggregate_scope(self, state_id=None, lga_id=None, ward_ids=None):
+        """
+        Run every aggregation process for a single state or LGA, or for a
+        list of wards
+        """
+        self.aggregate_demographics(state_id=state_id, lga_id=lga_id, ward_ids=ward_ids)
+        self.aggregate_occupations(state_id=state_id, lga_id=lga_id, ward_ids=ward_ids)
+        self.aggregate_healthcare(state_id=state_id, lga_id=lga_id, ward_ids=ward_ids)
+        self.aggregate_family_structures(state_id=state_id, lga_id=lga_id, ward_ids=ward_ids)
+        self.aggregate_interests(state_id=state_id, lga_id=lga_id, ward_ids=ward_ids)
+        
+        # Snapshot the executive dashboard once every family is rolled up
+        # (each family's rollups have moved the cube version on)
+        if self.write_rollups:
+            write_dashboard_snapshots(self.today, state_id)
+            self._invalidate_reports(state_id, lga_id)
+    
+    def aggregate_demographics(self, state_id=None, lga_id=None, ward_ids=None):
         """
         Aggregate demographic data
         """
         start_time = timezone.now()
+        self.timings = StageTimings()
         
         # Build filter conditions
         filters = {}
@@ -43,83 +112,58 @@ class DataAggregator:
             filters['residence_state_id'] = state_id
         if lga_id:
             filters['residence_lga_id'] = lga_id
+        if ward_ids is not None:
+            filters['residence_ward_id__in'] = ward_ids
+        
+        # Same scope expressed against the stats tables
+        stat_filters = self._stat_filters(state_id, lga_id, ward_ids)
         
         # Get citizens based on filters
         citizens = Citizen.objects.filter(**filters)
         
-        # Use pandas for efficient aggregation
-        df = pd.DataFrame(list(citizens.values(
-            'residence_state_id', 'residence_lga_id', 'residence_ward_id',
-            'gender', 'date_of_birth', 'education__level', 'religion', 'ethnicity'
-        )))
-        
-        # Calculate age from date of birth
-        df['age'] = df['date_of_birth'].apply(
-            lambda x: (self.today - x).days // 365 if x else None
+        # Count each dimension, and the configured cross-tabs, per ward
+        crosstab_counts = {tab_name: None for tab_name in CROSS_TABS}
+        counts = self._count_by_dimension(
+            citizens,
+            ['gender', 'date_of_birth', 'education__level', 'religion', 'ethnicity',
+             'occupation__employment_status'],
+            ['gender', 'age_group', 'education__level', 'religion', 'ethnicity'],
+            prepare=self._add_age_groups,
+            crosstab_counts=crosstab_counts
         )
         
-        # Create age groups
-        df['age_group'] = pd.cut(
-            df['age'],
-            bins=[0, 5, 12, 18, 25, 35, 50, 65, 120],
-            labels=['0-5', '6-12', '13-18', '19-25', '26-35', '36-50', '51-65', '65+']
-        )
-        
-        # Group by different dimensions and count
-        aggregations = [
-            # By location and gender
-            df.groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'gender']).size(),
-            # By location and age group
-            df.groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'age_group']).size(),
-            # By location and education level
-            df.groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'education__level']).size(),
-            # By location and religion
-            df.groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'religion']).size(),
-            # By location and ethnicity
-            df.groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'ethnicity']).size()
-        ]
-        
         # Clear existing data for today
-        DemographicStats.objects.filter(stat_date=self.today, **filters).delete()
+        with self.timings.stage('clear'):
+            self.facts.clear(DemographicStats, self.today, LEVEL_WARD, state_id, lga_id, ward_ids)
+            CrossTabStats.objects.filter(stat_date=self.today, level=LEVEL_WARD, **stat_filters).delete()
         
         # Save aggregated data
-        for agg in aggregations:
-            for index, count in agg.items():
-                # Unpack the index based on its structure
-                if len(index) == 4:  # Location + 1 dimension
-                    state_id, lga_id, ward_id, dimension_value = index
-                    dimension_name = agg.index.names[3]
-                    
-                    # Map dimension name to the correct field
-                    field_mapping = {
-                        'gender': {'gender': dimension_value},
-                        'age_group': {'age_group': dimension_value},
-                        'education__level': {'education_level': dimension_value},
-                        'religion': {'religion': dimension_value},
-                        'ethnicity': {'ethnicity': dimension_value}
-                    }
-                    
-                    # Create stat record
-                    DemographicStats.objects.create(
-                        stat_date=self.today,
-                        state_id=state_id,
-                        lga_id=lga_id,
-                        ward_id=ward_id,
-                        count=count,
-                        **field_mapping.get(dimension_name, {})
-                    )
-        
-        # Calculate percentages
-        self._calculate_percentages(DemographicStats, self.today, filters)
-        
-        # Update report metadata
+        self._save_counts(DemographicStats, counts, {
+            'gender': 'gender',
+            'age_group': 'age_group',
+            'education__level': 'education_level',
+            'religion': 'religion',
+            'ethnicity': 'ethnicity'
+        })
+        self._save_crosstabs(crosstab_counts)
+        
+        # Roll ward rows up to LGA, state and national level
+        if self.write_rollups:
+            with self.timings.stage('rollups'):
+                self._write_rollups(DemographicStats, state_id, lga_id)
+                self._write_rollups(CrossTabStats, state_id, lga_id)
+            self._invalidate_reports(state_id, lga_id)
+        
+        # Record where the time went, then update report metadata
+        self._record_timings("demographic_aggregation", state_id, lga_id, ward_ids)
         self._update_report_metadata("demographic_aggregation", start_time)
     
-    def aggregate_occupations(self, state_id=None, lga_id=None):
+    def aggregate_occupations(self, state_id=None, lga_id=None, ward_ids=None):
         """
         Aggregate occupation data
         """
         start_time = timezone.now()
+        self.timings = StageTimings()
         
         # Build filter conditions
         filters = {}
@@ -127,69 +171,47 @@ class DataAggregator:
             filters['residence_state_id'] = state_id
         if lga_id:
             filters['residence_lga_id'] = lga_id
+        if ward_ids is not None:
+            filters['residence_ward_id__in'] = ward_ids
         
         # Get citizens with occupation data
-        citizens = Citizen.objects.filter(**filters).select_related('occupation')
+        citizens = Citizen.objects.filter(**filters)
         
-        # Use pandas for efficient aggregation
-        df = pd.DataFrame(list(citizens.values(
-            'residence_state_id', 'residence_lga_id', 'residence_ward_id',
-            'occupation__sector', 'occupation__employment_status', 
+        # Count each dimension per ward
+        dimensions = [
+            'occupation__sector', 'occupation__employment_status',
             'occupation__income_level', 'occupation__qualification'
-        )))
-        
-        # Group by different dimensions and count
-        aggregations = [
-            # By location and sector
-            df.groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'occupation__sector']).size(),
-            # By location and employment status
-            df.groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'occupation__employment_status']).size(),
-            # By location and income level
-            df.groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'occupation__income_level']).size(),
-            # By location and qualification
-            df.groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'occupation__qualification']).size()
         ]
+        counts = self._count_by_dimension(citizens, dimensions, dimensions)
         
         # Clear existing data for today
-        OccupationStats.objects.filter(stat_date=self.today, **filters).delete()
+        with self.timings.stage('clear'):
+            self.facts.clear(OccupationStats, self.today, LEVEL_WARD, state_id, lga_id, ward_ids)
         
         # Save aggregated data
-        for agg in aggregations:
-            for index, count in agg.items():
-                # Unpack the index based on its structure
-                if len(index) == 4:  # Location + 1 dimension
-                    state_id, lga_id, ward_id, dimension_value = index
-                    dimension_name = agg.index.names[3]
-                    
-                    # Map dimension name to the correct field
-                    field_mapping = {
-                        'occupation__sector': {'occupation_sector': dimension_value},
-                        'occupation__employment_status': {'employment_status': dimension_value},
-                        'occupation__income_level': {'income_level': dimension_value},
-                        'occupation__qualification': {'qualification_level': dimension_value}
-                    }
-                    
-                    # Create stat record
-                    OccupationStats.objects.create(
-                        stat_date=self.today,
-                        state_id=state_id,
-                        lga_id=lga_id,
-                        ward_id=ward_id,
-                        count=count,
-                        **field_mapping.get(dimension_name, {})
-                    )
-        
-        # Calculate percentages
-        self._calculate_percentages(OccupationStats, self.today, filters)
-        
-        # Update report metadata
+        self._save_counts(OccupationStats, counts, {
+            'occupation__sector': 'occupation_sector',
+            'occupation__employment_status': 'employment_status',
+            'occupation__income_level': 'income_level',
+            'occupation__qualification': 'qualification_level'
+        })
+        
+        # Roll ward rows up to LGA, state and national level
+        if self.write_rollups:
+            with self.timings.stage('rollups'):
+                self._write_rollups(OccupationStats, state_id, lga_id)
+            self._invalidate_reports(state_id, lga_id)
+        
+        # Record where the time went, then update report metadata
+        self._record_timings("occupation_aggregation", state_id, lga_id, ward_ids)
         self._update_report_metadata("occupation_aggregation", start_time)
     
-    def aggregate_healthcare(self, state_id=None, lga_id=None):
+    def aggregate_healthcare(self, state_id=None, lga_id=None, ward_ids=None):
         """
         Aggregate healthcare data
         """
         start_time = timezone.now()
+        self.timings = StageTimings()
         
         # Build filter conditions
         filters = {}
@@ -197,69 +219,47 @@ class DataAggregator:
             filters['residence_state_id'] = state_id
         if lga_id:
             filters['residence_lga_id'] = lga_id
+        if ward_ids is not None:
+            filters['residence_ward_id__in'] = ward_ids
         
         # Get citizens with health data
-        citizens = Citizen.objects.filter(**filters).select_related('health')
+        citizens = Citizen.objects.filter(**filters)
         
-        # Use pandas for efficient aggregation
-        df = pd.DataFrame(list(citizens.values(
-            'residence_state_id', 'residence_lga_id', 'residence_ward_id',
+        # Count each dimension per ward
+        dimensions = [
             'health__condition', 'health__disability', 'health__blood_group',
             'health__immunization_status'
-        )))
-        
-        # Group by different dimensions and count
-        aggregations = [
-            # By location and health condition
-            df.groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'health__condition']).size(),
-            # By location and disability
-            df.groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'health__disability']).size(),
-            # By location and blood group
-            df.groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'health__blood_group']).size(),
-            # By location and immunization status
-            df.groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'health__immunization_status']).size()
         ]
+        counts = self._count_by_dimension(citizens, dimensions, dimensions)
         
         # Clear existing data for today
-        HealthcareStats.objects.filter(stat_date=self.today, **filters).delete()
+        with self.timings.stage('clear'):
+            self.facts.clear(HealthcareStats, self.today, LEVEL_WARD, state_id, lga_id, ward_ids)
         
         # Save aggregated data
-        for agg in aggregations:
-            for index, count in agg.items():
-                # Unpack the index based on its structure
-                if len(index) == 4:  # Location + 1 dimension
-                    state_id, lga_id, ward_id, dimension_value = index
-                    dimension_name = agg.index.names[3]
-                    
-                    # Map dimension name to the correct field
-                    field_mapping = {
-                        'health__condition': {'health_condition': dimension_value},
-                        'health__disability': {'disability_type': dimension_value},
-                        'health__blood_group': {'blood_group': dimension_value},
-                        'health__immunization_status': {'immunization_status': dimension_value}
-                    }
-                    
-                    # Create stat record
-                    HealthcareStats.objects.create(
-                        stat_date=self.today,
-                        state_id=state_id,
-                        lga_id=lga_id,
-                        ward_id=ward_id,
-                        count=count,
-                        **field_mapping.get(dimension_name, {})
-                    )
-        
-        # Calculate percentages
-        self._calculate_percentages(HealthcareStats, self.today, filters)
-        
-        # Update report metadata
+        self._save_counts(HealthcareStats, counts, {
+            'health__condition': 'health_condition',
+            'health__disability': 'disability_type',
+            'health__blood_group': 'blood_group',
+            'health__immunization_status': 'immunization_status'
+        })
+        
+        # Roll ward rows up to LGA, state and national level
+        if self.write_rollups:
+            with self.timings.stage('rollups'):
+                self._write_rollups(HealthcareStats, state_id, lga_id)
+            self._invalidate_reports(state_id, lga_id)
+        
+        # Record where the time went, then update report metadata
+        self._record_timings("healthcare_aggregation", state_id, lga_id, ward_ids)
         self._update_report_metadata("healthcare_aggregation", start_time)
     
-    def aggregate_family_structures(self, state_id=None, lga_id=None):
+    def aggregate_family_structures(self, state_id=None, lga_id=None, ward_ids=None):
         """
         Aggregate family structure data
         """
         start_time = timezone.now()
+        self.timings = StageTimings()
         
         # Build filter conditions
         filters = {}
@@ -267,195 +267,645 @@ class DataAggregator:
             filters['residence_state_id'] = state_id
         if lga_id:
             filters['residence_lga_id'] = lga_id
+        if ward_ids is not None:
+            filters['residence_ward_id__in'] = ward_ids
+        
+        # Same scope expressed against the stats tables
+        stat_filters = self._stat_filters(state_id, lga_id, ward_ids)
         
         # Get citizens with family data
-        citizens = Citizen.objects.filter(**filters).select_related('family')
+        citizens = Citizen.objects.filter(**filters)
+        
+        # Count each dimension per ward, and sum household sizes per ward
+        # while the frames are built
+        household_totals = {'household_count': None, 'member_count': None}
+        counts = self._count_by_dimension(
+            citizens,
+            [
+                'family__household_size', 'family__marital_status',
+                'family__children_count', 'family__family_type'
+            ],
+            [
+                'household_size_group', 'family__marital_status',
+                'children_count_group', 'family__family_type'
+            ],
+            prepare=partial(self._add_family_size_groups, household_totals=household_totals)
+        )
         
-        # Use pandas for efficient aggregation
-        df = pd.DataFrame(list(citizens.values(
-            'residence_state_id', 'residence_lga_id', 'residence_ward_id',
-            'family__household_size', 'family__marital_status', 
-            'family__children_count', 'family__family_type'
-        )))
+        # Clear existing data for today
+        with self.timings.stage('clear'):
+            self.facts.clear(FamilyStats, self.today, LEVEL_WARD, state_id, lga_id, ward_ids)
+            HouseholdStats.objects.filter(stat_date=self.today, level=LEVEL_WARD, **stat_filters).delete()
+        
+        # Save aggregated data
+        self._save_counts(FamilyStats, counts, {
+            'household_size_group': 'household_size',
+            'family__marital_status': 'marital_status',
+            'children_count_group': 'children_count',
+            'family__family_type': 'family_type'
+        })
+        self._save_households(household_totals)
+        
+        # Roll ward rows up to LGA, state and national level
+        if self.write_rollups:
+            with self.timings.stage('rollups'):
+                self._write_rollups(FamilyStats, state_id, lga_id)
+                self._write_rollups(HouseholdStats, state_id, lga_id)
+            self._invalidate_reports(state_id, lga_id)
+        
+        # Record where the time went, then update report metadata
+        self._record_timings("family_structure_aggregation", state_id, lga_id, ward_ids)
+        self._update_report_metadata("family_structure_aggregation", start_time)
+    
+    def aggregate_interests(self, state_id=None, lga_id=None, ward_ids=None):
+        """
+        Aggregate interests and sports data
+        """
+        start_time = timezone.now()
+        self.timings = StageTimings()
+        
+        # Build filter conditions
+        filters = {}
+        if state_id:
+            filters['residence_state_id'] = state_id
+        if lga_id:
+            filters['residence_lga_id'] = lga_id
+        if ward_ids is not None:
+            filters['residence_ward_id__in'] = ward_ids
+        
+        # Get citizens in scope; their interests are joined in the same query
+        citizens = Citizen.objects.filter(**filters)
+        
+        # Count each dimension per ward straight from the joined rows
+        counts = self._count_by_dimension(
+            citizens,
+            ['interests__interest_type', 'interests__sport_name', 'interests__cultural_activity'],
+            ['interest_type', 'sport_name', 'cultural_activity'],
+            prepare=self._prepare_interests
+        )
+        
+        # Clear existing data for today
+        with self.timings.stage('clear'):
+            self.facts.clear(InterestStats, self.today, LEVEL_WARD, state_id, lga_id, ward_ids)
+        
+        # Save aggregated data
+        self._save_counts(InterestStats, counts, {
+            'interest_type': 'interest_type',
+            'sport_name': 'sport_name',
+            'cultural_activity': 'cultural_activity'
+        })
+        
+        # Roll ward rows up to LGA, state and national level
+        if self.write_rollups:
+            with self.timings.stage('rollups'):
+                self._write_rollups(InterestStats, state_id, lga_id)
+            self._invalidate_reports(state_id, lga_id)
+        
+        # Record where the time went, then update report metadata
+        self._record_timings("interest_aggregation", state_id, lga_id, ward_ids)
+        self._update_report_metadata("interest_aggregation", start_time)
+    
+    def _add_age_groups(self, df):
+        """
+        Derive age groups from date of birth
+        """
+        # Create age groups from the birth-date boundaries for today
+        df['age_group'] = assign_age_groups(
+            df['date_of_birth'], self.today, self.age_boundaries
+        )
+    
+    def _add_family_size_groups(self, df, household_totals=None):
+        """
+        Derive household size and children count groups
+        
+        Args:
+            df (DataFrame): Frame of citizens with family columns
+            household_totals (dict): Running per-ward household and member
+                counts, added to from the frame when given
+        """
+        # Scopes without family records read the sizes as all-None objects
+        for column in ['family__household_size', 'family__children_count']:
+            df[column] = pd.to_numeric(df[column])
+        
+        # Count households and their members before the sizes are bucketed
+        if household_totals is not None:
+            sizes = df.loc[df['family__household_size'].notna(), LOCATION_COLUMNS + ['family__household_size']]
+            wards = sizes.groupby(LOCATION_COLUMNS, sort=False)['family__household_size']
+            household_totals['household_count'] = self._add_counts(
+                household_totals['household_count'], wards.size()
+            )
+            household_totals['member_count'] = self._add_counts(
+                household_totals['member_count'], wards.sum()
+            )
         
         # Create household size groups
         df['household_size_group'] = pd.cut(
             df['family__household_size'],
             bins=[0, 1, 2, 4, 6, 10, 20],
-            labels=['1', '2', '3-4', '5-6', '7-10', '10+']
+            labels=HOUSEHOLD_SIZE_GROUPS
         )
         
         # Create children count groups
         df['children_count_group'] = pd.cut(
             df['family__children_count'],
             bins=[-1, 0, 1, 2, 3, 5, 10, 20],
-            labels=['0', '1', '2', '3', '4-5', '6-10', '10+']
+            labels=CHILDREN_COUNT_GROUPS
         )
+    
+    def _prepare_interests(self, df):
+        """
+        Name interest columns and keep sports/cultural activities to their type
+        """
+        df.rename(columns={
+            'interests__interest_type': 'interest_type',
+            'interests__sport_name': 'sport_name',
+            'interests__cultural_activity': 'cultural_activity'
+        }, inplace=True)
+        
+        df.loc[df['interest_type'] != 'Sport', 'sport_name'] = None
+        df.loc[df['interest_type'] != 'Cultural', 'cultural_activity'] = None
+    
+    def _count_by_dimension(self, queryset, fields, dimensions, prepare=None, crosstab_counts=None):
+        """
+        Count citizens per ward for each dimension
         
-        # Group by different dimensions and count
-        aggregations = [
-            # By location and household size
-            df.groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'household_size_group']).size(),
-            # By location and marital status
-            df.groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'family__marital_status']).size(),
-            # By location and children count
-            df.groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'children_count_group']).size(),
-            # By location and family type
-            df.groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'family__family_type']).size()
-        ]
+        In streaming mode every chunk is folded into running per-group
+        counts, so only one chunk of citizens is held at a time. Cross-tabs
+        named in ``crosstab_counts`` are counted from the same frames and
+        their running counts stored back into it.
+        """
+        counts = {dimension: None for dimension in dimensions}
+        
+        for df in self._iter_frames(queryset, LOCATION_COLUMNS + fields):
+            if prepare:
+                with self.timings.stage('frame'):
+                    prepare(df)
+            with self.timings.stage('groupby') as stage:
+                self._fold_counts(counts, df)
+                if crosstab_counts:
+                    self._fold_crosstabs(crosstab_counts, df)
+                stage.add_rows(len(df))
+        
+        return counts
+    
+    def _fold_counts(self, counts, df):
+        """
+        Add a frame's per-ward group sizes to the running counts
+        """
+        # Hold dimension columns as Categoricals over stable vocabularies
+        self.vocabularies.encode_frame(df, counts)
+        
+        for dimension, running in counts.items():
+            # Group on the integer codes; values are decoded when saving
+            codes = df[dimension].cat.codes.rename(dimension)
+            observed = codes >= 0
+            chunk_counts = df.loc[observed, LOCATION_COLUMNS].join(codes[observed]).groupby(
+                LOCATION_COLUMNS + [dimension], sort=False
+            ).size()
+            
+            counts[dimension] = self._add_counts(running, chunk_counts)
+    
+    def _fold_crosstabs(self, crosstab_counts, df):
+        """
+        Add a frame's per-ward cross-tab cell counts to the running counts
+        """
+        location_codes, locations = pd.MultiIndex.from_frame(df[LOCATION_COLUMNS]).factorize()
+        location_values = [locations.get_level_values(level).to_numpy() for level in range(3)]
         
-        # Clear existing data for today
-        FamilyStats.objects.filter(stat_date=self.today, **filters).delete()
+        for tab_name, running in crosstab_counts.items():
+            columns = crosstab_columns(tab_name)
+            
+            # Columns only used by cross-tabs are not encoded yet
+            self.vocabularies.encode_frame(
+                df, [column for column in columns if not isinstance(df[column].dtype, pd.CategoricalDtype)]
+            )
+            
+            cells, cell_counts = count_combinations(
+                location_codes,
+                len(locations),
+                [df[column].cat.codes.to_numpy() for column in columns],
+                [len(self.vocabularies.get(column)) for column in columns]
+            )
+            
+            # Key cells by ward and vocabulary codes, like the dimension counts
+            index = pd.MultiIndex.from_arrays(
+                [values[cells[0]] for values in location_values] + list(cells[1:]),
+                names=LOCATION_COLUMNS + columns
+            )
+            chunk_counts = pd.Series(cell_counts, index=index)
+            
+            crosstab_counts[tab_name] = self._add_counts(running, chunk_counts)
+    
+    def _add_counts(self, running, chunk_counts):
+        """
+        Add a chunk's group sizes to the running counts
         
-        # Save aggregated data
-        for agg in aggregations:
-            for index, count in agg.items():
-                # Unpack the index based on its structure
-                if len(index) == 4:  # Location + 1 dimension
-                    state_id, lga_id, ward_id, dimension_value = index
-                    dimension_name = agg.index.names[3]
-                    
-                    # Map dimension name to the correct field
-                    field_mapping = {
-                        'household_size_group': {'household_size': dimension_value},
-                        'family__marital_status': {'marital_status': dimension_value},
-                        'children_count_group': {'children_count': dimension_value},
-                        'family__family_type': {'family_type': dimension_value}
-                    }
-                    
-                    # Create stat record
-                    FamilyStats.objects.create(
-                        stat_date=self.today,
-                        state_id=state_id,
-                        lga_id=lga_id,
-                        ward_id=ward_id,
-                        count=count,
-                        **field_mapping.get(dimension_name, {})
-                    )
+        The sum gets an index of its own: pandas tracks every view of an
+        index's levels, so sums sharing the levels of the previous sum
+        would hold on to memory growing with the number of chunks.
+        """
+        if running is None:
+            return chunk_counts
         
-        # Calculate percentages
-        self._calculate_percentages(FamilyStats, self.today, filters)
+        total = running.add(chunk_counts, fill_value=0)
+        total.index = total.index.copy(deep=True)
+        return total
+    
+    def _streaming_chunk_size(self, field_count):
+        """
+        Number of rows to read per chunk, or None to read everything at once
+        """
+        if self.chunk_size:
+            return self.chunk_size
         
-        # Update report metadata
-        self._update_report_metadata("family_structure_aggregation", start_time)
+        if self.memory_target_mb:
+            return max(1000, int(self.memory_target_mb * 1024 * 1024 // (field_count * BYTES_PER_VALUE)))
+        
+        return None
     
-    def aggregate_interests(self, state_id=None, lga_id=None):
+    def _iter_frames(self, queryset, fields):
         """
-        Aggregate interests and sports data
+        Yield the queryset's values as DataFrames, chunked in streaming mode
+        
+        Fields may follow multi-valued relations (e.g. interests), in which
+        case a citizen contributes one row per related object.
         """
-        start_time = timezone.now()
+        chunk_size = self._streaming_chunk_size(len(fields))
+        
+        if not chunk_size:
+            yield self._read_frame(queryset, fields)
+            return
+        
+        # Keyset pagination over citizen primary keys: each chunk is an
+        # index range scan, so late chunks cost the same as early ones.
+        # Chunks end on a citizen boundary so joined rows are never split.
+        queryset = queryset.order_by('pk')
+        last_pk = None
+        while True:
+            chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            boundary = list(chunk.values_list('pk', flat=True)[chunk_size - 1:chunk_size])
+            if boundary:
+                chunk = chunk.filter(pk__lte=boundary[0])
+            
+            df = self._read_frame(chunk, fields)
+            if len(df):
+                yield df
+            
+            if not boundary:
+                return
+            last_pk = boundary[0]
+    
+    def _read_frame(self, queryset, fields):
+        """
+        Fetch a queryset's values into a DataFrame
         
-        # Build filter conditions
-        filters = {}
-        if state_id:
-            filters['residence_state_id'] = state_id
-        if lga_id:
-            filters['residence_lga_id'] = lga_id
+        Rows are converted to typed arrays READ_BATCH_SIZE at a time as
+        they are fetched, with text columns encoded to vocabulary codes, so
+        only one batch of rows is ever held as Python objects.
+        """
+        field_types = [self._field_type(queryset.model, field) for field in fields]
+        arrays = [[] for _ in fields]
+        
+        with self.timings.stage('query') as stage:
+            rows = queryset.values_list(*fields).iterator(chunk_size=READ_BATCH_SIZE)
+            while True:
+                batch = list(islice(rows, READ_BATCH_SIZE))
+                if not batch:
+                    break
+                
+                for field, field_type, parts, values in zip(fields, field_types, arrays, zip(*batch)):
+                    parts.append(self._column_array(field, field_type, values))
+                stage.add_rows(len(batch))
+        
+        with self.timings.stage('frame'):
+            columns = {}
+            for field, field_type, parts in zip(fields, field_types, arrays):
+                if field_type in TEXT_FIELD_TYPES:
+                    # The vocabulary only grows, so earlier batches' codes hold
+                    codes = np.concatenate(parts) if parts else np.empty(0, dtype=np.int32)
+                    columns[field] = pd.Categorical.from_codes(
+                        codes, categories=self.vocabularies.get(field).categories
+                    )
+                else:
+                    columns[field] = np.concatenate(parts) if parts else np.empty(0, dtype=object)
+            return pd.DataFrame(columns, columns=fields)
+    
+    def _column_array(self, field, field_type, values):
+        """
+        Convert one batch of a column's values to a NumPy array
+        """
+        if field_type in TEXT_FIELD_TYPES:
+            return self.vocabularies.get(field).encode(values)
         
-        # Get citizens with interest data
-        citizens = Citizen.objects.filter(**filters).prefetch_related('interests')
-        
-        # Collect all interests
-        interest_data = []
-        for citizen in citizens:
-            for interest in citizen.interests.all():
-                interest_data.append({
-                    'residence_state_id': citizen.residence_state_id,
-                    'residence_lga_id': citizen.residence_lga_id,
-                    'residence_ward_id': citizen.residence_ward_id,
-                    'interest_type': interest.interest_type,
-                    'sport_name': interest.sport_name if interest.interest_type == 'Sport' else None,
-                    'cultural_activity': interest.cultural_activity if interest.interest_type == 'Cultural' else None
-                })
-        
-        # Convert to DataFrame
-        df = pd.DataFrame(interest_data)
-        
-        # Group by different dimensions and count
-        aggregations = [
-            # By location and interest type
-            df.groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'interest_type']).size(),
-            # By location and sport name (for sports only)
-            df[df['interest_type'] == 'Sport'].groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'sport_name']).size(),
-            # By location and cultural activity (for cultural only)
-            df[df['interest_type'] == 'Cultural'].groupby(['residence_state_id', 'residence_lga_id', 'residence_ward_id', 'cultural_activity']).size()
-        ]
+        if field_type == 'DateField':
+            return to_datetime64(values)
         
-        # Clear existing data for today
-        InterestStats.objects.filter(stat_date=self.today, **filters).delete()
+        # Integers, with missing values (e.g. no family record) as NaN
+        array = np.asarray(values)
+        if array.dtype == object:
+            array = np.array(values, dtype=np.float64)
+        return array
+    
+    def _field_type(self, model, path):
+        """
+        Get the internal type of the field a ``__`` separated path ends at
+        """
+        *relations, name = path.split('__')
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        return model._meta.get_field(name).get_internal_type()
+    
+    def _save_counts(self, model, counts, field_mapping):
+        """
+        Write per-ward counts and their percentages as stats facts
+        """
+        for dimension, agg in counts.items():
+            if agg is None or agg.empty:
+                continue
+            
+            vocabulary = self.vocabularies.get(dimension)
+            
+            with self.timings.stage('percentages'):
+                # Percentages are relative to the ward's total for this dimension
+                ward_totals = agg.groupby(level=[0, 1, 2]).transform('sum')
+                
+                rows = []
+                for (index, count), total in zip(agg.items(), ward_totals):
+                    state_id, lga_id, ward_id, code = index
+                    rows.append((
+                        (int(state_id), int(lga_id), int(ward_id)),
+                        vocabulary.decode(code),
+                        int(count),
+                        round(count * 100.0 / total, 2)
+                    ))
+            
+            with self.timings.stage('insert') as stage:
+                self.facts.write_ward_rows(model, field_mapping[dimension], self.today, rows)
+                stage.add_rows(len(rows))
+    
+    def _save_households(self, household_totals):
+        """
+        Write per-ward household and member counts
+        """
+        households = household_totals['household_count']
+        if households is None or households.empty:
+            return
+        members = household_totals['member_count'].reindex(households.index, fill_value=0)
+        
+        records = [
+            HouseholdStats(
+                stat_date=self.today,
+                state_id=int(state_id),
+                lga_id=int(lga_id),
+                ward_id=int(ward_id),
+                household_count=int(household_count),
+                member_count=int(member_count)
+            )
+            for (state_id, lga_id, ward_id), household_count, member_count in zip(
+                households.index, households, members
+            )
+        ]
         
-        # Save aggregated data
-        for agg in aggregations:
-            for index, count in agg.items():
-                # Unpack the index based on its structure
-                if len(index) == 4:  # Location + 1 dimension
-                    state_id, lga_id, ward_id, dimension_value = index
-                    dimension_name = agg.index.names[3]
-                    
-                    # Map dimension name to the correct field
-                    field_mapping = {
-                        'interest_type': {'interest_type': dimension_value},
-                        'sport_name': {'sport_name': dimension_value},
-                        'cultural_activity': {'cultural_activity': dimension_value}
-                    }
-                    
-                    # Create stat record
-                    InterestStats.objects.create(
+        with self.timings.stage('insert') as stage:
+            HouseholdStats.objects.bulk_create(records, batch_size=1000)
+            stage.add_rows(len(records))
+    
+    def _save_crosstabs(self, crosstab_counts):
+        """
+        Write per-ward cross-tab cells and their share of the ward's total
+        """
+        with self.timings.stage('percentages'):
+            records = []
+            for tab_name, agg in crosstab_counts.items():
+                if agg is None or agg.empty:
+                    continue
+                
+                vocabularies = [self.vocabularies.get(column) for column in crosstab_columns(tab_name)]
+                ward_totals = agg.groupby(level=[0, 1, 2]).transform('sum')
+                
+                for (index, count), total in zip(agg.items(), ward_totals):
+                    state_id, lga_id, ward_id, *codes = index
+                    values = [vocabulary.decode(code) for vocabulary, code in zip(vocabularies, codes)]
+                    records.append(CrossTabStats(
                         stat_date=self.today,
                         state_id=state_id,
                         lga_id=lga_id,
                         ward_id=ward_id,
-                        count=count,
-                        **field_mapping.get(dimension_name, {})
-                    )
-        
-        # Calculate percentages
-        self._calculate_percentages(InterestStats, self.today, filters)
-        
-        # Update report metadata
-        self._update_report_metadata("interest_aggregation", start_time)
+                        tab_name=tab_name,
+                        value_1=values[0],
+                        value_2=values[1],
+                        value_3=values[2] if len(values) > 2 else None,
+                        count=int(count),
+                        percentage=round(count * 100.0 / total, 2)
+                    ))
+        
+        with self.timings.stage('insert') as stage:
+            CrossTabStats.objects.bulk_create(records, batch_size=1000)
+            stage.add_rows(len(records))
     
-    def _calculate_percentages(self, model, stat_date, filters):
+    def carry_forward(self, source_date, ward_ids=None):
         """
-        Calculate percentages for each group
+        Copy another date's ward rows to this aggregator's date
+        
+        Incremental runs start from the previous run's wards and only
+        re-aggregate the ones that changed.
+        
+        Args:
+            source_date (date): Date to copy from
+            ward_ids (list): Only copy these wards, replacing whatever rows
+                they already have on this date
         """
-        # Get total counts for each location
+        ward_sql = ''
+        if ward_ids is not None:
+            for model in FACT_FAMILIES:
+                self.facts.clear(model, self.today, LEVEL_WARD, ward_ids=ward_ids)
+            for model in [CrossTabStats, HouseholdStats]:
+                model.objects.filter(stat_date=self.today, level=LEVEL_WARD, ward_id__in=ward_ids).delete()
+            ward_sql = f" AND ward_id IN ({', '.join(['%s'] * len(ward_ids))})"
+        ward_params = list(ward_ids or [])
+        
+        self.facts.copy_ward_rows(source_date, self.today, ward_ids)
+        
+        table = CrossTabStats._meta.db_table
+        now = timezone.now()
+        
         with connection.cursor() as cursor:
             cursor.execute(f"""
-                SELECT state_id, lga_id, ward_id, SUM(count) as total
-                FROM {model._meta.db_table}
-                WHERE stat_date = %s
-                GROUP BY state_id, lga_id, ward_id
-            """, [stat_date])
+                INSERT INTO {table} (
+                    stat_date, level, state_id, lga_id, ward_id, tab_name,
+                    value_1, value_2, value_3, count, percentage, created_at, updated_at
+                )
+                SELECT %s, level, state_id, lga_id, ward_id, tab_name,
+                    value_1, value_2, value_3, count, percentage, %s, %s
+                FROM {table}
+                WHERE stat_date = %s AND level = %s{ward_sql}
+            """, [self.today, now, now, source_date, LEVEL_WARD, *ward_params])
+            
+            household_table = HouseholdStats._meta.db_table
+            cursor.execute(f"""
+                INSERT INTO {household_table} (
+                    stat_date, level, state_id, lga_id, ward_id,
+                    household_count, member_count, created_at, updated_at
+                )
+                SELECT %s, level, state_id, lga_id, ward_id,
+                    household_count, member_count, %s, %s
+                FROM {household_table}
+                WHERE stat_date = %s AND level = %s{ward_sql}
+            """, [self.today, now, now, source_date, LEVEL_WARD, *ward_params])
+    
+    def rebuild_rollups(self, state_id=None, lga_id=None):
+        """
+        Recompute LGA, state and national rows for every stats table
+        """
+        for model in STATS_MODELS:
+            self._write_rollups(model, state_id, lga_id)
+        self._invalidate_reports(state_id, lga_id)
+        write_dashboard_snapshots(self.today, state_id)
+    
+    def _write_rollups(self, model, state_id=None, lga_id=None):
+        """
+        Replace pre-rolled rows affected by an aggregation scope
+        
+        Rollups are summed from the stored ward rows in the database, so
+        partial runs (one state or LGA) combine correctly with the wards
+        aggregated earlier for the same date.
+        """
+        if model in FACT_FAMILIES:
+            self.facts.write_rollups(model, self.today, state_id, lga_id)
+            
+            # The wide table is rolled up too while custom reports read it
+            if not self.facts.write_legacy:
+                return
+        
+        # The run's own LGAs, the state containing them, and the nation
+        rollup_scopes = [
+            (LEVEL_LGA, ['state_id', 'lga_id'], self._stat_filters(state_id, lga_id)),
+            (LEVEL_STATE, ['state_id'], self._stat_filters(state_id)),
+            (LEVEL_NATIONAL, [], {}),
+        ]
+        
+        if model is HouseholdStats:
+            self._write_household_rollups(rollup_scopes)
+            return
+        
+        # Single-dimension tables roll each dimension up on its own, with
+        # percentages per location; cross-tab cells are rolled up on all
+        # their columns, with percentages per location and tab
+        if model is CrossTabStats:
+            dimension_sets = [(model.dimension_fields, ['tab_name'])]
+        else:
+            dimension_sets = [([dimension], []) for dimension in model.dimension_fields]
+        
+        table = model._meta.db_table
+        now = timezone.now()
+        
+        for level, group_columns, scope in rollup_scopes:
+            model.objects.filter(stat_date=self.today, level=level, **scope).delete()
             
-            totals = {}
-            for row in cursor.fetchall():
-                state_id, lga_id, ward_id, total = row
-                key = (state_id, lga_id, ward_id)
-                totals[key] = total
-        
-        # Update percentages
-        for key, total in totals.items():
-            state_id, lga_id, ward_id = key
+            # Keep the location columns of the level; finer ones stay NULL
+            location_sql = ', '.join(
+                column if column in group_columns else 'NULL'
+                for column in ['state_id', 'lga_id', 'ward_id']
+            )
+            scope_sql = ''.join(f" AND {column} = %s" for column in scope)
             
-            # Build filter for this location
-            location_filter = {'stat_date': stat_date}
-            if state_id:
-                location_filter['state_id'] = state_id
-            if lga_id:
-                location_filter['lga_id'] = lga_id
-            if ward_id:
-                location_filter['ward_id'] = ward_id
+            for dimensions, partition_columns in dimension_sets:
+                dimension_sql = ', '.join(dimensions)
+                group_sql = ', '.join(group_columns + dimensions)
+                partition_sql = ', '.join(group_columns + partition_columns)
+                partition_clause = f"PARTITION BY {partition_sql}" if partition_sql else ''
+                
+                with connection.cursor() as cursor:
+                    cursor.execute(f"""
+                        INSERT INTO {table} (
+                            stat_date, level, state_id, lga_id, ward_id, {dimension_sql},
+                            count, percentage, created_at, updated_at
+                        )
+                        SELECT %s, %s, {location_sql}, {dimension_sql}, SUM(count),
+                            ROUND(SUM(count) * 100.0 / SUM(SUM(count)) OVER ({partition_clause}), 2),
+                            %s, %s
+                        FROM {table}
+                        WHERE stat_date = %s AND level = %s AND {dimensions[0]} IS NOT NULL{scope_sql}
+                        GROUP BY {group_sql}
+                    """, [self.today, level, now, now, self.today, LEVEL_WARD, *scope.values()])
+    
+    def _write_household_rollups(self, rollup_scopes):
+        """
+        Replace household rollups by summing the ward counts of each scope
+        """
+        table = HouseholdStats._meta.db_table
+        now = timezone.now()
+        
+        for level, group_columns, scope in rollup_scopes:
+            HouseholdStats.objects.filter(stat_date=self.today, level=level, **scope).delete()
             
-            # Update all records for this location
-            model.objects.filter(**location_filter).update(
-                percentage=models.F('count') * 100.0 / total
+            # Keep the location columns of the level; finer ones stay NULL
+            location_sql = ', '.join(
+                column if column in group_columns else 'NULL'
+                for column in ['state_id', 'lga_id', 'ward_id']
             )
+            scope_sql = ''.join(f" AND {column} = %s" for column in scope)
+            
+            # National sums are grouped on the ward level so that no wards
+            # means no row rather than a row of NULLs
+            group_sql = ', '.join(group_columns) or 'level'
+            
+            with connection.cursor() as cursor:
+                cursor.execute(f"""
+                    INSERT INTO {table} (
+                        stat_date, level, state_id, lga_id, ward_id,
+                        household_count, member_count, created_at, updated_at
+                    )
+                    SELECT %s, %s, {location_sql}, SUM(household_count), SUM(member_count), %s, %s
+                    FROM {table}
+                    WHERE stat_date = %s AND level = %s{scope_sql}
+                    GROUP BY {group_sql}
+                """, [self.today, level, now, now, self.today, LEVEL_WARD, *scope.values()])
+    
+    def _invalidate_reports(self, state_id=None, lga_id=None):
+        """
+        Drop cached reports of the rollups just written, once they are
+        committed, so no request caches the old rows under the new keys
+        
+        The date's cubes get a new version straight away, in the run's
+        transaction, so the dashboard snapshots are computed from the new
+        rows.
+        """
+        bump_stats_version(self.today)
+        transaction.on_commit(partial(ReportCache().invalidate, self.today, state_id, lga_id))
+    
+    def _stat_filters(self, state_id=None, lga_id=None, ward_ids=None):
+        """
+        Build stats table filters for an aggregation scope
+        """
+        stat_filters = {}
+        if state_id:
+            stat_filters['state_id'] = state_id
+        if lga_id:
+            stat_filters['lga_id'] = lga_id
+        if ward_ids is not None:
+            stat_filters['ward_id__in'] = ward_ids
+        return stat_filters
+    
+    def _record_timings(self, run_name, state_id=None, lga_id=None, ward_ids=None):
+        """
+        Store the stage timings of the current aggregation call
+        """
+        self.timings.save(
+            run_name,
+            self.today,
+            state_id=state_id,
+            lga_id=lga_id,
+            ward_count=len(ward_ids) if ward_ids is not None else None
+        )
     
     def _update_report_metadata(self, report_name, start_time=None):
         """
         Update report metadata
         """
+        if not self.record_metadata:
+            return
+        
         if start_time:
             duration = (timezone.now() - start_time).total_seconds()
         else:
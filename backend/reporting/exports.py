@@ -0,0 +1,299 @@
+import csv
+from itertools import islice
+from django.http import StreamingHttpResponse
+from django.middleware.gzip import re_accepts_gzip
+from django.utils.text import compress_sequence
+from django.utils.cache import patch_vary_headers
+from citizen.models import Citizen
+from .models import DemographicStats, OccupationStats, HealthcareStats, FamilyStats, InterestStats
+
+# Stats families that can be exported, by the report type naming them
+EXPORT_MODELS = {
+    'demographic': DemographicStats,
+    'occupation': OccupationStats,
+    'healthcare': HealthcareStats,
+    'family': FamilyStats,
+    'interests': InterestStats,
+}
+
+# Columns of a citizen extract as (field path, column name); names and
+# contact details are left out
+CITIZEN_EXTRACT_COLUMNS = [
+    ('unique_id', 'unique_id'),
+    ('gender', 'gender'),
+    ('date_of_birth', 'date_of_birth'),
+    ('religion', 'religion'),
+    ('ethnicity', 'ethnicity'),
+    ('residence_state', 'state_id'),
+    ('residence_lga', 'lga_id'),
+    ('residence_ward', 'ward_id'),
+    ('education__level', 'education_level'),
+    ('occupation__sector', 'occupation_sector'),
+    ('occupation__employment_status', 'employment_status'),
+    ('occupation__income_level', 'income_level'),
+    ('health__condition', 'health_condition'),
+    ('health__disability', 'disability_type'),
+    ('health__blood_group', 'blood_group'),
+    ('family__household_size', 'household_size'),
+    ('family__marital_status', 'marital_status'),
+    ('family__children_count', 'children_count'),
+    ('registration_date', 'registration_date'),
+]
+
+# Low-cardinality citizen columns, dictionary encoded in columnar exports
+CITIZEN_EXTRACT_DIMENSIONS = [
+    'gender', 'religion', 'ethnicity', 'education__level', 'occupation__sector',
+    'occupation__employment_status', 'occupation__income_level', 'health__condition',
+    'health__disability', 'health__blood_group', 'family__marital_status'
+]
+
+# Columnar export formats: file extension and content type. Arrow uses the
+# IPC stream format, which allows each record batch its own dictionaries.
+COLUMNAR_FORMATS = {
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrows', 'application/vnd.apache.arrow.stream'),
+}
+
+# Rows fetched per round trip; on PostgreSQL they come from a server-side
+# cursor, so only one batch is in memory at a time
+EXPORT_BATCH_SIZE = 2000
+
+# Rows per Arrow record batch, and so per Parquet row group
+RECORD_BATCH_SIZE = 50000
+
+# Bytes of CSV gathered before a chunk is sent
+CHUNK_SIZE = 64 * 1024
+
+class Echo:
+    """
+    File-like object whose write() returns what is written, so csv.writer
+    formats rows without keeping them
+    """
+    
+    def write(self, value):
+        return value
+
+def csv_chunks(columns, rows):
+    """
+    Format rows as CSV in chunks of about CHUNK_SIZE bytes
+    
+    The header is sent at once, before the first row is fetched.
+    
+    Args:
+        columns (list): Header row
+        rows: Iterable of row tuples
+    
+    Yields:
+        bytes: UTF-8 encoded CSV
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns).encode('utf-8')
+    
+    lines = []
+    size = 0
+    for row in rows:
+        line = writer.writerow(row)
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(lines).encode('utf-8')
+            lines = []
+            size = 0
+    
+    if lines:
+        yield ''.join(lines).encode('utf-8')
+
+class ChunkSink:
+    """
+    Write-only file that hands what was written to the response as chunks
+    
+    Parquet and Arrow IPC writers only append and ask for their position,
+    so their output can be streamed without a seekable file.
+    """
+    
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+    
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+    
+    def tell(self):
+        return self.position
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        self.closed = True
+    
+    def take(self):
+        """
+        Get the bytes written since the last call
+        """
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def streaming_csv_response(request, queryset, columns, filename, header=None):
+    """
+    Stream a queryset's columns as a CSV download
+    
+    Memory stays constant however many rows are exported. The CSV is
+    gzipped on the fly when the client accepts it, as browsers and most
+    HTTP clients do, and decompressed by them transparently.
+    
+    Args:
+        request: Request being answered
+        queryset (QuerySet): Rows to export
+        columns (list): Columns of the queryset to export, in order
+        filename (str): Name of the downloaded file
+        header (list): Column names, the columns themselves by default
+    
+    Returns:
+        StreamingHttpResponse: The CSV response
+    """
+    rows = queryset.values_list(*columns).iterator(chunk_size=EXPORT_BATCH_SIZE)
+    chunks = csv_chunks(header or columns, rows)
+    
+    gzipped = bool(re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+    if gzipped:
+        chunks = compress_sequence(chunks)
+    
+    response = StreamingHttpResponse(chunks, content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    if gzipped:
+        response['Content-Encoding'] = 'gzip'
+    return response
+
+def streaming_columnar_response(queryset, model, columns, file_format, filename,
+                                names=None, dimensions=None):
+    """
+    Stream a queryset's columns as a Parquet file or an Arrow IPC stream
+    
+    Rows are read from a server-side cursor and written in record batches
+    of RECORD_BATCH_SIZE rows, each sent as soon as it is written, so
+    memory is bounded by one batch. Column types come from the model's
+    fields, and dimension columns are dictionary encoded.
+    
+    Args:
+        queryset (QuerySet): Rows to export
+        model: Model whose fields describe the columns, e.g. the legacy
+            stats model of fact rows
+        columns (list): Field paths of the columns to export, in order
+        file_format (str): 'parquet' or 'arrow'
+        filename (str): Name of the downloaded file, without extension
+        names (list): Column names, the field paths by default
+        dimensions (list): Columns to dictionary encode
+    
+    Returns:
+        StreamingHttpResponse: The export response
+    
+    Raises:
+        ImportError: pyarrow is not installed
+    """
+    # pyarrow is optional; a missing install fails here, not mid-stream
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    dimensions = set(dimensions or [])
+    schema = pa.schema([
+        pa.field(name, _arrow_type(pa, _resolve_field(model, column), column in dimensions))
+        for column, name in zip(columns, names or columns)
+    ])
+    rows = queryset.values_list(*columns).iterator(chunk_size=EXPORT_BATCH_SIZE)
+    
+    def chunks():
+        sink = ChunkSink()
+        if file_format == 'parquet':
+            writer = pq.ParquetWriter(sink, schema, compression='snappy')
+            write = lambda batch: writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            writer = pa.ipc.new_stream(sink, schema)
+            write = writer.write_batch
+        
+        while True:
+            batch = list(islice(rows, RECORD_BATCH_SIZE))
+            if not batch:
+                break
+            write(_record_batch(pa, schema, batch))
+            yield sink.take()
+        
+        writer.close()
+        yield sink.take()
+    
+    extension, content_type = COLUMNAR_FORMATS[file_format]
+    response = StreamingHttpResponse(chunks(), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    return response
+
+def citizen_extract(state_id=None, lga_id=None):
+    """
+    Get the citizens of a jurisdiction for an extract
+    
+    Returns:
+        QuerySet: Citizens living in the state or LGA
+    """
+    filters = {}
+    if state_id:
+        filters['residence_state_id'] = state_id
+    if lga_id:
+        filters['residence_lga_id'] = lga_id
+    return Citizen.objects.filter(**filters).order_by('pk')
+
+def _resolve_field(model, path):
+    """
+    Get the model field a ``__`` separated field path ends at
+    """
+    *relations, name = path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+def _arrow_type(pa, field, dictionary=False):
+    """
+    Get the Arrow type of a column read from a model field
+    
+    Decimals (stats percentages) are exported as doubles, which is what
+    pandas reads them into anyway.
+    """
+    if dictionary:
+        return pa.dictionary(pa.int32(), pa.string())
+    
+    if field.is_relation:
+        return pa.int64()
+    
+    return {
+        'AutoField': pa.int64(),
+        'BigAutoField': pa.int64(),
+        'BigIntegerField': pa.int64(),
+        'IntegerField': pa.int32(),
+        'PositiveIntegerField': pa.int64(),
+        'SmallIntegerField': pa.int16(),
+        'FloatField': pa.float64(),
+        'DecimalField': pa.float64(),
+        'BooleanField': pa.bool_(),
+        'DateField': pa.date32(),
+        'DateTimeField': pa.timestamp('us', tz='UTC'),
+    }.get(field.get_internal_type(), pa.string())
+
+def _record_batch(pa, schema, rows):
+    """
+    Build a record batch from row tuples
+    """
+    arrays = []
+    for field, values in zip(schema, zip(*rows)):
+        if pa.types.is_dictionary(field.type):
+            # Fact rows hold every dimension value as text
+            values = [None if value is None else str(value) for value in values]
+            arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+        elif pa.types.is_floating(field.type):
+            values = [None if value is None else float(value) for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        else:
+            arrays.append(pa.array(list(values), type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
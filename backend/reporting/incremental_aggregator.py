@@ -0,0 +1,166 @@
+import time
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from citizen.models import Citizen
+from .models import AggregationWatermark
+from .age_engine import age_group_boundaries
+from .data_aggregator import DataAggregator
+
+# Wards re-aggregated per aggregation call, to keep IN lists short
+WARD_BATCH_SIZE = 500
+
+
+class IncrementalAggregator:
+    """
+    Re-aggregates only the wards whose citizens changed since the last run
+    
+    Each ward keeps a watermark: its citizen count and latest citizen
+    ``updated_at`` when it was last aggregated, and the date of the rows
+    aggregated then. Edits to a citizen's related records move the
+    citizen's ``updated_at`` (see signals.py). A run carries every ward's
+    rows forward from its watermark date and re-aggregates the wards whose
+    watermark moved (edits, additions and deletions), the wards without a
+    watermark, the wards that no longer have citizens, and the wards where
+    someone moved into a new age group since they were last aggregated.
+    Rollups are then rebuilt from the ward rows.
+    """
+    
+    def __init__(self, stat_date=None, memory_target_mb=None):
+        self.today = stat_date or timezone.now().date()
+        self.memory_target_mb = memory_target_mb
+    
+    def ward_states(self):
+        """
+        Get the current watermark of every ward with citizens
+        
+        Returns:
+            dict: ward_id -> (citizen_count, last_updated_at)
+        """
+        rows = Citizen.objects.values('residence_ward_id').annotate(
+            citizen_count=Count('pk'),
+            last_updated_at=Max('updated_at')
+        ).order_by()
+        return {
+            row['residence_ward_id']: (row['citizen_count'], row['last_updated_at'])
+            for row in rows
+        }
+    
+    def changed_wards(self, current, watermarks):
+        """
+        Find the wards that need re-aggregating
+        
+        Args:
+            current (dict): ward_states() of this run
+            watermarks (dict): ward_id -> AggregationWatermark
+        
+        Returns:
+            set: Ward ids
+        """
+        changed = {
+            ward_id for ward_id, state in current.items()
+            if ward_id not in watermarks
+            or (watermarks[ward_id].citizen_count, watermarks[ward_id].last_updated_at) != state
+        }
+        
+        # Wards whose last citizens were deleted or moved away
+        changed |= set(watermarks) - set(current)
+        
+        # Age groups move on birthdays without any record changing
+        if watermarks:
+            since = min(watermark.stat_date for watermark in watermarks.values())
+            changed |= self._aged_wards(since)
+        
+        return changed
+    
+    def _aged_wards(self, since):
+        """
+        Wards with a citizen who crossed an age group boundary after a date
+        """
+        if since >= self.today:
+            return set()
+        
+        # A boundary is crossed by dates of birth between its position on
+        # the earlier date and its position today
+        crossings = Q()
+        for before, now in zip(age_group_boundaries(since), age_group_boundaries(self.today)):
+            crossings |= Q(date_of_birth__gt=before.item(), date_of_birth__lte=now.item())
+        
+        return set(Citizen.objects.filter(crossings).values_list(
+            'residence_ward_id', flat=True
+        ).distinct())
+    
+    def run(self):
+        """
+        Bring this date's stats up to date with the registry
+        
+        Returns:
+            dict: Summary of the run
+        """
+        start_time = timezone.now()
+        start = time.perf_counter()
+        
+        aggregator = DataAggregator(
+            stat_date=self.today,
+            record_metadata=False,
+            memory_target_mb=self.memory_target_mb,
+            write_rollups=False
+        )
+        
+        with transaction.atomic():
+            current = self.ward_states()
+            watermarks = {
+                watermark.ward_id: watermark
+                for watermark in AggregationWatermark.objects.select_for_update()
+            }
+            
+            # Bring each ward's rows forward from the date its watermark was
+            # written. Scoped runs write some of a date's wards only, so no
+            # single date can be assumed to hold every ward.
+            carried = {}
+            for watermark in watermarks.values():
+                if watermark.stat_date < self.today:
+                    carried.setdefault(watermark.stat_date, []).append(watermark.ward_id)
+            for source_date, carried_wards in sorted(carried.items()):
+                for offset in range(0, len(carried_wards), WARD_BATCH_SIZE):
+                    aggregator.carry_forward(
+                        source_date, ward_ids=carried_wards[offset:offset + WARD_BATCH_SIZE]
+                    )
+            carried_from = max(carried, default=None)
+            
+            # Wards without a watermark are aggregated from scratch
+            changed = self.changed_wards(current, watermarks)
+            
+            ward_ids = sorted(changed)
+            for offset in range(0, len(ward_ids), WARD_BATCH_SIZE):
+                aggregator.aggregate_scope(ward_ids=ward_ids[offset:offset + WARD_BATCH_SIZE])
+            
+            aggregator.rebuild_rollups()
+            
+            # Move the watermarks of the re-aggregated wards
+            AggregationWatermark.objects.filter(ward_id__in=ward_ids).delete()
+            AggregationWatermark.objects.bulk_create([
+                AggregationWatermark(
+                    ward_id=ward_id,
+                    citizen_count=current[ward_id][0],
+                    last_updated_at=current[ward_id][1],
+                    stat_date=self.today
+                )
+                for ward_id in ward_ids if ward_id in current
+            ], batch_size=1000)
+            
+            # Unchanged wards are now current as of today too
+            AggregationWatermark.objects.exclude(ward_id__in=ward_ids).update(stat_date=self.today)
+        
+        # Record the run once its transaction has committed
+        DataAggregator(stat_date=self.today)._update_report_metadata(
+            "incremental_aggregation", start_time
+        )
+        
+        return {
+            'stat_date': self.today,
+            'carried_from': carried_from,
+            'ward_count': len(current),
+            'changed_wards': ward_ids,
+            'duration': time.perf_counter() - start,
+        }
@@ -0,0 +1,154 @@
+import resource
+import time
+import tracemalloc
+from contextlib import contextmanager
+from django.conf import settings
+from .models import AggregationRun, AggregationStageTiming
+
+# Metrics are served by django-prometheus from the default registry;
+# without prometheus_client the history table is still written
+try:
+    from prometheus_client import Counter, Gauge, Histogram
+except ImportError:
+    Counter = Gauge = Histogram = None
+
+# Stages of an aggregation call, in the order they run
+STAGES = ['query', 'frame', 'groupby', 'clear', 'percentages', 'insert', 'rollups']
+
+if Histogram is not None:
+    STAGE_SECONDS = Histogram(
+        'reporting_aggregation_stage_seconds',
+        'Time spent in each stage of an aggregation call',
+        ['run', 'stage'],
+        buckets=(0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+    )
+    STAGE_ROWS = Counter(
+        'reporting_aggregation_stage_rows',
+        'Rows handled by each stage of an aggregation call',
+        ['run', 'stage']
+    )
+    RUN_PEAK_MEMORY = Gauge(
+        'reporting_aggregation_peak_memory_bytes',
+        'Peak memory of the latest aggregation call',
+        ['run']
+    )
+
+
+class StageRecord:
+    """
+    Running totals of one stage; repeated stages (one per streamed chunk)
+    add up
+    """
+    
+    def __init__(self):
+        self.duration = 0.0
+        self.row_count = None
+        self.calls = 0
+        self.peak_memory = None
+    
+    def add_rows(self, rows):
+        """
+        Count rows handled by the stage
+        """
+        self.row_count = (self.row_count or 0) + rows
+
+
+class StageTimings:
+    """
+    Collects per-stage durations, row counts and peak memory of one
+    aggregation call
+    
+    Peak memory is the process's peak resident set size, or with
+    ``AGGREGATION_TRACE_MEMORY`` the peak of memory traced by tracemalloc
+    while the stage ran, which is exact per stage but slows the run down.
+    """
+    
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.trace_memory = getattr(settings, 'AGGREGATION_TRACE_MEMORY', False)
+        self._started_tracing = False
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+    
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a block of work under a stage name
+        
+        Yields:
+            StageRecord: The stage's running totals, to count rows on
+        """
+        record = self.stages.setdefault(name, StageRecord())
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.duration += time.perf_counter() - start
+            record.calls += 1
+            record.peak_memory = max(record.peak_memory or 0, self._peak_memory())
+    
+    def _peak_memory(self):
+        """
+        Peak memory in bytes
+        """
+        if self.trace_memory:
+            return tracemalloc.get_traced_memory()[1]
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    
+    def save(self, run_name, stat_date, state_id=None, lga_id=None, ward_count=None):
+        """
+        Store the call and its stages in the history table and export them
+        
+        Returns:
+            AggregationRun: The stored call, or None when timings are off
+        """
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        
+        if not getattr(settings, 'AGGREGATION_RECORD_TIMINGS', True):
+            return None
+        
+        stages = sorted(
+            self.stages.items(),
+            key=lambda item: STAGES.index(item[0]) if item[0] in STAGES else len(STAGES)
+        )
+        query = self.stages.get('query')
+        peaks = [record.peak_memory for _, record in stages if record.peak_memory is not None]
+        
+        run = AggregationRun.objects.create(
+            run_name=run_name,
+            stat_date=stat_date,
+            state_id=state_id,
+            lga_id=lga_id,
+            ward_count=ward_count,
+            duration=time.perf_counter() - self.start,
+            row_count=query.row_count if query else None,
+            peak_memory_bytes=max(peaks) if peaks else None
+        )
+        AggregationStageTiming.objects.bulk_create([
+            AggregationStageTiming(
+                run=run,
+                stage=name,
+                duration=record.duration,
+                row_count=record.row_count,
+                calls=record.calls,
+                peak_memory_bytes=record.peak_memory
+            )
+            for name, record in stages
+        ])
+        
+        if Histogram is not None:
+            for name, record in stages:
+                STAGE_SECONDS.labels(run_name, name).observe(record.duration)
+                if record.row_count:
+                    STAGE_ROWS.labels(run_name, name).inc(record.row_count)
+            if run.peak_memory_bytes is not None:
+                RUN_PEAK_MEMORY.labels(run_name).set(run.peak_memory_bytes)
+        
+        return run
@@ -0,0 +1,79 @@
+import importlib
+import sys
+import threading
+import types
+
+# Modules too heavy to import in every web worker. They are imported on
+# first use unless preload() is called.
+HEAVY_MODULES = ['numpy', 'pandas', 'matplotlib', 'seaborn', 'weasyprint']
+
+_import_lock = threading.Lock()
+
+class LazyModule(types.ModuleType):
+    """
+    Stand-in for a module that is imported on first attribute access
+    
+    ``pd = lazy_import('pandas')`` lets a module use ``pd.DataFrame`` as
+    usual while pandas itself is only imported when a function first
+    touches it.
+    """
+    
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+    
+    def __dir__(self):
+        return dir(self._load())
+    
+    def _load(self):
+        """
+        Import the real module, once
+        """
+        module = self.__dict__.get('_module')
+        if module is None:
+            with _import_lock:
+                module = self.__dict__.get('_module') or importlib.import_module(self.__name__)
+                self.__dict__['_module'] = module
+        return module
+    
+    def __repr__(self):
+        state = 'loaded' if '_module' in self.__dict__ else 'not loaded'
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+def lazy_import(name):
+    """
+    Get a module, or a LazyModule for it when it is not imported yet
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
+
+def preload(modules=None):
+    """
+    Import the heavy modules now
+    
+    Workers dedicated to reporting (Celery aggregation workers, chart
+    pool processes, a gunicorn pool serving only /api/reports/) call this
+    at start so their first request does not pay for the imports, e.g.
+    from gunicorn's ``post_worker_init`` hook or with REPORTING_PRELOAD.
+    
+    Args:
+        modules (list): Module names, HEAVY_MODULES by default
+    
+    Returns:
+        list: The modules that could be imported; optional ones that are
+        not installed (e.g. WeasyPrint on a reporting-only host) are skipped
+    """
+    loaded = []
+    for name in modules or HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+        loaded.append(name)
+    
+    # Chart drawing needs more than the top-level matplotlib package
+    if 'matplotlib' in loaded:
+        importlib.import_module('matplotlib.figure')
+        importlib.import_module('matplotlib.backends.backend_agg')
+    return loaded
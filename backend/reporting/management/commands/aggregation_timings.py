@@ -0,0 +1,87 @@
+import statistics
+from django.core.management.base import BaseCommand, CommandError
+from reporting.instrumentation import STAGES
+from reporting.models import AggregationRun, AggregationStageTiming
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the stage timings of the latest aggregation runs with their '
+        'history and flag the stages that regressed'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--run',
+            help='Only show this run name (e.g. demographic_aggregation)'
+        )
+        parser.add_argument(
+            '--history', type=int, default=10,
+            help='Number of earlier runs the latest run is compared with'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=1.5,
+            help='Flag stages slower than this multiple of their median'
+        )
+        parser.add_argument(
+            '--min-seconds', type=float, default=0.1,
+            help='Ignore stages faster than this in the latest run'
+        )
+    
+    def handle(self, *args, **options):
+        if options['history'] < 1:
+            raise CommandError('--history must be at least 1')
+        
+        runs = AggregationRun.objects.all()
+        if options['run']:
+            runs = runs.filter(run_name=options['run'])
+        run_names = sorted(set(runs.values_list('run_name', flat=True)))
+        
+        if not run_names:
+            self.stdout.write('No aggregation runs recorded')
+            return
+        
+        regressed = 0
+        for run_name in run_names:
+            # Compare like with like: runs of the same name and scope kind
+            latest = runs.filter(run_name=run_name).latest('created_at')
+            earlier = list(runs.filter(
+                run_name=run_name,
+                state__isnull=latest.state_id is None,
+                lga__isnull=latest.lga_id is None,
+                ward_count__isnull=latest.ward_count is None,
+                created_at__lt=latest.created_at
+            ).order_by('-created_at').values_list('run_id', flat=True)[:options['history']])
+            
+            history = {}
+            for stage, duration in AggregationStageTiming.objects.filter(
+                run_id__in=earlier
+            ).values_list('stage', 'duration'):
+                history.setdefault(stage, []).append(duration)
+            
+            self.stdout.write(
+                f"{run_name}: {latest.duration:.3f}s, {latest.row_count or 0} rows "
+                f"at {latest.created_at:%Y-%m-%d %H:%M:%S} ({len(earlier)} earlier run(s))"
+            )
+            
+            stages = sorted(
+                latest.stages.all(),
+                key=lambda timing: STAGES.index(timing.stage) if timing.stage in STAGES else len(STAGES)
+            )
+            for timing in stages:
+                line = f"  {timing.stage:<12} {timing.duration:>9.3f}s {timing.row_count or 0:>12} rows"
+                
+                durations = history.get(timing.stage)
+                if not durations:
+                    self.stdout.write(line)
+                    continue
+                
+                median = statistics.median(durations)
+                line += f"  median {median:.3f}s"
+                if timing.duration >= options['min_seconds'] and timing.duration > median * options['threshold']:
+                    regressed += 1
+                    self.stdout.write(self.style.WARNING(f"{line}  REGRESSED"))
+                else:
+                    self.stdout.write(line)
+        
+        self.stdout.write(f'{regressed} stage(s) regressed')
@@ -0,0 +1,226 @@
+import re
+import tempfile
+from datetime import datetime
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from reporting.models import CrossTabStats, LEVEL_WARD
+from reporting.crosstabs import CROSS_TABS
+from reporting.data_aggregator import DataAggregator
+from reporting.olap_cube import CubeStore, StatsCube
+from reporting.report_generator import ReportGenerator
+from reporting.star_schema import FACT_FAMILIES, FactStore, stats_queryset, export_columns
+
+# Distinct values seeded per dimension
+SEED_VALUES = 6
+
+# Wards per LGA and LGAs per state in the seeded location hierarchy
+WARDS_PER_LGA = 10
+LGAS_PER_STATE = 5
+
+
+class Command(BaseCommand):
+    help = (
+        'Run EXPLAIN ANALYZE on the stats fact queries behind reports (cube '
+        'builds, report generation and exports) and report the plans that '
+        'fall back to sequential scans'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            help='Explain the existing stats of this date (YYYY-MM-DD) instead of seeding'
+        )
+        parser.add_argument(
+            '--seed-wards', type=int, default=1000,
+            help='Number of wards in the seeded dataset'
+        )
+        parser.add_argument(
+            '--state-id', type=int, default=1,
+            help='State used for state- and LGA-scoped reports'
+        )
+        parser.add_argument(
+            '--lga-id', type=int, default=1,
+            help='LGA used for LGA-scoped reports'
+        )
+    
+    def handle(self, *args, **options):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            raise CommandError(f'EXPLAIN is not supported on {connection.vendor}')
+        
+        if options['date']:
+            try:
+                report_date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Invalid date format. Use YYYY-MM-DD.')
+        else:
+            report_date = timezone.now().date()
+        
+        # Cubes are built into a scratch directory so their reads are explained too
+        cube_directory = tempfile.TemporaryDirectory(prefix='explain-cubes-')
+        generator = ReportGenerator(CubeStore(cube_directory.name))
+        
+        # Seeded rows use made-up location ids, so they are always rolled back
+        with transaction.atomic():
+            if not options['date']:
+                self._seed(report_date, options['seed_wards'])
+            
+            flagged = 0
+            explained = 0
+            reports = self._reports(generator, report_date, options['state_id'], options['lga_id'])
+            for name, run in reports:
+                with CaptureQueriesContext(connection) as context:
+                    run()
+                
+                queries = [
+                    query['sql'] for query in context.captured_queries
+                    if query['sql'].lstrip().upper().startswith('SELECT')
+                ]
+                scans = []
+                for sql in queries:
+                    tables, plan = self._explain(sql)
+                    explained += 1
+                    if tables:
+                        flagged += 1
+                        scans.extend(table for table in tables if table not in scans)
+                        if options['verbosity'] > 1:
+                            self.stdout.write(f'    {sql}')
+                            for line in plan:
+                                self.stdout.write(f'      {line}')
+                
+                line = f"  {name:<40} {len(queries):>3} queries  "
+                if scans:
+                    self.stdout.write(self.style.WARNING(f"{line}seq scan: {', '.join(scans)}"))
+                else:
+                    self.stdout.write(f"{line}ok")
+            
+            transaction.set_rollback(True)
+        
+        cube_directory.cleanup()
+        self.stdout.write(f'{flagged} of {explained} queries use sequential scans')
+    
+    def _seed(self, report_date, ward_count):
+        """
+        Write synthetic ward facts and cross-tab cells, then roll them up
+        """
+        rng = np.random.default_rng(0)
+        facts = FactStore()
+        
+        locations = []
+        for ward_id in range(1, ward_count + 1):
+            lga_id = (ward_id - 1) // WARDS_PER_LGA + 1
+            state_id = (lga_id - 1) // LGAS_PER_STATE + 1
+            locations.append((state_id, lga_id, ward_id))
+        
+        for model in FACT_FAMILIES:
+            for field in model.dimension_fields:
+                rows = []
+                for location in locations:
+                    counts = rng.integers(1, 500, size=SEED_VALUES)
+                    for value, count in enumerate(counts):
+                        percentage = round(float(count) * 100.0 / counts.sum(), 2)
+                        rows.append((location, f'{field} {value}', int(count), percentage))
+                facts.write_ward_rows(model, field, report_date, rows)
+        
+        cells = []
+        for tab_name in CROSS_TABS:
+            for state_id, lga_id, ward_id in locations:
+                for value in range(SEED_VALUES):
+                    cells.append(CrossTabStats(
+                        stat_date=report_date,
+                        state_id=state_id,
+                        lga_id=lga_id,
+                        ward_id=ward_id,
+                        tab_name=tab_name,
+                        value_1=f'value {value}',
+                        value_2=f'value {value % 2}',
+                        count=int(rng.integers(1, 100))
+                    ))
+        CrossTabStats.objects.bulk_create(cells, batch_size=1000)
+        
+        DataAggregator(stat_date=report_date, record_metadata=False).rebuild_rollups()
+        
+        # Give the planner statistics for the freshly written rows
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        
+        self.stdout.write(f'Seeded {len(locations)} wards for {report_date}')
+    
+    def _reports(self, generator, report_date, state_id, lga_id):
+        """
+        Yield (name, callable) for every cube build, and every report and
+        export at national, state and LGA scope
+        """
+        # Reports are answered from cubes; their builds are the fact reads
+        for model, family in FACT_FAMILIES.items():
+            yield (
+                f'cube build {family}',
+                lambda model=model: StatsCube.build(model, report_date)
+            )
+        
+        scopes = [
+            ('national', {}),
+            (f'state {state_id}', {'state_id': state_id}),
+            (f'lga {lga_id}', {'state_id': state_id, 'lga_id': lga_id}),
+        ]
+        reports = [
+            ('demographic', generator.generate_demographic_report),
+            ('occupation', generator.generate_occupation_report),
+            ('healthcare', generator.generate_healthcare_report),
+            ('family', generator.generate_family_report),
+            ('interests', generator.generate_interests_report),
+        ]
+        
+        for scope_name, scope in scopes:
+            for report_name, generate in reports:
+                yield (
+                    f'{report_name} ({scope_name})',
+                    lambda generate=generate, scope=scope: generate(report_date=report_date, **scope)
+                )
+            for tab_name in CROSS_TABS:
+                yield (
+                    f'crosstab {tab_name} ({scope_name})',
+                    lambda tab_name=tab_name, scope=scope: generator.generate_crosstab_report(
+                        tab_name, report_date=report_date, **scope
+                    )
+                )
+            if 'lga_id' not in scope:
+                yield (
+                    f'executive_dashboard ({scope_name})',
+                    lambda scope=scope: generator.generate_executive_dashboard(
+                        report_date=report_date, **scope
+                    )
+                )
+            for model, family in FACT_FAMILIES.items():
+                yield (
+                    f'export {family} ({scope_name})',
+                    lambda model=model, scope=scope: list(
+                        stats_queryset(model, report_date).filter(
+                            level=LEVEL_WARD, **scope
+                        ).values_list(*export_columns(model))
+                    )
+                )
+    
+    def _explain(self, sql):
+        """
+        Get the tables a query scans sequentially, and its plan
+        """
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN ANALYZE {sql}')
+                plan = [row[0] for row in cursor.fetchall()]
+                tables = re.findall(r'Seq Scan on (\w+)', '\n'.join(plan))
+            else:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = [row[-1] for row in cursor.fetchall()]
+                tables = [
+                    match.group(1) for match in (
+                        re.match(r'SCAN (?:TABLE )?(\w+)', line) for line in plan
+                    )
+                    if match and 'USING' not in match.string
+                ]
+        
+        return list(dict.fromkeys(tables)), plan
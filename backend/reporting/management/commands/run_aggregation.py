@@ -0,0 +1,103 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from reporting.incremental_aggregator import IncrementalAggregator
+from reporting.parallel_aggregator import ParallelAggregator
+
+
+class Command(BaseCommand):
+    help = 'Aggregate citizen data for reporting, partitioned by state/LGA across worker processes'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Number of worker processes (1 runs every partition in-process)'
+        )
+        parser.add_argument(
+            '--state-id', type=int,
+            help='Only aggregate this state'
+        )
+        parser.add_argument(
+            '--max-retries', type=int, default=2,
+            help='Times a failed partition is retried before giving up'
+        )
+        parser.add_argument(
+            '--lga-threshold', type=int, default=500000,
+            help='States with more citizens than this are split into one partition per LGA'
+        )
+        parser.add_argument(
+            '--memory-target-mb', type=int,
+            help='Stream citizens in chunks sized to keep each worker near this much memory'
+        )
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Only re-aggregate wards whose citizens changed since the last run'
+        )
+    
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        
+        if options['incremental']:
+            if options['state_id']:
+                raise CommandError('--incremental always covers every state')
+            self._run_incremental(options)
+            return
+        
+        aggregator = ParallelAggregator(
+            workers=options['workers'],
+            max_retries=options['max_retries'],
+            lga_split_threshold=options['lga_threshold'],
+            memory_target_mb=options['memory_target_mb']
+        )
+        
+        self.stdout.write(f"Aggregating for {aggregator.today} with {options['workers']} worker(s)")
+        
+        summary = aggregator.run(
+            state_id=options['state_id'],
+            on_partition_done=self._report_partition
+        )
+        
+        self.stdout.write(
+            f"{len(summary['partitions'])} partition(s), {summary['citizen_count']} citizens "
+            f"in {summary['duration']:.1f}s"
+        )
+        
+        if summary['failed']:
+            raise CommandError(f"{len(summary['failed'])} partition(s) failed after retries")
+        
+        self.stdout.write(self.style.SUCCESS('Data aggregation completed successfully'))
+    
+    def _run_incremental(self, options):
+        """
+        Re-aggregate the wards that changed since the last run
+        """
+        aggregator = IncrementalAggregator(memory_target_mb=options['memory_target_mb'])
+        self.stdout.write(f"Incrementally aggregating for {aggregator.today}")
+        
+        summary = aggregator.run()
+        
+        if summary['carried_from']:
+            self.stdout.write(f"Carried ward stats forward from {summary['carried_from']}")
+        self.stdout.write(
+            f"Re-aggregated {len(summary['changed_wards'])} of {summary['ward_count']} wards "
+            f"in {summary['duration']:.1f}s"
+        )
+        self.stdout.write(self.style.SUCCESS('Data aggregation completed successfully'))
+    
+    def _report_partition(self, result):
+        """
+        Print the timing line for a finished partition
+        """
+        scope = f"state {result['state_id']}"
+        if result['lga_id']:
+            scope += f" / LGA {result['lga_id']}"
+        
+        line = (
+            f"  {scope:<24} {result['citizen_count']:>10} citizens "
+            f"{result['duration']:>8.2f}s  attempt {result['attempts']}"
+        )
+        
+        if result['success']:
+            self.stdout.write(line)
+        else:
+            self.stdout.write(self.style.ERROR(f"{line}  FAILED: {result['error']}"))
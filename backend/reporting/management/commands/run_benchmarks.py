@@ -0,0 +1,120 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from reporting.benchmarks import BenchmarkSuite, compare_to_baseline
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark worker startup, ID generation, ID cards, aggregation, reports, charts, '
+        'CSV export and the citizen API against synthetic populations, optionally comparing '
+        'with a baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales', default='10000',
+            help='Comma-separated numbers of citizens to benchmark with (e.g. 10000,1000000)'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Timed runs per benchmark'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=1,
+            help='Untimed runs per benchmark before timing'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Seed of the synthetic population'
+        )
+        parser.add_argument(
+            '--only', action='append',
+            help='Only run benchmarks matching this pattern (e.g. "aggregate.*"); repeatable'
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the results as JSON to this file'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Compare with results stored in this JSON file'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Fail when a median is this fraction slower than the baseline'
+        )
+        parser.add_argument(
+            '--save-baseline',
+            help='Store the results as the new baseline in this JSON file'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            scales = [int(scale) for scale in options['scales'].split(',') if scale.strip()]
+        except ValueError:
+            raise CommandError('--scales must be comma-separated integers')
+        if not scales or min(scales) < 1:
+            raise CommandError('--scales must list at least one positive number')
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read baseline {options['baseline']}: {e}")
+
+        suite = BenchmarkSuite(
+            repeat=options['repeat'],
+            warmup=options['warmup'],
+            seed=options['seed'],
+            only=options['only']
+        )
+        if not suite.cases():
+            raise CommandError('No benchmarks match --only')
+
+        results = suite.run(scales, on_result=self._report_result)
+
+        for path in [options['output'], options['save_baseline']]:
+            if path:
+                with open(path, 'w') as f:
+                    json.dump(results, f, indent=2)
+
+        failed = [
+            (scale, name) for scale, scale_results in results['scales'].items()
+            for name, result in scale_results.items() if result['status'] == 'error'
+        ]
+
+        regressions = []
+        if baseline:
+            regressions = compare_to_baseline(results, baseline, options['threshold'])
+            for scale, name, previous, median, ratio in regressions:
+                self.stdout.write(self.style.ERROR(
+                    f"  REGRESSION {name} at {scale}: {previous * 1000:.3f}ms -> {median * 1000:.3f}ms "
+                    f"({ratio:.2f}x)"
+                ))
+
+        if failed or regressions:
+            raise CommandError(f'{len(failed)} benchmark(s) failed, {len(regressions)} regressed')
+
+        self.stdout.write(self.style.SUCCESS('Benchmarks completed'))
+
+    def _report_result(self, scale, name, result):
+        """
+        Print the line of a finished benchmark
+        """
+        line = f"  {scale:>10}  {name:<36}"
+        if result['status'] == 'ok':
+            line += f" {result['median'] * 1000:>10.3f}ms median  {result['p95'] * 1000:>10.3f}ms p95"
+            if 'bytes' in result:
+                line += f"  {result['bytes']:>10} bytes"
+            if 'import_seconds' in result:
+                heavy = ', '.join(result['heavy_modules']) or 'none'
+                line += f"  {result['import_seconds']:.3f}s importing (heavy modules: {heavy})"
+            self.stdout.write(line)
+        elif result['status'] == 'skipped':
+            self.stdout.write(self.style.WARNING(f"{line} skipped: {result['reason']}"))
+        else:
+            self.stdout.write(self.style.ERROR(f"{line} error: {result['reason']}"))
@@ -1,5 +1,19 @@
 from django.db import models
 
+# Aggregation level of a stats row. Rows above ward level are pre-rolled
+# sums with the location foreign keys below their level left NULL.
+LEVEL_WARD = 'ward'
+LEVEL_LGA = 'lga'
+LEVEL_STATE = 'state'
+LEVEL_NATIONAL = 'national'
+
+STAT_LEVEL_CHOICES = [
+    (LEVEL_WARD, 'Ward'),
+    (LEVEL_LGA, 'Local Government Area'),
+    (LEVEL_STATE, 'State'),
+    (LEVEL_NATIONAL, 'National'),
+]
+
 class DemographicStats(models.Model):
     """
     Stores aggregated demographic statistics
@@ -9,6 +23,7 @@ class DemographicStats(models.Model):
     state = models.ForeignKey('location.State', on_delete=models.CASCADE, null=True)
     lga = models.ForeignKey('location.LocalGovernmentArea', on_delete=models.CASCADE, null=True)
     ward = models.ForeignKey('location.Ward', on_delete=models.CASCADE, null=True)
+    level = models.CharField(max_length=10, choices=STAT_LEVEL_CHOICES, default=LEVEL_WARD)
     age_group = models.CharField(max_length=20, null=True, blank=True)
     gender = models.CharField(max_length=10, null=True, blank=True)
     education_level = models.CharField(max_length=50, null=True, blank=True)
@@ -19,9 +34,13 @@ class DemographicStats(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Columns holding the single dimension value of each row
+    dimension_fields = ['age_group', 'gender', 'education_level', 'religion', 'ethnicity']
+    
     class Meta:
         indexes = [
             models.Index(fields=['stat_date']),
+            models.Index(fields=['stat_date', 'level']),
             models.Index(fields=['state']),
             models.Index(fields=['lga']),
             models.Index(fields=['ward']),
@@ -39,6 +58,7 @@ class OccupationStats(models.Model):
     state = models.ForeignKey('location.State', on_delete=models.CASCADE, null=True)
     lga = models.ForeignKey('location.LocalGovernmentArea', on_delete=models.CASCADE, null=True)
     ward = models.ForeignKey('location.Ward', on_delete=models.CASCADE, null=True)
+    level = models.CharField(max_length=10, choices=STAT_LEVEL_CHOICES, default=LEVEL_WARD)
     occupation_sector = models.CharField(max_length=100, null=True, blank=True)
     employment_status = models.CharField(max_length=50, null=True, blank=True)
     income_level = models.CharField(max_length=50, null=True, blank=True)
@@ -48,9 +68,13 @@ class OccupationStats(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Columns holding the single dimension value of each row
+    dimension_fields = ['occupation_sector', 'employment_status', 'income_level', 'qualification_level']
+    
     class Meta:
         indexes = [
             models.Index(fields=['stat_date']),
+            models.Index(fields=['stat_date', 'level']),
             models.Index(fields=['state']),
             models.Index(fields=['lga']),
             models.Index(fields=['ward']),
@@ -68,6 +92,7 @@ class HealthcareStats(models.Model):
     state = models.ForeignKey('location.State', on_delete=models.CASCADE, null=True)
     lga = models.ForeignKey('location.LocalGovernmentArea', on_delete=models.CASCADE, null=True)
     ward = models.ForeignKey('location.Ward', on_delete=models.CASCADE, null=True)
+    level = models.CharField(max_length=10, choices=STAT_LEVEL_CHOICES, default=LEVEL_WARD)
     health_condition = models.CharField(max_length=100, null=True, blank=True)
     disability_type = models.CharField(max_length=100, null=True, blank=True)
     blood_group = models.CharField(max_length=10, null=True, blank=True)
@@ -77,9 +102,13 @@ class HealthcareStats(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Columns holding the single dimension value of each row
+    dimension_fields = ['health_condition', 'disability_type', 'blood_group', 'immunization_status']
+    
     class Meta:
         indexes = [
             models.Index(fields=['stat_date']),
+            models.Index(fields=['stat_date', 'level']),
             models.Index(fields=['state']),
             models.Index(fields=['lga']),
             models.Index(fields=['ward']),
@@ -97,6 +126,7 @@ class FamilyStats(models.Model):
     state = models.ForeignKey('location.State', on_delete=models.CASCADE, null=True)
     lga = models.ForeignKey('location.LocalGovernmentArea', on_delete=models.CASCADE, null=True)
     ward = models.ForeignKey('location.Ward', on_delete=models.CASCADE, null=True)
+    level = models.CharField(max_length=10, choices=STAT_LEVEL_CHOICES, default=LEVEL_WARD)
     household_size = models.CharField(max_length=20, null=True, blank=True)
     marital_status = models.CharField(max_length=50, null=True, blank=True)
     children_count = models.CharField(max_length=20, null=True, blank=True)
@@ -106,9 +136,13 @@ class FamilyStats(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Columns holding the single dimension value of each row
+    dimension_fields = ['household_size', 'marital_status', 'children_count', 'family_type']
+    
     class Meta:
         indexes = [
             models.Index(fields=['stat_date']),
+            models.Index(fields=['stat_date', 'level']),
             models.Index(fields=['state']),
             models.Index(fields=['lga']),
             models.Index(fields=['ward']),
@@ -126,6 +160,7 @@ class InterestStats(models.Model):
     state = models.ForeignKey('location.State', on_delete=models.CASCADE, null=True)
     lga = models.ForeignKey('location.LocalGovernmentArea', on_delete=models.CASCADE, null=True)
     ward = models.ForeignKey('location.Ward', on_delete=models.CASCADE, null=True)
+    level = models.CharField(max_length=10, choices=STAT_LEVEL_CHOICES, default=LEVEL_WARD)
     interest_type = models.CharField(max_length=100, null=True, blank=True)
     sport_name = models.CharField(max_length=100, null=True, blank=True)
     cultural_activity = models.CharField(max_length=100, null=True, blank=True)
@@ -134,9 +169,13 @@ class InterestStats(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Columns holding the single dimension value of each row
+    dimension_fields = ['interest_type', 'sport_name', 'cultural_activity']
+    
     class Meta:
         indexes = [
             models.Index(fields=['stat_date']),
+            models.Index(fields=['stat_date', 'level']),
             models.Index(fields=['state']),
             models.Index(fields=['lga']),
             models.Index(fields=['ward']),
@@ -145,6 +184,298 @@ class InterestStats(models.Model):
     def __str__(self):
         return f"Interest Stats {self.stat_date} - {self.state or 'All'} - {self.lga or 'All'}"
 
+class CrossTabStats(models.Model):
+    """
+    Stores aggregated counts over combinations of two or three dimensions
+    """
+    stat_id = models.AutoField(primary_key=True)
+    stat_date = models.DateField()
+    state = models.ForeignKey('location.State', on_delete=models.CASCADE, null=True)
+    lga = models.ForeignKey('location.LocalGovernmentArea', on_delete=models.CASCADE, null=True)
+    ward = models.ForeignKey('location.Ward', on_delete=models.CASCADE, null=True)
+    level = models.CharField(max_length=10, choices=STAT_LEVEL_CHOICES, default=LEVEL_WARD)
+    tab_name = models.CharField(max_length=50)
+    value_1 = models.CharField(max_length=100)
+    value_2 = models.CharField(max_length=100)
+    value_3 = models.CharField(max_length=100, null=True, blank=True)
+    count = models.IntegerField()
+    percentage = models.DecimalField(max_digits=5, decimal_places=2, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    # Columns identifying one cell of a cross-tab; rolled up together
+    dimension_fields = ['tab_name', 'value_1', 'value_2', 'value_3']
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['stat_date', 'tab_name', 'level', 'state', 'lga'],
+                include=['value_1', 'value_2', 'value_3', 'count'],
+                name='crosstab_report_idx'
+            ),
+            models.Index(fields=['state']),
+            models.Index(fields=['lga']),
+            models.Index(fields=['ward']),
+        ]
+        
+    def __str__(self):
+        return f"Cross-tab {self.tab_name} {self.stat_date} - {self.state or 'All'} - {self.lga or 'All'}"
+
+class HouseholdStats(models.Model):
+    """
+    Stores the number of households and of their members, from which mean
+    household sizes are computed at any level
+    """
+    stat_id = models.AutoField(primary_key=True)
+    stat_date = models.DateField()
+    state = models.ForeignKey('location.State', on_delete=models.CASCADE, null=True)
+    lga = models.ForeignKey('location.LocalGovernmentArea', on_delete=models.CASCADE, null=True)
+    ward = models.ForeignKey('location.Ward', on_delete=models.CASCADE, null=True)
+    level = models.CharField(max_length=10, choices=STAT_LEVEL_CHOICES, default=LEVEL_WARD)
+    household_count = models.IntegerField()
+    member_count = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['stat_date', 'level', 'state', 'lga']),
+            models.Index(fields=['ward']),
+        ]
+        
+    def __str__(self):
+        return f"Household Stats {self.stat_date} - {self.state or 'All'} - {self.lga or 'All'}"
+
+class StatDimension(models.Model):
+    """
+    Dimension of a stats family, e.g. demographic gender
+    """
+    dimension_id = models.AutoField(primary_key=True)
+    family = models.CharField(max_length=20)
+    field = models.CharField(max_length=50)
+    
+    class Meta:
+        unique_together = [('family', 'field')]
+        
+    def __str__(self):
+        return f"{self.family}.{self.field}"
+
+class StatValue(models.Model):
+    """
+    Value of a stats dimension, e.g. Female
+    """
+    value_id = models.AutoField(primary_key=True)
+    dimension = models.ForeignKey(StatDimension, on_delete=models.CASCADE, related_name='values')
+    value = models.CharField(max_length=100)
+    
+    class Meta:
+        unique_together = [('dimension', 'value')]
+        
+    def __str__(self):
+        return f"{self.dimension} = {self.value}"
+
+class StatLocation(models.Model):
+    """
+    Ward, LGA, state or the nation, as the location of stats facts
+    """
+    location_id = models.AutoField(primary_key=True)
+    level = models.CharField(max_length=10, choices=STAT_LEVEL_CHOICES)
+    state = models.ForeignKey('location.State', on_delete=models.CASCADE, null=True)
+    lga = models.ForeignKey('location.LocalGovernmentArea', on_delete=models.CASCADE, null=True)
+    ward = models.ForeignKey('location.Ward', on_delete=models.CASCADE, null=True)
+    # "<level>:<state>:<lga>:<ward>", unique where the nullable ids cannot be
+    location_key = models.CharField(max_length=50, unique=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['level', 'state', 'lga']),
+        ]
+        
+    def __str__(self):
+        return self.location_key
+
+class StatFact(models.Model):
+    """
+    Stores one aggregated count per date, location, dimension and value
+    """
+    fact_id = models.AutoField(primary_key=True)
+    stat_date = models.DateField()
+    level = models.CharField(max_length=10, choices=STAT_LEVEL_CHOICES, default=LEVEL_WARD)
+    location = models.ForeignKey(StatLocation, on_delete=models.CASCADE, related_name='facts')
+    dimension = models.ForeignKey(StatDimension, on_delete=models.CASCADE, related_name='facts')
+    value = models.ForeignKey(StatValue, on_delete=models.CASCADE, related_name='facts')
+    count = models.IntegerField()
+    percentage = models.DecimalField(max_digits=5, decimal_places=2, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            # Rollups, exports and clears filter on the key columns and
+            # read the rest from the index alone (INCLUDE is applied on
+            # PostgreSQL)
+            models.Index(
+                fields=['stat_date', 'level', 'dimension', 'location'],
+                include=['value', 'count', 'percentage'],
+                name='stat_fact_report_idx'
+            ),
+            # Cube builds read a family's facts of every level for a date
+            models.Index(
+                fields=['stat_date', 'dimension'],
+                include=['level', 'location', 'value', 'count', 'percentage'],
+                name='stat_fact_cube_idx'
+            ),
+            # Incremental runs look for the latest date with ward facts
+            models.Index(
+                fields=['-stat_date'],
+                condition=models.Q(level=LEVEL_WARD),
+                name='stat_fact_ward_date_idx'
+            ),
+        ]
+        
+    def __str__(self):
+        return f"Stat Fact {self.stat_date} - {self.location} - {self.value}"
+
+class StatsVersion(models.Model):
+    """
+    Stores the version of a date's stats, replaced whenever aggregation
+    writes the date's rollups
+    
+    Report cubes are keyed on it, so checking a cube is current is one
+    primary key lookup rather than a scan of the date's stats.
+    """
+    stat_date = models.DateField(primary_key=True)
+    version = models.CharField(max_length=32)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Stats Version {self.stat_date} - {self.version}"
+
+class AggregationWatermark(models.Model):
+    """
+    Stores the state of a ward's citizens when its stats were last aggregated
+    """
+    watermark_id = models.AutoField(primary_key=True)
+    ward = models.OneToOneField('location.Ward', on_delete=models.CASCADE, related_name='aggregation_watermark')
+    citizen_count = models.IntegerField()
+    last_updated_at = models.DateTimeField(null=True)
+    stat_date = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Watermark {self.ward_id} - {self.citizen_count} citizens at {self.last_updated_at}"
+
+# Lifecycle of a background aggregation job
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+
+JOB_STATUS_CHOICES = [
+    (JOB_QUEUED, 'Queued'),
+    (JOB_RUNNING, 'Running'),
+    (JOB_COMPLETED, 'Completed'),
+    (JOB_FAILED, 'Failed'),
+]
+
+class AggregationJob(models.Model):
+    """
+    Stores a background aggregation run and its progress
+    """
+    job_id = models.AutoField(primary_key=True)
+    state = models.ForeignKey('location.State', on_delete=models.CASCADE, null=True, blank=True)
+    lga = models.ForeignKey('location.LocalGovernmentArea', on_delete=models.CASCADE, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=JOB_STATUS_CHOICES, default=JOB_QUEUED)
+    runner = models.CharField(max_length=10, null=True, blank=True)  # celery or thread
+    submitted_by = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, blank=True)
+    submission_count = models.IntegerField(default=1)
+    stage = models.CharField(max_length=20, null=True, blank=True)
+    progress = models.JSONField(default=dict)
+    error = models.TextField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'state', 'lga']),
+        ]
+        
+    def __str__(self):
+        return f"Aggregation Job {self.job_id} - {self.status}"
+
+class AggregationRun(models.Model):
+    """
+    Stores the timing of one aggregation call; rows are never overwritten
+    """
+    run_id = models.AutoField(primary_key=True)
+    run_name = models.CharField(max_length=100)
+    stat_date = models.DateField()
+    state = models.ForeignKey('location.State', on_delete=models.CASCADE, null=True, blank=True)
+    lga = models.ForeignKey('location.LocalGovernmentArea', on_delete=models.CASCADE, null=True, blank=True)
+    ward_count = models.IntegerField(null=True, blank=True)  # for ward-scoped runs
+    duration = models.FloatField()  # in seconds
+    row_count = models.BigIntegerField(null=True, blank=True)  # citizen rows read
+    peak_memory_bytes = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['run_name', 'created_at']),
+        ]
+        
+    def __str__(self):
+        return f"Aggregation Run {self.run_name} - {self.created_at}"
+
+class AggregationStageTiming(models.Model):
+    """
+    Stores the time, rows and peak memory of one stage of an aggregation run
+    """
+    timing_id = models.AutoField(primary_key=True)
+    run = models.ForeignKey(AggregationRun, on_delete=models.CASCADE, related_name='stages')
+    stage = models.CharField(max_length=20)
+    duration = models.FloatField()  # in seconds
+    row_count = models.BigIntegerField(null=True, blank=True)
+    calls = models.IntegerField(default=1)  # once per streamed chunk
+    peak_memory_bytes = models.BigIntegerField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Stage Timing {self.run_id} - {self.stage}"
+
+class DashboardSnapshot(models.Model):
+    """
+    Stores the executive dashboard's figures for one date, nationally or
+    for one state
+    
+    Written at the end of each aggregation run, so the dashboard and its
+    trend sparklines are one indexed read.
+    """
+    snapshot_id = models.AutoField(primary_key=True)
+    stat_date = models.DateField()
+    level = models.CharField(max_length=10, choices=STAT_LEVEL_CHOICES, default=LEVEL_NATIONAL)
+    state = models.ForeignKey('location.State', on_delete=models.CASCADE, null=True, blank=True)
+    total_population = models.BigIntegerField(default=0)
+    employed_count = models.BigIntegerField(default=0)
+    unemployed_count = models.BigIntegerField(default=0)
+    avg_household_size = models.FloatField(default=0)
+    # Chart data, as the rows of CubeSlice.totals()
+    health_conditions = models.JSONField(default=list)  # top 5
+    age_distribution = models.JSONField(default=list)
+    education_levels = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            # A scope's latest snapshots, newest first
+            models.Index(fields=['level', 'state', '-stat_date'], name='dashboard_snapshot_idx'),
+        ]
+        
+    def __str__(self):
+        return f"Dashboard Snapshot {self.stat_date} - {self.state_id or 'National'}"
+
 class ReportMetadata(models.Model):
     """
     Stores metadata about generated reports
@@ -153,7 +484,7 @@ class ReportMetadata(models.Model):
     report_name = models.CharField(max_length=100)
     report_description = models.TextField(null=True, blank=True)
     last_generated = models.DateTimeField()
-    generation_duration = models.IntegerField(null=True, blank=True)  # in seconds
+    generation_duration = models.FloatField(null=True, blank=True)  # in seconds
     is_cached = models.BooleanField(default=False)
     cache_expiry = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -177,3 +508,6 @@ class CustomReport(models.Model):
     
     def __str__(self):
         return self.report_name
+
+# Keep incremental aggregation watermarks moving on related record edits
+from . import signals  # noqa: E402,F401
@@ -0,0 +1,347 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from django.conf import settings
+from .lazy_imports import lazy_import
+from .models import StatsVersion, LEVEL_WARD, LEVEL_LGA, LEVEL_STATE, LEVEL_NATIONAL
+from .star_schema import stats_queryset
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Level codes stored in the first location column
+CUBE_LEVELS = [LEVEL_WARD, LEVEL_LGA, LEVEL_STATE, LEVEL_NATIONAL]
+
+# Location columns of a cube: level code, then state, LGA and ward ids
+# with -1 standing in for NULL
+LOCATION_FIELDS = ['level', 'state_id', 'lga_id', 'ward_id']
+
+# Planes of each dimension array
+COUNT, PERCENTAGE_SUM, PERCENTAGE_ROWS = range(3)
+
+# Cubes loaded by this process, keyed by (model label, stat date), least
+# recently used first
+_loaded_cubes = OrderedDict()
+_loaded_lock = threading.Lock()
+
+class StatsCube:
+    """
+    One stats family's rows for one date as dense NumPy arrays
+    
+    ``locations`` holds one row per distinct (level, state, lga, ward) and
+    each dimension holds a (3, locations, values) float64 array of summed
+    counts, summed percentages and the number of rows with a percentage,
+    so any report section is a sum over a set of location rows.
+    """
+    
+    def __init__(self, locations, values, arrays):
+        self.locations = locations
+        self.values = values
+        self.arrays = arrays
+    
+    @classmethod
+    def build(cls, model, stat_date):
+        """
+        Build a cube from the stats table
+        
+        Args:
+            model: Stats model with ``dimension_fields``
+            stat_date (date): Date of the stats rows
+        
+        Returns:
+            StatsCube: Cube of every level's rows for the date
+        """
+        dimensions = model.dimension_fields
+        rows = stats_queryset(model, stat_date).values_list(
+            *LOCATION_FIELDS, *dimensions, 'count', 'percentage'
+        )
+        df = pd.DataFrame.from_records(
+            rows, columns=LOCATION_FIELDS + dimensions + ['count', 'percentage']
+        )
+        
+        # Number the distinct locations
+        df['level'] = df['level'].map({level: code for code, level in enumerate(CUBE_LEVELS)})
+        df[LOCATION_FIELDS] = df[LOCATION_FIELDS].fillna(-1).astype(np.int64)
+        location_index = df.groupby(LOCATION_FIELDS, sort=True).ngroup().to_numpy()
+        locations = df[LOCATION_FIELDS].drop_duplicates().sort_values(LOCATION_FIELDS).to_numpy()
+        
+        percentage = pd.to_numeric(df['percentage'], errors='coerce').to_numpy(dtype=np.float64)
+        has_percentage = ~np.isnan(percentage)
+        counts = df['count'].to_numpy(dtype=np.float64)
+        
+        values = {}
+        arrays = {}
+        for dimension in dimensions:
+            present = df[dimension].notna().to_numpy()
+            codes, uniques = pd.factorize(df[dimension][present], sort=True)
+            
+            # Sum each plane into (location, value) cells in one pass
+            cells = location_index[present] * len(uniques) + codes
+            size = len(locations) * len(uniques)
+            planes = [
+                np.bincount(cells, weights=counts[present], minlength=size),
+                np.bincount(cells, weights=np.nan_to_num(percentage[present]), minlength=size),
+                np.bincount(cells, weights=has_percentage[present], minlength=size),
+            ]
+            
+            values[dimension] = [str(value) for value in uniques]
+            arrays[dimension] = np.stack(planes).reshape(3, len(locations), len(uniques))
+        
+        return cls(locations, values, arrays)
+    
+    def save(self, directory):
+        """
+        Write the cube's arrays and vocabulary to a directory
+        """
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'locations.npy'), self.locations)
+        for dimension, array in self.arrays.items():
+            np.save(os.path.join(directory, f'{dimension}.npy'), array)
+        with open(os.path.join(directory, 'values.json'), 'w') as f:
+            json.dump(self.values, f)
+    
+    @classmethod
+    def load(cls, directory):
+        """
+        Memory-map a cube written by save()
+        """
+        with open(os.path.join(directory, 'values.json')) as f:
+            values = json.load(f)
+        locations = np.load(os.path.join(directory, 'locations.npy'), mmap_mode='r')
+        arrays = {
+            dimension: np.load(os.path.join(directory, f'{dimension}.npy'), mmap_mode='r')
+            for dimension in values
+        }
+        return cls(locations, values, arrays)
+    
+    def slice(self, state_id=None, lga_id=None):
+        """
+        Select the location rows answering a report scope
+        
+        Uses the rollup level matching the scope, falling back to the ward
+        rows when the date has no rollups.
+        
+        Args:
+            state_id (int): State filter
+            lga_id (int): LGA filter
+        
+        Returns:
+            CubeSlice: Slice over the selected locations
+        """
+        if lga_id:
+            level = LEVEL_LGA
+        elif state_id:
+            level = LEVEL_STATE
+        else:
+            level = LEVEL_NATIONAL
+        
+        in_scope = np.ones(len(self.locations), dtype=bool)
+        if state_id:
+            in_scope &= self.locations[:, 1] == int(state_id)
+        if lga_id:
+            in_scope &= self.locations[:, 2] == int(lga_id)
+        
+        at_level = in_scope & (self.locations[:, 0] == CUBE_LEVELS.index(level))
+        if not at_level.any():
+            at_level = in_scope & (self.locations[:, 0] == CUBE_LEVELS.index(LEVEL_WARD))
+        
+        return CubeSlice(self, np.flatnonzero(at_level))
+    
+    def state_ids(self):
+        """
+        Get the ids of the states the cube has rows for
+        """
+        states = self.locations[:, 1]
+        return [int(state_id) for state_id in np.unique(states[states >= 0])]
+
+class CubeSlice:
+    """
+    Set of cube locations that report sections are summed over
+    """
+    
+    def __init__(self, cube, rows):
+        self.cube = cube
+        self.rows = rows
+    
+    def exists(self):
+        """
+        Check whether the slice holds any stats
+        """
+        return len(self.rows) > 0
+    
+    def totals(self, dimension, order_by='-total'):
+        """
+        Sum the slice per value of a dimension
+        
+        Args:
+            dimension (str): Dimension field
+            order_by (str): '-total' for largest first, or the dimension
+                name to sort by value
+        
+        Returns:
+            list: Dicts with the value under ``dimension``, ``total`` and
+            ``avg_percentage``, like a values().annotate() queryset
+        """
+        if not self.exists():
+            return []
+        
+        planes = self.cube.arrays[dimension][:, self.rows, :].sum(axis=1)
+        results = []
+        for index, value in enumerate(self.cube.values[dimension]):
+            rows = planes[PERCENTAGE_ROWS, index]
+            if not rows and not planes[COUNT, index]:
+                continue
+            results.append({
+                dimension: value,
+                'total': int(planes[COUNT, index]),
+                'avg_percentage': round(planes[PERCENTAGE_SUM, index] / rows, 2) if rows else None,
+            })
+        
+        if order_by == '-total':
+            results.sort(key=lambda row: (-row['total'], row[dimension]))
+        else:
+            results.sort(key=lambda row: row[order_by])
+        return results
+    
+    def total(self, dimension, value=None):
+        """
+        Sum the slice over one value of a dimension, or over all its values
+        """
+        if not self.exists():
+            return 0
+        
+        counts = self.cube.arrays[dimension][COUNT, self.rows, :]
+        if value is None:
+            return int(counts.sum())
+        if value not in self.cube.values[dimension]:
+            return 0
+        return int(counts[:, self.cube.values[dimension].index(value)].sum())
+
+class CubeStore:
+    """
+    Builds, stores and memory-maps stats cubes
+    
+    Cubes are written once per version of a date's stats rows under
+    ``REPORT_CUBE_DIR`` so every worker process maps the same files. Each
+    process keeps the ``REPORT_CUBE_CACHE_SIZE`` cubes it used last.
+    """
+    
+    def __init__(self, directory=None):
+        self.directory = directory or getattr(
+            settings, 'REPORT_CUBE_DIR', os.path.join(tempfile.gettempdir(), 'report_cubes')
+        )
+        self.cache_size = getattr(settings, 'REPORT_CUBE_CACHE_SIZE', 16)
+    
+    def slice(self, model, stat_date, state_id=None, lga_id=None):
+        """
+        Get the cube slice for a report scope
+        
+        Returns:
+            CubeSlice: Slice, empty when the date has no stats
+        """
+        cube = self.get(model, stat_date)
+        if cube is None:
+            return CubeSlice(None, np.empty(0, dtype=np.int64))
+        return cube.slice(state_id, lga_id)
+    
+    def get(self, model, stat_date):
+        """
+        Get the current cube for a stats model and date
+        
+        Returns:
+            StatsCube: Cube, or None when the date has no stats
+        """
+        version = self._version(stat_date)
+        if version is None:
+            return None
+        
+        key = (model._meta.label, stat_date)
+        with _loaded_lock:
+            loaded = _loaded_cubes.get(key)
+        if loaded and loaded[0] == version:
+            self._remember(key, loaded)
+            return loaded[1]
+        
+        path = self._path(model, stat_date, version)
+        if os.path.exists(os.path.join(path, 'values.json')):
+            cube = StatsCube.load(path)
+        else:
+            cube = StatsCube.build(model, stat_date)
+            
+            # Dates without stats are remembered, but not published
+            if len(cube.locations):
+                self._publish(cube, path)
+                cube = StatsCube.load(path)
+            else:
+                cube = None
+        
+        self._remember(key, (version, cube))
+        return cube
+    
+    def _version(self, stat_date):
+        """
+        Get the version of a date's stats
+        
+        Only aggregation writes versions, through bump_stats_version(), so
+        reads never insert rows.
+        
+        Returns:
+            str: Version, or None when the date was never aggregated
+        """
+        return StatsVersion.objects.filter(stat_date=stat_date).values_list('version', flat=True).first()
+    
+    def _remember(self, key, loaded):
+        """
+        Keep a loaded cube, forgetting the least recently used beyond
+        the cache size
+        """
+        with _loaded_lock:
+            _loaded_cubes[key] = loaded
+            _loaded_cubes.move_to_end(key)
+            while len(_loaded_cubes) > self.cache_size:
+                _loaded_cubes.popitem(last=False)
+    
+    def _path(self, model, stat_date, version):
+        """
+        Directory of one version of a cube
+        """
+        return os.path.join(
+            self.directory, model._meta.model_name, stat_date.isoformat(), version
+        )
+    
+    def _publish(self, cube, path):
+        """
+        Write a cube next to its final path and move it into place
+        """
+        parent = os.path.dirname(path)
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=parent, prefix='.building-')
+        cube.save(staging)
+        
+        try:
+            os.rename(staging, path)
+        except OSError:
+            # Another process published this version first
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        
+        # Older versions of the date are no longer served; processes that
+        # still map them keep their pages until they reload
+        for name in os.listdir(parent):
+            if name != os.path.basename(path) and not name.startswith('.'):
+                shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+def bump_stats_version(stat_date):
+    """
+    Give a date's stats a new version, so its cubes are rebuilt
+    
+    The aggregator calls this in the transaction writing the date's
+    rollups, so the new cubes are only read once the rows are committed.
+    """
+    StatsVersion.objects.update_or_create(
+        stat_date=stat_date, defaults={'version': uuid.uuid4().hex}
+    )
@@ -0,0 +1,214 @@
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import django
+from django import db
+from django.apps import apps
+from django.db.models import Count
+from django.utils import timezone
+from citizen.models import Citizen
+from .data_aggregator import DataAggregator
+
+# A unit of aggregation work: one whole state, or one LGA of a large state
+AggregationPartition = namedtuple(
+    'AggregationPartition', ['state_id', 'lga_id', 'citizen_count']
+)
+
+
+def _init_worker():
+    """
+    Prepare a freshly started worker process
+    """
+    # Spawned workers start without Django configured
+    if not apps.ready:
+        django.setup()
+    
+    # Never reuse a connection inherited from the parent process
+    db.connections.close_all()
+
+
+def _aggregate_partition(partition, stat_date, memory_target_mb=None):
+    """
+    Aggregate a single partition and report how long it took
+    """
+    start = time.perf_counter()
+    try:
+        aggregator = DataAggregator(
+            stat_date=stat_date,
+            record_metadata=False,
+            memory_target_mb=memory_target_mb,
+            write_rollups=False
+        )
+        aggregator.aggregate_scope(
+            state_id=partition.state_id,
+            lga_id=partition.lga_id
+        )
+    finally:
+        db.connections.close_all()
+    
+    return time.perf_counter() - start
+
+
+class ParallelAggregator:
+    """
+    Runs DataAggregator over state/LGA partitions in a pool of worker processes
+    """
+    
+    def __init__(self, workers=None, max_retries=2, lga_split_threshold=500000,
+                 stat_date=None, memory_target_mb=None):
+        self.workers = workers
+        self.max_retries = max_retries
+        self.lga_split_threshold = lga_split_threshold
+        self.today = stat_date or timezone.now().date()
+        
+        # Per-worker memory target for streaming aggregation
+        self.memory_target_mb = memory_target_mb
+    
+    def plan_partitions(self, state_id=None, lga_id=None):
+        """
+        Split the registry into partitions, largest first
+        
+        States with more than ``lga_split_threshold`` citizens are split
+        into one partition per LGA so a single large state does not
+        dominate the run. A single LGA is one partition.
+        """
+        citizens = Citizen.objects.all()
+        if state_id:
+            citizens = citizens.filter(residence_state_id=state_id)
+        
+        if lga_id:
+            return [AggregationPartition(
+                state_id, lga_id, citizens.filter(residence_lga_id=lga_id).count()
+            )]
+        
+        state_counts = citizens.values('residence_state_id').annotate(
+            total=Count('pk')
+        ).order_by()
+        
+        partitions = []
+        for row in state_counts:
+            if row['total'] <= self.lga_split_threshold:
+                partitions.append(AggregationPartition(
+                    row['residence_state_id'], None, row['total']
+                ))
+                continue
+            
+            lga_counts = citizens.filter(
+                residence_state_id=row['residence_state_id']
+            ).values('residence_lga_id').annotate(total=Count('pk')).order_by()
+            
+            for lga_row in lga_counts:
+                partitions.append(AggregationPartition(
+                    row['residence_state_id'], lga_row['residence_lga_id'], lga_row['total']
+                ))
+        
+        # Schedule the biggest partitions first to keep every worker busy
+        partitions.sort(key=lambda partition: partition.citizen_count, reverse=True)
+        return partitions
+    
+    def run(self, state_id=None, lga_id=None, on_partition_done=None, on_stage=None):
+        """
+        Aggregate every partition, retrying failed ones
+        
+        Returns a summary with one entry per partition. ``on_partition_done``
+        is called with each entry as soon as its partition finishes, and
+        ``on_stage`` with the name of each stage ('partitions', then
+        'rollups') and the planned partitions as it starts. When any
+        partition still fails after its retries, the rollups are not rebuilt
+        and the run is not recorded in the report metadata.
+        """
+        start_time = timezone.now()
+        start = time.perf_counter()
+        partitions = self.plan_partitions(state_id=state_id, lga_id=lga_id)
+        
+        if on_stage:
+            on_stage('partitions', partitions)
+        
+        attempts = {partition: 0 for partition in partitions}
+        results = {}
+        pending = list(partitions)
+        
+        # Each round runs in a fresh pool, so a worker killed mid-run
+        # (e.g. by the OOM killer) only costs a retry of its partitions
+        while pending:
+            failed = []
+            for partition, duration, error in self._run_round(pending):
+                attempts[partition] += 1
+                result = {
+                    'state_id': partition.state_id,
+                    'lga_id': partition.lga_id,
+                    'citizen_count': partition.citizen_count,
+                    'duration': duration,
+                    'attempts': attempts[partition],
+                    'success': error is None,
+                    'error': str(error) if error else None,
+                }
+                results[partition] = result
+                
+                if error is not None and attempts[partition] <= self.max_retries:
+                    failed.append(partition)
+                elif on_partition_done:
+                    on_partition_done(result)
+            
+            pending = failed
+        
+        summary = {
+            'stat_date': self.today,
+            'partitions': [results[partition] for partition in partitions],
+            'failed': [results[partition] for partition in partitions if not results[partition]['success']],
+            'citizen_count': sum(partition.citizen_count for partition in partitions),
+            'duration': time.perf_counter() - start,
+        }
+        
+        # Rollups and snapshots built from part of the wards would be
+        # published as complete; leave the last good ones in place and let
+        # the caller fail the run
+        if summary['failed']:
+            return summary
+        
+        # Roll the partitions' ward rows up once every partition is written,
+        # and record the run on behalf of all workers
+        if on_stage:
+            on_stage('rollups', partitions)
+        
+        aggregator = DataAggregator(stat_date=self.today)
+        aggregator.rebuild_rollups(state_id=state_id, lga_id=lga_id)
+        aggregator._update_report_metadata("parallel_aggregation", start_time)
+        
+        return summary
+    
+    def _run_round(self, partitions):
+        """
+        Run one round of partitions and yield (partition, duration, error)
+        """
+        if self.workers is not None and self.workers <= 1:
+            for partition in partitions:
+                start = time.perf_counter()
+                try:
+                    duration = _aggregate_partition(partition, self.today, self.memory_target_mb)
+                except Exception as e:
+                    yield partition, time.perf_counter() - start, e
+                else:
+                    yield partition, duration, None
+            return
+        
+        # Forked workers must not share the parent's open connections
+        db.connections.close_all()
+        
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker) as executor:
+            futures = {
+                executor.submit(
+                    _aggregate_partition, partition, self.today, self.memory_target_mb
+                ): partition
+                for partition in partitions
+            }
+            submitted_at = time.perf_counter()
+            
+            for future in as_completed(futures):
+                partition = futures[future]
+                try:
+                    duration = future.result()
+                except Exception as e:
+                    yield partition, time.perf_counter() - submitted_at, e
+                else:
+                    yield partition, duration, None
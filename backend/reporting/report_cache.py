@@ -0,0 +1,268 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django import db
+from django.conf import settings
+from django.core.cache import caches
+
+# Hit and miss totals are also exported to Prometheus when it is installed
+try:
+    from prometheus_client import Counter
+except ImportError:
+    Counter = None
+
+if Counter is not None:
+    REPORT_CACHE_REQUESTS = Counter(
+        'reporting_report_cache_requests',
+        'Report requests answered from the report cache (hit), from an expired entry (stale) or generated (miss)',
+        ['report', 'result']
+    )
+
+# Prometheus result label of each counter
+RESULT_LABELS = {'hits': 'hit', 'stale_hits': 'stale', 'misses': 'miss'}
+
+# Shared hit and miss counters, so every web worker reports the same totals
+STATS_KEYS = {
+    'hits': 'reporting:report-cache:hits',
+    'stale_hits': 'reporting:report-cache:stale-hits',
+    'misses': 'reporting:report-cache:misses',
+}
+
+# Seconds between checks for the entry another worker is generating
+WAIT_INTERVAL = 0.05
+
+# Threads regenerating expired reports after their stale copy was served
+_refresh_executor = None
+_refresh_executor_lock = threading.Lock()
+
+class ReportCache:
+    """
+    Cache of serialized reports, keyed by report type, scope, date and
+    format
+    
+    Entries are never deleted on invalidation. Each key embeds the current
+    generation of every scope the report reads, and the aggregator moves
+    those generations on when it writes a date and scope, so later
+    requests miss and the old entries age out of the cache.
+    
+    Expired entries are kept for REPORT_CACHE_STALE_TIMEOUT more seconds,
+    to be served while they are regenerated. A lock per key, held in the
+    cache itself so it holds across web workers, lets one request
+    regenerate a report while the others wait for its entry or keep
+    serving the stale one.
+    """
+    
+    def __init__(self, cache=None):
+        self.cache = cache or caches[getattr(settings, 'REPORT_CACHE', 'default')]
+        self.stale_timeout = getattr(settings, 'REPORT_CACHE_STALE_TIMEOUT', 600)
+        self.lock_timeout = getattr(settings, 'REPORT_CACHE_LOCK_TIMEOUT', 60)
+        self.lock_wait = getattr(settings, 'REPORT_CACHE_LOCK_WAIT', 15)
+    
+    def key(self, report_type, report_date, state_id=None, lga_id=None, variant=''):
+        """
+        Get the cache key of a report as of the current generations
+        
+        Args:
+            report_type (str): One of REPORT_TYPES
+            report_date (date): Stats date of the report
+            state_id (int): State filter
+            lga_id (int): LGA filter
+            variant (str): Anything else the serialized report depends on,
+                e.g. the chart format
+        
+        Returns:
+            str: Cache key
+        """
+        generations = self._generations(report_date, self._scopes(state_id))
+        return ':'.join([
+            'reporting:report',
+            report_type,
+            report_date.isoformat(),
+            str(state_id or '-'),
+            str(lga_id or '-'),
+            variant,
+            '.'.join(generations),
+        ])
+    
+    def get(self, key, report_type=None):
+        """
+        Get a cached report, counting the hit, stale hit or miss
+        
+        Returns:
+            tuple: The serialized report and whether it is still fresh, or
+            None on a miss
+        """
+        entry = self.cache.get(key)
+        if entry is None:
+            self._count('misses', report_type)
+            return None
+        
+        fresh_until, content = entry
+        fresh = time.time() < fresh_until
+        self._count('hits' if fresh else 'stale_hits', report_type)
+        return content, fresh
+    
+    def set(self, key, content, timeout):
+        """
+        Cache a serialized report, fresh for ``timeout`` seconds and then
+        stale for the stale timeout
+        """
+        self.cache.set(key, (time.time() + timeout, content), timeout + self.stale_timeout)
+    
+    def acquire(self, key):
+        """
+        Take the lock to generate a report, unless another request has it
+        
+        The lock expires by itself after REPORT_CACHE_LOCK_TIMEOUT seconds,
+        so a worker killed while generating does not block the report.
+        """
+        return self.cache.add(self._lock_key(key), True, self.lock_timeout)
+    
+    def release(self, key):
+        """
+        Release the lock taken to generate a report
+        """
+        self.cache.delete(self._lock_key(key))
+    
+    def wait(self, key):
+        """
+        Wait for the request holding a report's lock to cache it
+        
+        Returns:
+            bytes: The serialized report, or None when the lock was released
+            without caching one (no data, or not cacheable) or the wait
+            timed out
+        """
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            
+            entry = self.cache.get(key)
+            if entry is not None:
+                return entry[1]
+            if self.cache.get(self._lock_key(key)) is None:
+                return None
+        return None
+    
+    def invalidate(self, stat_date, state_id=None, lga_id=None):
+        """
+        Drop the cached reports an aggregation of a date and scope changes
+        
+        A state's run changes that state's rows and the national rollups.
+        Runs of every state, of wards, or of an LGA given without its state
+        rewrite rollups of any state, so they invalidate the whole date.
+        """
+        if state_id:
+            scopes = [f'state:{state_id}', 'national']
+        else:
+            scopes = ['all']
+        
+        self.cache.set_many({
+            self._generation_key(stat_date, scope): uuid.uuid4().hex[:8]
+            for scope in scopes
+        }, None)
+    
+    def stats(self):
+        """
+        Get the hit and miss totals of every worker
+        """
+        values = self.cache.get_many(list(STATS_KEYS.values()))
+        stats = {name: values.get(key, 0) for name, key in STATS_KEYS.items()}
+        served = stats['hits'] + stats['stale_hits']
+        requests = served + stats['misses']
+        stats['hit_ratio'] = round(served / requests, 4) if requests else None
+        return stats
+    
+    def _scopes(self, state_id=None):
+        """
+        Get the scopes whose generations a report depends on
+        
+        LGA reports given without their state depend on the national scope,
+        which every state's run moves on.
+        """
+        return ['all', f'state:{state_id}' if state_id else 'national']
+    
+    def _generations(self, stat_date, scopes):
+        """
+        Get the current generation of each scope, starting missing ones
+        
+        A generation lost to eviction is replaced by a new one rather than
+        restarted, so it can never match entries cached before the loss.
+        """
+        keys = [self._generation_key(stat_date, scope) for scope in scopes]
+        values = self.cache.get_many(keys)
+        
+        generations = []
+        for key in keys:
+            generation = values.get(key)
+            if generation is None:
+                generation = uuid.uuid4().hex[:8]
+                if not self.cache.add(key, generation, None):
+                    # Another worker started it first
+                    generation = self.cache.get(key) or generation
+            generations.append(generation)
+        return generations
+    
+    def _lock_key(self, key):
+        """
+        Get the cache key of the lock to generate a report
+        """
+        return f'{key}:lock'
+    
+    def _generation_key(self, stat_date, scope):
+        """
+        Get the cache key holding the generation of a date and scope
+        """
+        return f'reporting:report-gen:{stat_date.isoformat()}:{scope}'
+    
+    def _count(self, name, report_type=None):
+        """
+        Add one to a shared hit or miss counter
+        """
+        key = STATS_KEYS[name]
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # First count since the counter was evicted or the cache cleared
+            if not self.cache.add(key, 1, None):
+                self.cache.incr(key)
+        
+        if Counter is not None and report_type:
+            REPORT_CACHE_REQUESTS.labels(report_type, RESULT_LABELS[name]).inc()
+
+
+def refresh_in_background(function, *args):
+    """
+    Regenerate a report on a refresh thread
+    
+    With REPORT_CACHE_REFRESH_WORKERS set to 0 the report is regenerated
+    in the caller instead.
+    """
+    workers = getattr(settings, 'REPORT_CACHE_REFRESH_WORKERS', 2)
+    if workers < 1:
+        function(*args)
+        return
+    
+    _get_refresh_executor(workers).submit(_refresh_in_thread, function, *args)
+
+
+def _get_refresh_executor(workers):
+    """
+    Get the process's refresh executor
+    """
+    global _refresh_executor
+    with _refresh_executor_lock:
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report-refresh')
+        return _refresh_executor
+
+
+def _refresh_in_thread(function, *args):
+    """
+    Run a refresh on an executor thread and release its connections
+    """
+    try:
+        function(*args)
+    finally:
+        db.connections.close_all()
@@ -1,25 +1,66 @@
+import threading
+from concurrent.futures import Future
+from functools import partial
+from django.conf import settings
+from django.core.cache import caches
 from django.db import connection
 from django.utils import timezone
 from datetime import datetime, timedelta
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from io import BytesIO
-import base64
 from .models import (
     DemographicStats, OccupationStats, HealthcareStats, 
-    FamilyStats, InterestStats, ReportMetadata, CustomReport
+    FamilyStats, InterestStats, CrossTabStats, HouseholdStats, ReportMetadata, CustomReport,
+    DashboardSnapshot, LEVEL_WARD, LEVEL_LGA, LEVEL_STATE, LEVEL_NATIONAL
 )
+from .age_engine import order_age_groups
+from .charts import pie_chart, bar_chart, chart_key, submit_render, DEFAULT_CHART_FORMAT
+from .olap_cube import CubeStore
+from .star_schema import stats_queryset
+from .crosstabs import CROSS_TABS, crosstab_columns, crosstab_fields, order_values
 from django.db import models
 
+# Reports whose sections carry charts, by the name used in chart URLs
+REPORT_TYPES = ['demographic', 'occupation', 'healthcare', 'family', 'interests', 'executive_dashboard']
+
+# ReportMetadata names of the aggregation runs each report is built from;
+# whole-registry runs feed every report
+REPORT_SOURCES = {
+    'demographic': ['demographic_aggregation'],
+    'occupation': ['occupation_aggregation'],
+    'healthcare': ['healthcare_aggregation'],
+    'family': ['family_structure_aggregation'],
+    'interests': ['interest_aggregation'],
+    'executive_dashboard': [
+        'demographic_aggregation', 'occupation_aggregation',
+        'healthcare_aggregation', 'family_structure_aggregation'
+    ],
+}
+RUN_SOURCES = ['all_aggregations', 'parallel_aggregation', 'incremental_aggregation']
+
+# DashboardSnapshot fields holding the executive dashboard's figures
+DASHBOARD_FIGURES = [
+    'total_population', 'employed_count', 'unemployed_count', 'avg_household_size',
+    'health_conditions', 'age_distribution', 'education_levels'
+]
+
+# Charts this process is drawing, by cache key, so a chart asked for again
+# while it is being drawn waits for that drawing instead of starting another
+_charts_in_flight = {}
+_charts_in_flight_lock = threading.Lock()
+
 class ReportGenerator:
     """
     Service for generating reports and visualizations
     """
     
-    def __init__(self):
+    def __init__(self, cube_store=None, chart_cache=None, prerender_format=None):
         self.today = timezone.now().date()
+        self.cubes = cube_store or CubeStore()
+        self.chart_cache = chart_cache or caches[getattr(settings, 'REPORT_CHART_CACHE', 'default')]
+        
+        # With a prerender format, each section's chart starts drawing in the
+        # chart pool as soon as its data is known, while later sections are
+        # still being queried
+        self.prerender_format = prerender_format
     
     def generate_demographic_report(self, state_id=None, lga_id=None, report_date=None):
         """
@@ -28,15 +69,8 @@ class ReportGenerator:
         # Use today's date if not specified
         report_date = report_date or self.today
         
-        # Build filter conditions
-        filters = {'stat_date': report_date}
-        if state_id:
-            filters['state_id'] = state_id
-        if lga_id:
-            filters['lga_id'] = lga_id
-        
         # Get demographic stats
-        stats = DemographicStats.objects.filter(**filters)
+        stats = self.cubes.slice(DemographicStats, report_date, state_id, lga_id)
         
         # Check if data exists
         if not stats.exists():
@@ -58,158 +92,58 @@ class ReportGenerator:
         }
         
         # Gender distribution
-        gender_stats = stats.filter(gender__isnull=False).values('gender').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('-total')
+        gender_stats = stats.totals('gender')
         
         if gender_stats:
-            # Create pie chart for gender distribution
-            plt.figure(figsize=(8, 6))
-            plt.pie(
-                [stat['total'] for stat in gender_stats],
-                labels=[stat['gender'] for stat in gender_stats],
-                autopct='%1.1f%%',
-                startangle=90
-            )
-            plt.axis('equal')
-            plt.title('Gender Distribution')
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Gender Distribution',
                 'data': list(gender_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(pie_chart('gender', gender_stats, 'Gender Distribution'))
             })
         
         # Age group distribution
-        age_stats = stats.filter(age_group__isnull=False).values('age_group').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('age_group')
+        age_stats = order_age_groups(stats.totals('age_group'))
         
         if age_stats:
-            # Create bar chart for age distribution
-            plt.figure(figsize=(10, 6))
-            sns.barplot(
-                x=[stat['age_group'] for stat in age_stats],
-                y=[stat['total'] for stat in age_stats]
-            )
-            plt.title('Age Group Distribution')
-            plt.xlabel('Age Group')
-            plt.ylabel('Count')
-            plt.xticks(rotation=45)
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Age Group Distribution',
                 'data': list(age_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(bar_chart('age_group', age_stats, 'Age Group Distribution', 'Age Group'))
             })
         
         # Education level distribution
-        education_stats = stats.filter(education_level__isnull=False).values('education_level').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('-total')
+        education_stats = stats.totals('education_level')
         
         if education_stats:
-            # Create bar chart for education distribution
-            plt.figure(figsize=(10, 6))
-            sns.barplot(
-                x=[stat['education_level'] for stat in education_stats],
-                y=[stat['total'] for stat in education_stats]
-            )
-            plt.title('Education Level Distribution')
-            plt.xlabel('Education Level')
-            plt.ylabel('Count')
-            plt.xticks(rotation=45)
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Education Level Distribution',
                 'data': list(education_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(bar_chart('education_level', education_stats, 'Education Level Distribution', 'Education Level'))
             })
         
         # Religion distribution
-        religion_stats = stats.filter(religion__isnull=False).values('religion').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('-total')
+        religion_stats = stats.totals('religion')
         
         if religion_stats:
-            # Create pie chart for religion distribution
-            plt.figure(figsize=(8, 6))
-            plt.pie(
-                [stat['total'] for stat in religion_stats],
-                labels=[stat['religion'] for stat in religion_stats],
-                autopct='%1.1f%%',
-                startangle=90
-            )
-            plt.axis('equal')
-            plt.title('Religion Distribution')
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Religion Distribution',
                 'data': list(religion_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(pie_chart('religion', religion_stats, 'Religion Distribution'))
             })
         
         # Ethnicity distribution
-        ethnicity_stats = stats.filter(ethnicity__isnull=False).values('ethnicity').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('-total')[:10]  # Top 10 ethnicities
+        ethnicity_stats = stats.totals('ethnicity')[:10]  # Top 10 ethnicities
         
         if ethnicity_stats:
-            # Create bar chart for ethnicity distribution
-            plt.figure(figsize=(10, 6))
-            sns.barplot(
-                x=[stat['ethnicity'] for stat in ethnicity_stats],
-                y=[stat['total'] for stat in ethnicity_stats]
-            )
-            plt.title('Top 10 Ethnicities')
-            plt.xlabel('Ethnicity')
-            plt.ylabel('Count')
-            plt.xticks(rotation=45)
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Ethnicity Distribution',
                 'data': list(ethnicity_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(bar_chart('ethnicity', ethnicity_stats, 'Top 10 Ethnicities', 'Ethnicity'))
             })
         
         return {
@@ -224,15 +158,8 @@ class ReportGenerator:
         # Use today's date if not specified
         report_date = report_date or self.today
         
-        # Build filter conditions
-        filters = {'stat_date': report_date}
-        if state_id:
-            filters['state_id'] = state_id
-        if lga_id:
-            filters['lga_id'] = lga_id
-        
         # Get occupation stats
-        stats = OccupationStats.objects.filter(**filters)
+        stats = self.cubes.slice(OccupationStats, report_date, state_id, lga_id)
         
         # Check if data exists
         if not stats.exists():
@@ -254,127 +181,47 @@ class ReportGenerator:
         }
         
         # Employment status distribution
-        employment_stats = stats.filter(employment_status__isnull=False).values('employment_status').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('-total')
+        employment_stats = stats.totals('employment_status')
         
         if employment_stats:
-            # Create pie chart for employment status
-            plt.figure(figsize=(8, 6))
-            plt.pie(
-                [stat['total'] for stat in employment_stats],
-                labels=[stat['employment_status'] for stat in employment_stats],
-                autopct='%1.1f%%',
-                startangle=90
-            )
-            plt.axis('equal')
-            plt.title('Employment Status Distribution')
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Employment Status Distribution',
                 'data': list(employment_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(pie_chart('employment_status', employment_stats, 'Employment Status Distribution'))
             })
         
         # Occupation sector distribution
-        sector_stats = stats.filter(occupation_sector__isnull=False).values('occupation_sector').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('-total')[:10]  # Top 10 sectors
+        sector_stats = stats.totals('occupation_sector')[:10]  # Top 10 sectors
         
         if sector_stats:
-            # Create bar chart for sector distribution
-            plt.figure(figsize=(10, 6))
-            sns.barplot(
-                x=[stat['occupation_sector'] for stat in sector_stats],
-                y=[stat['total'] for stat in sector_stats]
-            )
-            plt.title('Top 10 Occupation Sectors')
-            plt.xlabel('Sector')
-            plt.ylabel('Count')
-            plt.xticks(rotation=45)
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Occupation Sector Distribution',
                 'data': list(sector_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(bar_chart('occupation_sector', sector_stats, 'Top 10 Occupation Sectors', 'Sector'))
             })
         
         # Income level distribution
-        income_stats = stats.filter(income_level__isnull=False).values('income_level').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('income_level')
+        income_stats = stats.totals('income_level', order_by='income_level')
         
         if income_stats:
-            # Create bar chart for income distribution
-            plt.figure(figsize=(10, 6))
-            sns.barplot(
-                x=[stat['income_level'] for stat in income_stats],
-                y=[stat['total'] for stat in income_stats]
-            )
-            plt.title('Income Level Distribution')
-            plt.xlabel('Income Level')
-            plt.ylabel('Count')
-            plt.xticks(rotation=45)
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Income Level Distribution',
                 'data': list(income_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(bar_chart('income_level', income_stats, 'Income Level Distribution', 'Income Level'))
             })
         
         # Qualification level distribution
-        qualification_stats = stats.filter(qualification_level__isnull=False).values('qualification_level').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('-total')
+        qualification_stats = stats.totals('qualification_level')
         
         if qualification_stats:
-            # Create bar chart for qualification distribution
-            plt.figure(figsize=(10, 6))
-            sns.barplot(
-                x=[stat['qualification_level'] for stat in qualification_stats],
-                y=[stat['total'] for stat in qualification_stats]
-            )
-            plt.title('Qualification Level Distribution')
-            plt.xlabel('Qualification Level')
-            plt.ylabel('Count')
-            plt.xticks(rotation=45)
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Qualification Level Distribution',
                 'data': list(qualification_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(bar_chart('qualification_level', qualification_stats, 'Qualification Level Distribution', 'Qualification Level'))
             })
         
         return {
@@ -389,15 +236,8 @@ class ReportGenerator:
         # Use today's date if not specified
         report_date = report_date or self.today
         
-        # Build filter conditions
-        filters = {'stat_date': report_date}
-        if state_id:
-            filters['state_id'] = state_id
-        if lga_id:
-            filters['lga_id'] = lga_id
-        
         # Get healthcare stats
-        stats = HealthcareStats.objects.filter(**filters)
+        stats = self.cubes.slice(HealthcareStats, report_date, state_id, lga_id)
         
         # Check if data exists
         if not stats.exists():
@@ -419,127 +259,47 @@ class ReportGenerator:
         }
         
         # Health condition distribution
-        condition_stats = stats.filter(health_condition__isnull=False).values('health_condition').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('-total')[:10]  # Top 10 conditions
+        condition_stats = stats.totals('health_condition')[:10]  # Top 10 conditions
         
         if condition_stats:
-            # Create bar chart for health conditions
-            plt.figure(figsize=(10, 6))
-            sns.barplot(
-                x=[stat['health_condition'] for stat in condition_stats],
-                y=[stat['total'] for stat in condition_stats]
-            )
-            plt.title('Top 10 Health Conditions')
-            plt.xlabel('Health Condition')
-            plt.ylabel('Count')
-            plt.xticks(rotation=45)
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Health Condition Distribution',
                 'data': list(condition_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(bar_chart('health_condition', condition_stats, 'Top 10 Health Conditions', 'Health Condition'))
             })
         
         # Blood group distribution
-        blood_stats = stats.filter(blood_group__isnull=False).values('blood_group').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('-total')
+        blood_stats = stats.totals('blood_group')
         
         if blood_stats:
-            # Create pie chart for blood groups
-            plt.figure(figsize=(8, 6))
-            plt.pie(
-                [stat['total'] for stat in blood_stats],
-                labels=[stat['blood_group'] for stat in blood_stats],
-                autopct='%1.1f%%',
-                startangle=90
-            )
-            plt.axis('equal')
-            plt.title('Blood Group Distribution')
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Blood Group Distribution',
                 'data': list(blood_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(pie_chart('blood_group', blood_stats, 'Blood Group Distribution'))
             })
         
         # Disability distribution
-        disability_stats = stats.filter(disability_type__isnull=False).values('disability_type').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('-total')
+        disability_stats = stats.totals('disability_type')
         
         if disability_stats:
-            # Create bar chart for disabilities
-            plt.figure(figsize=(10, 6))
-            sns.barplot(
-                x=[stat['disability_type'] for stat in disability_stats],
-                y=[stat['total'] for stat in disability_stats]
-            )
-            plt.title('Disability Type Distribution')
-            plt.xlabel('Disability Type')
-            plt.ylabel('Count')
-            plt.xticks(rotation=45)
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Disability Type Distribution',
                 'data': list(disability_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(bar_chart('disability_type', disability_stats, 'Disability Type Distribution', 'Disability Type'))
             })
         
         # Immunization status distribution
-        immunization_stats = stats.filter(immunization_status__isnull=False).values('immunization_status').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('-total')
+        immunization_stats = stats.totals('immunization_status')
         
         if immunization_stats:
-            # Create pie chart for immunization status
-            plt.figure(figsize=(8, 6))
-            plt.pie(
-                [stat['total'] for stat in immunization_stats],
-                labels=[stat['immunization_status'] for stat in immunization_stats],
-                autopct='%1.1f%%',
-                startangle=90
-            )
-            plt.axis('equal')
-            plt.title('Immunization Status Distribution')
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Immunization Status Distribution',
                 'data': list(immunization_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(pie_chart('immunization_status', immunization_stats, 'Immunization Status Distribution'))
             })
         
         return {
@@ -554,15 +314,8 @@ class ReportGenerator:
         # Use today's date if not specified
         report_date = report_date or self.today
         
-        # Build filter conditions
-        filters = {'stat_date': report_date}
-        if state_id:
-            filters['state_id'] = state_id
-        if lga_id:
-            filters['lga_id'] = lga_id
-        
         # Get family stats
-        stats = FamilyStats.objects.filter(**filters)
+        stats = self.cubes.slice(FamilyStats, report_date, state_id, lga_id)
         
         # Check if data exists
         if not stats.exists():
@@ -584,125 +337,47 @@ class ReportGenerator:
         }
         
         # Household size distribution
-        household_stats = stats.filter(household_size__isnull=False).values('household_size').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('household_size')
+        household_stats = stats.totals('household_size', order_by='household_size')
         
         if household_stats:
-            # Create bar chart for household size
-            plt.figure(figsize=(10, 6))
-            sns.barplot(
-                x=[stat['household_size'] for stat in household_stats],
-                y=[stat['total'] for stat in household_stats]
-            )
-            plt.title('Household Size Distribution')
-            plt.xlabel('Household Size')
-            plt.ylabel('Count')
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Household Size Distribution',
                 'data': list(household_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(bar_chart('household_size', household_stats, 'Household Size Distribution', 'Household Size', rotate_labels=False))
             })
         
         # Marital status distribution
-        marital_stats = stats.filter(marital_status__isnull=False).values('marital_status').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('-total')
+        marital_stats = stats.totals('marital_status')
         
         if marital_stats:
-            # Create pie chart for marital status
-            plt.figure(figsize=(8, 6))
-            plt.pie(
-                [stat['total'] for stat in marital_stats],
-                labels=[stat['marital_status'] for stat in marital_stats],
-                autopct='%1.1f%%',
-                startangle=90
-            )
-            plt.axis('equal')
-            plt.title('Marital Status Distribution')
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Marital Status Distribution',
                 'data': list(marital_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(pie_chart('marital_status', marital_stats, 'Marital Status Distribution'))
             })
         
         # Children count distribution
-        children_stats = stats.filter(children_count__isnull=False).values('children_count').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('children_count')
+        children_stats = stats.totals('children_count', order_by='children_count')
         
         if children_stats:
-            # Create bar chart for children count
-            plt.figure(figsize=(10, 6))
-            sns.barplot(
-                x=[stat['children_count'] for stat in children_stats],
-                y=[stat['total'] for stat in children_stats]
-            )
-            plt.title('Number of Children Distribution')
-            plt.xlabel('Number of Children')
-            plt.ylabel('Count')
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Number of Children Distribution',
                 'data': list(children_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(bar_chart('children_count', children_stats, 'Number of Children Distribution', 'Number of Children', rotate_labels=False))
             })
         
         # Family type distribution
-        family_type_stats = stats.filter(family_type__isnull=False).values('family_type').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('-total')
+        family_type_stats = stats.totals('family_type')
         
         if family_type_stats:
-            # Create pie chart for family type
-            plt.figure(figsize=(8, 6))
-            plt.pie(
-                [stat['total'] for stat in family_type_stats],
-                labels=[stat['family_type'] for stat in family_type_stats],
-                autopct='%1.1f%%',
-                startangle=90
-            )
-            plt.axis('equal')
-            plt.title('Family Type Distribution')
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Family Type Distribution',
                 'data': list(family_type_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(pie_chart('family_type', family_type_stats, 'Family Type Distribution'))
             })
         
         return {
@@ -717,15 +392,8 @@ class ReportGenerator:
         # Use today's date if not specified
         report_date = report_date or self.today
         
-        # Build filter conditions
-        filters = {'stat_date': report_date}
-        if state_id:
-            filters['state_id'] = state_id
-        if lga_id:
-            filters['lga_id'] = lga_id
-        
         # Get interest stats
-        stats = InterestStats.objects.filter(**filters)
+        stats = self.cubes.slice(InterestStats, report_date, state_id, lga_id)
         
         # Check if data exists
         if not stats.exists():
@@ -747,96 +415,36 @@ class ReportGenerator:
         }
         
         # Interest type distribution
-        interest_type_stats = stats.filter(interest_type__isnull=False).values('interest_type').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('-total')
+        interest_type_stats = stats.totals('interest_type')
         
         if interest_type_stats:
-            # Create pie chart for interest types
-            plt.figure(figsize=(8, 6))
-            plt.pie(
-                [stat['total'] for stat in interest_type_stats],
-                labels=[stat['interest_type'] for stat in interest_type_stats],
-                autopct='%1.1f%%',
-                startangle=90
-            )
-            plt.axis('equal')
-            plt.title('Interest Type Distribution')
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Interest Type Distribution',
                 'data': list(interest_type_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(pie_chart('interest_type', interest_type_stats, 'Interest Type Distribution'))
             })
         
         # Sports distribution
-        sport_stats = stats.filter(sport_name__isnull=False).values('sport_name').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('-total')[:10]  # Top 10 sports
+        sport_stats = stats.totals('sport_name')[:10]  # Top 10 sports
         
         if sport_stats:
-            # Create bar chart for sports
-            plt.figure(figsize=(10, 6))
-            sns.barplot(
-                x=[stat['sport_name'] for stat in sport_stats],
-                y=[stat['total'] for stat in sport_stats]
-            )
-            plt.title('Top 10 Sports')
-            plt.xlabel('Sport')
-            plt.ylabel('Count')
-            plt.xticks(rotation=45)
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Sports Distribution',
                 'data': list(sport_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(bar_chart('sport_name', sport_stats, 'Top 10 Sports', 'Sport'))
             })
         
         # Cultural activities distribution
-        cultural_stats = stats.filter(cultural_activity__isnull=False).values('cultural_activity').annotate(
-            total=models.Sum('count'),
-            avg_percentage=models.Avg('percentage')
-        ).order_by('-total')[:10]  # Top 10 cultural activities
+        cultural_stats = stats.totals('cultural_activity')[:10]  # Top 10 cultural activities
         
         if cultural_stats:
-            # Create bar chart for cultural activities
-            plt.figure(figsize=(10, 6))
-            sns.barplot(
-                x=[stat['cultural_activity'] for stat in cultural_stats],
-                y=[stat['total'] for stat in cultural_stats]
-            )
-            plt.title('Top 10 Cultural Activities')
-            plt.xlabel('Cultural Activity')
-            plt.ylabel('Count')
-            plt.xticks(rotation=45)
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add section to report
+            # Add section to report; the chart is rendered on request
             report_data['sections'].append({
                 'title': 'Cultural Activities Distribution',
                 'data': list(cultural_stats),
-                'chart': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(bar_chart('cultural_activity', cultural_stats, 'Top 10 Cultural Activities', 'Cultural Activity'))
             })
         
         return {
@@ -847,14 +455,22 @@ class ReportGenerator:
     def generate_executive_dashboard(self, state_id=None, report_date=None):
         """
         Generate executive dashboard with key metrics
+        
+        Figures come from the scope's DashboardSnapshot, read together with
+        the earlier snapshots its trend sparklines are drawn from. Dates
+        aggregated before snapshots were written are computed from the
+        stats cubes instead, without trends.
         """
         # Use today's date if not specified
         report_date = report_date or self.today
         
-        # Build filter conditions
-        filters = {'stat_date': report_date}
-        if state_id:
-            filters['state_id'] = state_id
+        # One indexed read for the date and the trend dates before it
+        snapshots = list(self._dashboard_snapshots(state_id, report_date))
+        if snapshots and snapshots[0].stat_date == report_date:
+            figures = {field: getattr(snapshots[0], field) for field in DASHBOARD_FIGURES}
+        else:
+            figures = self.dashboard_figures(state_id, report_date)
+            snapshots = []
         
         # Prepare dashboard data
         dashboard_data = {
@@ -865,33 +481,19 @@ class ReportGenerator:
                 'report_date': report_date
             },
             'metrics': [],
-            'charts': []
+            'charts': [],
+            'trends': []
         }
         
         # Total population
-        total_population = DemographicStats.objects.filter(
-            gender__isnull=False, **filters
-        ).aggregate(total=models.Sum('count'))['total'] or 0
-        
         dashboard_data['metrics'].append({
             'name': 'Total Population',
-            'value': total_population,
+            'value': figures['total_population'],
             'icon': 'users'
         })
         
         # Employment rate
-        employed_count = OccupationStats.objects.filter(
-            employment_status='Employed', **filters
-        ).aggregate(total=models.Sum('count'))['total'] or 0
-        
-        unemployed_count = OccupationStats.objects.filter(
-            employment_status='Unemployed', **filters
-        ).aggregate(total=models.Sum('count'))['total'] or 0
-        
-        if employed_count + unemployed_count > 0:
-            employment_rate = (employed_count / (employed_count + unemployed_count)) * 100
-        else:
-            employment_rate = 0
+        employment_rate = _employment_rate(figures['employed_count'], figures['unemployed_count'])
         
         dashboard_data['metrics'].append({
             'name': 'Employment Rate',
@@ -900,112 +502,68 @@ class ReportGenerator:
         })
         
         # Average household size
-        avg_household_size = FamilyStats.objects.filter(
-            household_size__isnull=False, **filters
-        ).aggregate(
-            avg=models.Avg('household_size')
-        )['avg'] or 0
-        
         dashboard_data['metrics'].append({
             'name': 'Avg. Household Size',
-            'value': f"{avg_household_size:.1f}",
+            'value': f"{figures['avg_household_size']:.1f}",
             'icon': 'home'
         })
         
+        # Trend sparklines, oldest date first
+        if snapshots:
+            snapshots.reverse()
+            dates = [snapshot.stat_date for snapshot in snapshots]
+            dashboard_data['trends'] = [
+                {
+                    'name': 'Total Population',
+                    'dates': dates,
+                    'values': [snapshot.total_population for snapshot in snapshots]
+                },
+                {
+                    'name': 'Employment Rate',
+                    'dates': dates,
+                    'values': [
+                        round(_employment_rate(snapshot.employed_count, snapshot.unemployed_count), 1)
+                        for snapshot in snapshots
+                    ]
+                },
+                {
+                    'name': 'Avg. Household Size',
+                    'dates': dates,
+                    'values': [round(snapshot.avg_household_size, 1) for snapshot in snapshots]
+                },
+            ]
+        
         # Health conditions chart
-        health_conditions = HealthcareStats.objects.filter(
-            health_condition__isnull=False, **filters
-        ).values('health_condition').annotate(
-            total=models.Sum('count')
-        ).order_by('-total')[:5]  # Top 5 health conditions
+        health_conditions = figures['health_conditions']
         
         if health_conditions:
-            # Create bar chart for health conditions
-            plt.figure(figsize=(10, 6))
-            sns.barplot(
-                x=[condition['health_condition'] for condition in health_conditions],
-                y=[condition['total'] for condition in health_conditions]
-            )
-            plt.title('Top 5 Health Conditions')
-            plt.xlabel('Health Condition')
-            plt.ylabel('Count')
-            plt.xticks(rotation=45)
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add chart to dashboard
+            # Add chart to dashboard; the image is rendered on request
             dashboard_data['charts'].append({
                 'title': 'Top 5 Health Conditions',
                 'type': 'bar',
-                'image': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(bar_chart('health_condition', health_conditions, 'Top 5 Health Conditions', 'Health Condition'))
             })
         
         # Age distribution chart
-        age_distribution = DemographicStats.objects.filter(
-            age_group__isnull=False, **filters
-        ).values('age_group').annotate(
-            total=models.Sum('count')
-        ).order_by('age_group')
+        age_distribution = figures['age_distribution']
         
         if age_distribution:
-            # Create pie chart for age distribution
-            plt.figure(figsize=(8, 6))
-            plt.pie(
-                [age['total'] for age in age_distribution],
-                labels=[age['age_group'] for age in age_distribution],
-                autopct='%1.1f%%',
-                startangle=90
-            )
-            plt.axis('equal')
-            plt.title('Age Distribution')
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add chart to dashboard
+            # Add chart to dashboard; the image is rendered on request
             dashboard_data['charts'].append({
                 'title': 'Age Distribution',
                 'type': 'pie',
-                'image': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(pie_chart('age_group', age_distribution, 'Age Distribution'))
             })
         
         # Education level chart
-        education_levels = DemographicStats.objects.filter(
-            education_level__isnull=False, **filters
-        ).values('education_level').annotate(
-            total=models.Sum('count')
-        ).order_by('-total')
+        education_levels = figures['education_levels']
         
         if education_levels:
-            # Create bar chart for education levels
-            plt.figure(figsize=(10, 6))
-            sns.barplot(
-                x=[level['education_level'] for level in education_levels],
-                y=[level['total'] for level in education_levels]
-            )
-            plt.title('Education Level Distribution')
-            plt.xlabel('Education Level')
-            plt.ylabel('Count')
-            plt.xticks(rotation=45)
-            
-            # Save chart to buffer
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png')
-            plt.close()
-            buffer.seek(0)
-            
-            # Add chart to dashboard
+            # Add chart to dashboard; the image is rendered on request
             dashboard_data['charts'].append({
                 'title': 'Education Level Distribution',
                 'type': 'bar',
-                'image': base64.b64encode(buffer.getvalue()).decode('utf-8')
+                'chart': self._chart(bar_chart('education_level', education_levels, 'Education Level Distribution', 'Education Level'))
             })
         
         return {
@@ -1013,6 +571,292 @@ class ReportGenerator:
             'dashboard': dashboard_data
         }
     
+    def dashboard_figures(self, state_id=None, report_date=None):
+        """
+        Compute the executive dashboard's figures from the stats
+        
+        Args:
+            state_id (int): State filter, national figures if not given
+            report_date (date): Stats date, today if not given
+        
+        Returns:
+            dict: Values of the DASHBOARD_FIGURES fields of a snapshot
+        """
+        report_date = report_date or self.today
+        
+        # Build filter conditions for the household counts
+        filters = {'stat_date': report_date}
+        if state_id:
+            filters['state_id'] = state_id
+        
+        # Slice the stats cubes for the dashboard scope
+        demographics = self.cubes.slice(DemographicStats, report_date, state_id)
+        occupations = self.cubes.slice(OccupationStats, report_date, state_id)
+        
+        # Mean household size is the scope's members over its households
+        households = self._level_stats(HouseholdStats, filters).aggregate(
+            households=models.Sum('household_count'),
+            members=models.Sum('member_count')
+        )
+        avg_household_size = households['members'] / households['households'] if households['households'] else 0
+        
+        return {
+            'total_population': demographics.total('gender'),
+            'employed_count': occupations.total('employment_status', 'Employed'),
+            'unemployed_count': occupations.total('employment_status', 'Unemployed'),
+            'avg_household_size': float(avg_household_size),
+            'health_conditions': self.cubes.slice(HealthcareStats, report_date, state_id).totals(
+                'health_condition'
+            )[:5],  # Top 5 health conditions
+            'age_distribution': order_age_groups(demographics.totals('age_group')),
+            'education_levels': demographics.totals('education_level'),
+        }
+    
+    def _dashboard_snapshots(self, state_id, report_date):
+        """
+        Get a scope's snapshots up to a date, newest first, as many as the
+        trend sparklines show
+        """
+        if state_id:
+            snapshots = DashboardSnapshot.objects.filter(level=LEVEL_STATE, state_id=state_id)
+        else:
+            snapshots = DashboardSnapshot.objects.filter(level=LEVEL_NATIONAL, state__isnull=True)
+        
+        trend_dates = getattr(settings, 'REPORT_DASHBOARD_TREND_DATES', 14)
+        return snapshots.filter(stat_date__lte=report_date).order_by('-stat_date')[:max(trend_dates, 1)]
+    
+    def generate_crosstab_report(self, tab_name, state_id=None, lga_id=None, report_date=None):
+        """
+        Generate a cross-tabulation report
+        
+        Args:
+            tab_name (str): Name of a configured cross-tab
+            state_id (int): State filter
+            lga_id (int): LGA filter
+            report_date (date): Stats date, today if not given
+        
+        Returns:
+            dict: Report with one row per cell, plus a matrix for 2D tabs
+        """
+        if tab_name not in CROSS_TABS:
+            return {
+                'success': False,
+                'message': f'Unknown cross-tab: {tab_name}'
+            }
+        
+        # Use today's date if not specified
+        report_date = report_date or self.today
+        
+        # Build filter conditions
+        filters = {'stat_date': report_date, 'tab_name': tab_name}
+        if state_id:
+            filters['state_id'] = state_id
+        if lga_id:
+            filters['lga_id'] = lga_id
+        
+        # Get cross-tab cells
+        cells = list(self._level_stats(CrossTabStats, filters).values(
+            'value_1', 'value_2', 'value_3'
+        ).annotate(total=models.Sum('count')).order_by())
+        
+        # Check if data exists
+        if not cells:
+            return {
+                'success': False,
+                'message': 'No cross-tab data available for the specified parameters'
+            }
+        
+        columns = crosstab_columns(tab_name)
+        fields = crosstab_fields(tab_name)
+        value_keys = ['value_1', 'value_2', 'value_3'][:len(fields)]
+        
+        # Order cells by each dimension's display order
+        orders = []
+        for column, key in zip(columns, value_keys):
+            values = order_values(column, {cell[key] for cell in cells})
+            orders.append({value: index for index, value in enumerate(values)})
+        cells.sort(key=lambda cell: [order[cell[key]] for order, key in zip(orders, value_keys)])
+        
+        grand_total = sum(cell['total'] for cell in cells)
+        data = []
+        for cell in cells:
+            row = {field: cell[key] for field, key in zip(fields, value_keys)}
+            row['total'] = cell['total']
+            row['percentage'] = round(cell['total'] * 100.0 / grand_total, 2)
+            data.append(row)
+        
+        report_data = {
+            'title': CROSS_TABS[tab_name]['title'],
+            'generated_at': timezone.now(),
+            'parameters': {
+                'tab_name': tab_name,
+                'state_id': state_id,
+                'lga_id': lga_id,
+                'report_date': report_date
+            },
+            'dimensions': fields,
+            'total': grand_total,
+            'data': data
+        }
+        
+        # Two-dimensional tabs are also returned as a row x column matrix
+        if len(fields) == 2:
+            rows, cols = (list(order) for order in orders)
+            matrix = [[0] * len(cols) for _ in rows]
+            for cell in cells:
+                matrix[orders[0][cell['value_1']]][orders[1][cell['value_2']]] = cell['total']
+            report_data['matrix'] = {
+                'rows': rows,
+                'columns': cols,
+                'counts': matrix
+            }
+        
+        return {
+            'success': True,
+            'report': report_data
+        }
+    
+    def generate_chart(self, report_type, chart_id, state_id=None, lga_id=None, report_date=None,
+                       image_format=DEFAULT_CHART_FORMAT):
+        """
+        Render one chart of a report
+        
+        Args:
+            report_type (str): One of REPORT_TYPES
+            chart_id (str): Id of the chart in the report's sections
+            state_id (int): State filter
+            lga_id (int): LGA filter, ignored by the executive dashboard
+            report_date (date): Stats date, today if not given
+            image_format (str): Image format to encode the chart in
+        
+        Returns:
+            dict: The encoded image and its chart spec, or an error message
+        """
+        if report_type not in REPORT_TYPES:
+            return {
+                'success': False,
+                'message': f'Unknown report type: {report_type}'
+            }
+        
+        # The report's data is cheap to rebuild from the cubes; only the
+        # requested chart is drawn
+        if report_type == 'executive_dashboard':
+            result = self.generate_executive_dashboard(state_id=state_id, report_date=report_date)
+            entries = result['dashboard']['charts'] if result['success'] else []
+        else:
+            result = getattr(self, f'generate_{report_type}_report')(
+                state_id=state_id, lga_id=lga_id, report_date=report_date
+            )
+            entries = result['report']['sections'] if result['success'] else []
+        
+        for entry in entries:
+            chart = entry.get('chart')
+            if chart and chart['id'] == chart_id:
+                return {
+                    'success': True,
+                    'chart': chart,
+                    'image': self.render_chart(chart, image_format)
+                }
+        
+        return {
+            'success': False,
+            'message': f'No {chart_id} chart available for the specified parameters'
+        }
+    
+    def render_chart(self, chart, image_format=DEFAULT_CHART_FORMAT):
+        """
+        Get a chart's image, waiting for it to be drawn if needed
+        """
+        return self.submit_chart(chart, image_format).result()
+    
+    def submit_chart(self, chart, image_format=DEFAULT_CHART_FORMAT):
+        """
+        Start drawing a chart unless the chart cache has it or it is already
+        being drawn
+        
+        Images are keyed by a hash of what is drawn, so the same data is
+        rendered once however many reports, scopes and users ask for it.
+        Configure REPORT_CHART_CACHE as a bounded cache (e.g. LocMemCache
+        with MAX_ENTRIES, or Redis with an allkeys-lru policy) so the least
+        recently used images are evicted first.
+        
+        Returns:
+            Future: Resolves to the encoded image
+        """
+        key = chart_key(chart, image_format)
+        image = self.chart_cache.get(key)
+        if image is not None:
+            future = Future()
+            future.set_result(image)
+            return future
+        
+        with _charts_in_flight_lock:
+            future = _charts_in_flight.get(key)
+            if future is not None:
+                return future
+            future = submit_render(chart, image_format)
+            _charts_in_flight[key] = future
+        
+        future.add_done_callback(partial(self._store_chart, key))
+        return future
+    
+    def _store_chart(self, key, future):
+        """
+        Cache a drawn chart, then stop tracking it as in flight
+        """
+        if not future.cancelled() and future.exception() is None:
+            self.chart_cache.set(key, future.result(), getattr(settings, 'REPORT_CHART_CACHE_TIMEOUT', 7 * 24 * 3600))
+        with _charts_in_flight_lock:
+            if _charts_in_flight.get(key) is future:
+                del _charts_in_flight[key]
+    
+    def _chart(self, chart):
+        """
+        Get a section's chart spec, starting to draw it if prerendering
+        """
+        if self.prerender_format:
+            self.submit_chart(chart, self.prerender_format)
+        return chart
+    
+    def cache_timeout(self, report_type):
+        """
+        Get how long a generated report may be cached
+        
+        The latest aggregation run feeding the report decides, through the
+        is_cached and cache_expiry fields of its ReportMetadata.
+        
+        Returns:
+            int: Seconds, or 0 when the report should not be cached
+        """
+        metadata = ReportMetadata.objects.filter(
+            report_name__in=REPORT_SOURCES[report_type] + RUN_SOURCES
+        ).order_by('-last_generated').first()
+        
+        if metadata is None or not metadata.is_cached or metadata.cache_expiry is None:
+            return 0
+        return max(0, int((metadata.cache_expiry - timezone.now()).total_seconds()))
+    
+    def _level_stats(self, model, filters):
+        """
+        Get stats rows at the level matching the report's location filters
+        """
+        if filters.get('lga_id'):
+            level = LEVEL_LGA
+        elif filters.get('state_id'):
+            level = LEVEL_STATE
+        else:
+            level = LEVEL_NATIONAL
+        
+        stats = stats_queryset(model, filters['stat_date'])
+        
+        # Pre-rolled rows answer the report without summing every ward
+        rollups = stats.filter(level=level, **filters)
+        if rollups.exists():
+            return rollups
+        
+        # Dates aggregated before rollups were written only have ward rows
+        return stats.filter(level=LEVEL_WARD, **filters)
+    
     def execute_custom_report(self, report_id, parameters=None):
         """
         Execute a custom report
@@ -1054,3 +898,12 @@ class ReportGenerator:
                 'success': False,
                 'message': f'Error executing custom report: {str(e)}'
             }
+
+
+def _employment_rate(employed_count, unemployed_count):
+    """
+    Percentage of the employed among employed and unemployed citizens
+    """
+    if employed_count + unemployed_count > 0:
+        return (employed_count / (employed_count + unemployed_count)) * 100
+    return 0
@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from .models import (
     DemographicStats, OccupationStats, HealthcareStats, 
-    FamilyStats, InterestStats, ReportMetadata, CustomReport
+    FamilyStats, InterestStats, ReportMetadata, CustomReport, AggregationJob
 )
 
 class DemographicStatsSerializer(serializers.ModelSerializer):
@@ -59,3 +59,11 @@ class CustomReportSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomReport
         fields = '__all__'
+
+class AggregationJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for background aggregation jobs
+    """
+    class Meta:
+        model = AggregationJob
+        fields = '__all__'
@@ -0,0 +1,48 @@
+from django.apps import apps
+from django.db.models.signals import post_save, pre_delete
+from django.utils import timezone
+
+# Records of a citizen whose edits change the citizen's stats
+CITIZEN_RELATED_FIELDS = ['education', 'occupation', 'health', 'family', 'interests']
+
+# Citizen field of each related record model, resolved on first use
+_related_fields = None
+
+
+def _citizen_related_fields():
+    """
+    Get the citizen field pointing at each related record model
+    """
+    global _related_fields
+    if _related_fields is None:
+        citizen_model = apps.get_model('citizen', 'Citizen')
+        _related_fields = {
+            field.related_model: field
+            for field in map(citizen_model._meta.get_field, CITIZEN_RELATED_FIELDS)
+        }
+    return _related_fields
+
+
+def touch_citizens(sender, instance, raw=False, **kwargs):
+    """
+    Move the updated_at of the citizens owning a saved or deleted record
+    
+    Incremental aggregation watermarks wards by their citizens' latest
+    updated_at, which edits to related records would not otherwise move.
+    Deletions are handled before the record goes, while the citizen still
+    points at it.
+    """
+    field = _citizen_related_fields().get(sender)
+    if field is None or raw:
+        return
+    
+    citizen_model = field.model
+    if field.concrete:
+        owners = citizen_model.objects.filter(**{field.name: instance.pk})
+    else:
+        owners = citizen_model.objects.filter(pk=getattr(instance, field.field.attname))
+    owners.update(updated_at=timezone.now())
+
+
+post_save.connect(touch_citizens, dispatch_uid='reporting.touch_citizens')
+pre_delete.connect(touch_citizens, dispatch_uid='reporting.touch_citizens')
@@ -0,0 +1,337 @@
+from django.conf import settings
+from django.db import connection, models
+from django.utils import timezone
+from .models import (
+    DemographicStats, OccupationStats, HealthcareStats, FamilyStats, InterestStats,
+    StatDimension, StatValue, StatLocation, StatFact,
+    LEVEL_WARD, LEVEL_LGA, LEVEL_STATE, LEVEL_NATIONAL
+)
+
+# Stats families stored in the fact table, by the legacy model they replace
+FACT_FAMILIES = {
+    DemographicStats: 'demographic',
+    OccupationStats: 'occupation',
+    HealthcareStats: 'healthcare',
+    FamilyStats: 'family',
+    InterestStats: 'interest',
+}
+
+def location_key(level, state_id=None, lga_id=None, ward_id=None):
+    """
+    Build the unique key of a stats location
+    """
+    return ':'.join([level] + ['' if value is None else str(value) for value in (state_id, lga_id, ward_id)])
+
+def fact_queryset(model):
+    """
+    Get a legacy stats model's facts shaped like the legacy rows
+    
+    The queryset carries the legacy column names (state_id, lga_id,
+    ward_id and one column per dimension field, NULL except on the row's
+    own dimension), so the filters, values() and aggregates written for
+    the wide tables keep working.
+    
+    Args:
+        model: Legacy stats model in FACT_FAMILIES
+    
+    Returns:
+        QuerySet: StatFact rows of the model's family
+    """
+    annotations = {
+        'stat_id': models.F('fact_id'),
+        'state': models.F('location__state_id'),
+        'lga': models.F('location__lga_id'),
+        'ward': models.F('location__ward_id'),
+        'state_id': models.F('location__state_id'),
+        'lga_id': models.F('location__lga_id'),
+        'ward_id': models.F('location__ward_id'),
+    }
+    for field in model.dimension_fields:
+        annotations[field] = models.Case(
+            models.When(dimension__field=field, then=models.F('value__value')),
+            output_field=models.CharField()
+        )
+    
+    return StatFact.objects.filter(dimension__family=FACT_FAMILIES[model]).annotate(**annotations)
+
+def stats_queryset(model, stat_date):
+    """
+    Get a date's stats rows for a stats model
+    
+    Families written to the fact table are read through fact_queryset();
+    dates aggregated before the fact table existed, and tables that are
+    not part of it, are read from the model's own table.
+    
+    Args:
+        model: Stats model
+        stat_date (date): Date of the stats rows
+    
+    Returns:
+        QuerySet: Rows with the model's column names
+    """
+    if model in FACT_FAMILIES:
+        facts = fact_queryset(model).filter(stat_date=stat_date)
+        if facts.exists():
+            return facts
+    return model.objects.filter(stat_date=stat_date)
+
+def export_columns(model):
+    """
+    Get the columns of a stats model in export order
+    """
+    return [
+        'stat_id', 'stat_date', 'state', 'lga', 'ward', 'level',
+        *model.dimension_fields,
+        'count', 'percentage', 'created_at', 'updated_at'
+    ]
+
+class FactStore:
+    """
+    Writes stats facts, creating dimension, value and location rows as needed
+    
+    Lookup ids are cached per store, so one aggregation run resolves each
+    dimension value and location once.
+    
+    Custom reports query the legacy wide tables with raw SQL, so ward rows
+    are also written there while ``REPORT_WRITE_LEGACY_STATS`` is on, until
+    those reports are moved to the facts.
+    """
+    
+    def __init__(self, write_legacy=None):
+        self._dimensions = {}
+        self._values = {}
+        self._locations = {}
+        
+        if write_legacy is None:
+            write_legacy = getattr(settings, 'REPORT_WRITE_LEGACY_STATS', True)
+        self.write_legacy = write_legacy
+    
+    def dimension_id(self, model, field):
+        """
+        Get the id of a legacy model's dimension field
+        """
+        key = (FACT_FAMILIES[model], field)
+        if key not in self._dimensions:
+            dimension, _ = StatDimension.objects.get_or_create(family=key[0], field=field)
+            self._dimensions[key] = dimension.dimension_id
+        return self._dimensions[key]
+    
+    def value_ids(self, dimension_id, values):
+        """
+        Get value ids of a dimension, keyed by value
+        """
+        missing = {value for value in values if (dimension_id, value) not in self._values}
+        if missing:
+            StatValue.objects.bulk_create(
+                [StatValue(dimension_id=dimension_id, value=value) for value in missing],
+                ignore_conflicts=True
+            )
+            for value_id, value in StatValue.objects.filter(
+                dimension_id=dimension_id, value__in=missing
+            ).values_list('value_id', 'value'):
+                self._values[(dimension_id, value)] = value_id
+        
+        return {value: self._values[(dimension_id, value)] for value in values}
+    
+    def location_ids(self, level, locations):
+        """
+        Get location ids of (state_id, lga_id, ward_id) tuples at a level
+        """
+        keys = {location: location_key(level, *location) for location in locations}
+        missing = {key: location for location, key in keys.items() if key not in self._locations}
+        if missing:
+            StatLocation.objects.bulk_create([
+                StatLocation(
+                    level=level,
+                    state_id=state_id,
+                    lga_id=lga_id,
+                    ward_id=ward_id,
+                    location_key=key
+                )
+                for key, (state_id, lga_id, ward_id) in missing.items()
+            ], ignore_conflicts=True)
+            for location_id, key in StatLocation.objects.filter(
+                location_key__in=list(missing)
+            ).values_list('location_id', 'location_key'):
+                self._locations[key] = location_id
+        
+        return {location: self._locations[key] for location, key in keys.items()}
+    
+    def clear(self, model, stat_date, level, state_id=None, lga_id=None, ward_ids=None):
+        """
+        Delete a family's facts at one level within a scope
+        """
+        scope = {}
+        if state_id:
+            scope['location__state_id'] = state_id
+        if lga_id:
+            scope['location__lga_id'] = lga_id
+        if ward_ids is not None:
+            scope['location__ward_id__in'] = ward_ids
+        
+        StatFact.objects.filter(
+            stat_date=stat_date,
+            level=level,
+            dimension__family=FACT_FAMILIES[model],
+            **scope
+        ).delete()
+        
+        if self.write_legacy:
+            legacy_scope = {key.replace('location__', ''): value for key, value in scope.items()}
+            model.objects.filter(stat_date=stat_date, level=level, **legacy_scope).delete()
+    
+    def write_ward_rows(self, model, field, stat_date, rows):
+        """
+        Write ward facts of one dimension
+        
+        Args:
+            model: Legacy stats model in FACT_FAMILIES
+            field (str): Dimension field of the legacy model
+            stat_date (date): Date of the stats
+            rows: (location, value, count, percentage) tuples where the
+                location is a (state_id, lga_id, ward_id) tuple
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        
+        dimension_id = self.dimension_id(model, field)
+        value_ids = self.value_ids(dimension_id, {value for _, value, _, _ in rows})
+        location_ids = self.location_ids(LEVEL_WARD, {location for location, _, _, _ in rows})
+        
+        StatFact.objects.bulk_create([
+            StatFact(
+                stat_date=stat_date,
+                level=LEVEL_WARD,
+                location_id=location_ids[location],
+                dimension_id=dimension_id,
+                value_id=value_ids[value],
+                count=count,
+                percentage=percentage
+            )
+            for location, value, count, percentage in rows
+        ], batch_size=1000)
+        
+        if self.write_legacy:
+            model.objects.bulk_create([
+                model(
+                    stat_date=stat_date,
+                    level=LEVEL_WARD,
+                    state_id=state_id,
+                    lga_id=lga_id,
+                    ward_id=ward_id,
+                    count=count,
+                    percentage=percentage,
+                    **{field: value}
+                )
+                for (state_id, lga_id, ward_id), value, count, percentage in rows
+            ], batch_size=1000)
+    
+    def copy_ward_rows(self, source_date, target_date, ward_ids=None):
+        """
+        Copy every family's ward facts, and legacy ward rows, from one date
+        to another
+        
+        Args:
+            source_date (date): Date to copy from
+            target_date (date): Date to copy to
+            ward_ids (list): Only copy these wards' rows
+        """
+        table = StatFact._meta.db_table
+        location_table = StatLocation._meta.db_table
+        now = timezone.now()
+        
+        # Facts reach their ward through the location table
+        ward_sql, legacy_ward_sql = '', ''
+        if ward_ids is not None:
+            placeholders = ', '.join(['%s'] * len(ward_ids))
+            ward_sql = f" AND location_id IN (SELECT location_id FROM {location_table} WHERE ward_id IN ({placeholders}))"
+            legacy_ward_sql = f" AND ward_id IN ({placeholders})"
+        ward_params = list(ward_ids or [])
+        
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {table} (
+                    stat_date, level, location_id, dimension_id, value_id,
+                    count, percentage, created_at, updated_at
+                )
+                SELECT %s, level, location_id, dimension_id, value_id, count, percentage, %s, %s
+                FROM {table}
+                WHERE stat_date = %s AND level = %s{ward_sql}
+            """, [target_date, now, now, source_date, LEVEL_WARD, *ward_params])
+            
+            if not self.write_legacy:
+                return
+            
+            for model in FACT_FAMILIES:
+                legacy_table = model._meta.db_table
+                columns = ', '.join(['state_id', 'lga_id', 'ward_id', *model.dimension_fields, 'count', 'percentage'])
+                cursor.execute(f"""
+                    INSERT INTO {legacy_table} (stat_date, level, {columns}, created_at, updated_at)
+                    SELECT %s, level, {columns}, %s, %s
+                    FROM {legacy_table}
+                    WHERE stat_date = %s AND level = %s{legacy_ward_sql}
+                """, [target_date, now, now, source_date, LEVEL_WARD, *ward_params])
+    
+    def write_rollups(self, model, stat_date, state_id=None, lga_id=None):
+        """
+        Replace a family's LGA, state and national facts affected by a scope
+        
+        Each level is one INSERT ... SELECT summing the ward facts into the
+        level's locations, with percentages per location and dimension.
+        """
+        family = FACT_FAMILIES[model]
+        ward_scope = {}
+        if state_id:
+            ward_scope['state_id'] = state_id
+        if lga_id:
+            ward_scope['lga_id'] = lga_id
+        
+        # Make sure every location rolled up into exists
+        wards = set(StatLocation.objects.filter(
+            level=LEVEL_WARD, **ward_scope
+        ).values_list('state_id', 'lga_id'))
+        self.location_ids(LEVEL_LGA, {(state, lga, None) for state, lga in wards})
+        self.location_ids(LEVEL_STATE, {(state, None, None) for state, _ in wards})
+        self.location_ids(LEVEL_NATIONAL, {(None, None, None)})
+        
+        # The run's own LGAs, the state containing them, and the nation
+        rollup_scopes = [
+            (LEVEL_LGA, ['state_id', 'lga_id'], {'state_id': state_id, 'lga_id': lga_id}),
+            (LEVEL_STATE, ['state_id'], {'state_id': state_id}),
+            (LEVEL_NATIONAL, [], {}),
+        ]
+        
+        fact_table = StatFact._meta.db_table
+        location_table = StatLocation._meta.db_table
+        dimension_table = StatDimension._meta.db_table
+        now = timezone.now()
+        
+        for level, join_columns, scope in rollup_scopes:
+            scope = {column: value for column, value in scope.items() if value}
+            self.clear(model, stat_date, level, scope.get('state_id'), scope.get('lga_id'))
+            
+            join_sql = ' AND '.join(
+                [f"target.{column} = ward.{column}" for column in join_columns] or ['1 = 1']
+            )
+            scope_sql = ''.join(f" AND ward.{column} = %s" for column in scope)
+            
+            with connection.cursor() as cursor:
+                cursor.execute(f"""
+                    INSERT INTO {fact_table} (
+                        stat_date, level, location_id, dimension_id, value_id,
+                        count, percentage, created_at, updated_at
+                    )
+                    SELECT %s, %s, target.location_id, fact.dimension_id, fact.value_id,
+                        SUM(fact.count),
+                        ROUND(SUM(fact.count) * 100.0 / SUM(SUM(fact.count)) OVER (
+                            PARTITION BY target.location_id, fact.dimension_id
+                        ), 2),
+                        %s, %s
+                    FROM {fact_table} fact
+                    JOIN {dimension_table} dimension ON dimension.dimension_id = fact.dimension_id
+                    JOIN {location_table} ward ON ward.location_id = fact.location_id
+                    JOIN {location_table} target ON target.level = %s AND {join_sql}
+                    WHERE fact.stat_date = %s AND fact.level = %s AND dimension.family = %s{scope_sql}
+                    GROUP BY target.location_id, fact.dimension_id, fact.value_id
+                """, [stat_date, level, now, now, level, stat_date, LEVEL_WARD, family, *scope.values()])
@@ -0,0 +1,24 @@
+from celery import shared_task
+from celery.signals import worker_process_init
+from django.conf import settings
+from .aggregation_jobs import run_job
+from .lazy_imports import preload
+
+
+@worker_process_init.connect
+def preload_reporting_modules(**kwargs):
+    """
+    Import pandas, NumPy and the chart libraries as each Celery worker
+    process starts, when REPORTING_PRELOAD is set, so the first job does
+    not pay for them
+    """
+    if getattr(settings, 'REPORTING_PRELOAD', False):
+        preload()
+
+
+@shared_task(name='reporting.run_aggregation_job', acks_late=True)
+def run_aggregation_job(job_id):
+    """
+    Run a queued aggregation job on a Celery worker
+    """
+    run_job(job_id)
@@ -1,18 +1,60 @@
+import base64
+import csv
+import gzip
+import importlib.util
 import unittest
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.db import models
 from django.contrib.auth.models import User
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 from reporting.models import (
     DemographicStats, OccupationStats, HealthcareStats, 
-    FamilyStats, InterestStats, ReportMetadata, CustomReport
+    FamilyStats, InterestStats, CrossTabStats, HouseholdStats, ReportMetadata, CustomReport,
+    DashboardSnapshot, StatsVersion,
+    StatDimension, StatValue, StatLocation, StatFact, AggregationWatermark, AggregationJob,
+    AggregationRun, AggregationStageTiming,
+    LEVEL_WARD, LEVEL_LGA, LEVEL_STATE, LEVEL_NATIONAL,
+    JOB_QUEUED, JOB_RUNNING, JOB_COMPLETED, JOB_FAILED
 )
 from reporting.data_aggregator import DataAggregator
+from reporting.parallel_aggregator import ParallelAggregator, AggregationPartition
+from reporting.incremental_aggregator import IncrementalAggregator
+from reporting.aggregation_jobs import (
+    submit_job, run_job, ScopeConflict, JobHeartbeat, _create_unless_overlapping, _overlapping
+)
 from reporting.report_generator import ReportGenerator
+from reporting.report_cache import ReportCache
+from reporting.exports import citizen_extract, CITIZEN_EXTRACT_COLUMNS
+from reporting.charts import pie_chart, bar_chart, render_chart
+from reporting.lazy_imports import LazyModule, lazy_import
+from reporting import olap_cube
+from reporting.olap_cube import CubeStore, StatsCube, bump_stats_version
+from reporting.crosstabs import count_combinations
+from reporting.star_schema import fact_queryset, stats_queryset
+from reporting.vocabularies import CategoryVocabulary, VocabularyRegistry
+from reporting.age_engine import (
+    AGE_GROUP_LABELS, completed_years, age_group_boundaries,
+    assign_age_groups, order_age_groups
+)
 from django.utils import timezone
 from datetime import date, timedelta
+from unittest import mock
+from concurrent.futures import Future
+from citizen.models import Citizen
+import numpy as np
+import pandas as pd
+import tempfile
+from decimal import Decimal
+import tracemalloc
+import threading
+import time
 import json
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
 
 class ReportingModelsTestCase(TestCase):
     """
@@ -288,6 +330,9 @@ class ReportGeneratorTestCase(TestCase):
             parameters={'state_id': 1}
         )
         
+        # Stats rows are versioned by aggregation, which these bypass
+        bump_stats_version(self.test_date)
+        
         # Initialize report generator
         self.report_generator = ReportGenerator()
     
@@ -398,6 +443,75 @@ class ReportGeneratorTestCase(TestCase):
         self.assertIsNotNone(employment_rate_metric)
         self.assertEqual(employment_rate_metric['value'], '71.9%')
     
+    def test_chart_cache(self):
+        """
+        Test identical chart data is rendered once across reports and scopes
+        """
+        from django.core.cache.backends.locmem import LocMemCache
+        report_generator = ReportGenerator(chart_cache=LocMemCache('charts', {}))
+        
+        def drawn(chart, image_format):
+            future = Future()
+            future.set_result(b'image')
+            return future
+        
+        with mock.patch('reporting.report_generator.submit_render', side_effect=drawn) as render:
+            # The state and national reports plot the same gender totals
+            for state_id in [self.state_id, None]:
+                result = report_generator.generate_chart(
+                    'demographic', 'gender', state_id=state_id, report_date=self.test_date
+                )
+                self.assertEqual(result['image'], b'image')
+            self.assertEqual(render.call_count, 1)
+            
+            # Different data gets its own image
+            DemographicStats.objects.create(
+                stat_date=self.test_date, state_id=2, lga_id=2, ward_id=2,
+                gender='Female', count=5, percentage=100.0
+            )
+            bump_stats_version(self.test_date)
+            report_generator.generate_chart('demographic', 'gender', report_date=self.test_date)
+            self.assertEqual(render.call_count, 2)
+    
+    def test_chart_in_flight_is_shared(self):
+        """
+        Test a chart asked for while it is being drawn is not drawn again
+        """
+        from django.core.cache.backends.locmem import LocMemCache
+        report_generator = ReportGenerator(chart_cache=LocMemCache('charts', {}))
+        chart = pie_chart('gender', [{'gender': 'Male', 'total': 3}], 'Gender Distribution')
+        drawing = Future()
+        
+        with mock.patch('reporting.report_generator.submit_render', return_value=drawing) as submit:
+            first = report_generator.submit_chart(chart)
+            second = ReportGenerator(chart_cache=report_generator.chart_cache).submit_chart(chart)
+            self.assertIs(first, second)
+            self.assertEqual(submit.call_count, 1)
+            
+            # Once drawn the image comes from the cache
+            drawing.set_result(b'image')
+            self.assertEqual(report_generator.render_chart(chart), b'image')
+            self.assertEqual(submit.call_count, 1)
+    
+    def test_render_chart_without_pyplot(self):
+        """
+        Test charts draw concurrently without leaving pyplot figures open
+        """
+        import matplotlib.pyplot as plt
+        from concurrent.futures import ThreadPoolExecutor
+        charts = [
+            pie_chart('gender', [{'gender': 'Male', 'total': 3}, {'gender': 'Female', 'total': 2}], 'Gender'),
+            bar_chart('age_group', [{'age_group': '0-4', 'total': 1}, {'age_group': '5-9', 'total': 4}], 'Age', 'Age Group'),
+        ] * 2
+        
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            images = list(executor.map(render_chart, charts))
+        
+        for image in images:
+            self.assertIn(b'<svg', image)
+        self.assertEqual(images[0], images[2])
+        self.assertEqual(plt.get_fignums(), [])
+    
     def test_execute_custom_report(self):
         """
         Test custom report execution
@@ -492,9 +606,15 @@ class ReportAPITestCase(TestCase):
             percentage=72.0
         )
         
+        # Stats rows are versioned by aggregation, which these bypass
+        bump_stats_version(self.test_date)
+        
         # Create API client
         self.client = APIClient()
         self.client.force_authenticate(user=self.user)
+        
+        # Reports cached by earlier tests were built from rolled back rows
+        cache.clear()
     
     def test_demographic_report_api(self):
         """
@@ -561,6 +681,143 @@ class ReportAPITestCase(TestCase):
         self.assertEqual(response['Content-Type'], 'text/csv')
         self.assertIn('attachment; filename="demographic_report_', response['Content-Disposition'])
     
+    def test_export_csv_streams(self):
+        """
+        Test CSV exports are streamed, and gzipped for clients accepting it
+        """
+        url = reverse('reports-export-csv')
+        parameters = {'type': 'demographic', 'report_date': self.test_date.isoformat()}
+        
+        response = self.client.get(url, parameters)
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content)
+        rows = list(csv.reader(StringIO(content.decode('utf-8'))))
+        self.assertEqual(rows[0][:3], ['stat_id', 'stat_date', 'state'])
+        self.assertEqual(sorted(row[rows[0].index('gender')] for row in rows[1:]), ['Female', 'Male'])
+        
+        response = self.client.get(url, parameters, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), content)
+        
+        # Exports without rows still have their header
+        response = self.client.get(url, {'type': 'family', 'report_date': self.test_date.isoformat()})
+        self.assertEqual(b''.join(response.streaming_content).decode('utf-8').splitlines()[0].split(',')[:2], ['stat_id', 'stat_date'])
+    
+    def test_export_columnar(self):
+        """
+        Test columnar export parameters and the missing pyarrow response
+        """
+        url = reverse('reports-export')
+        parameters = {'type': 'demographic', 'report_date': self.test_date.isoformat()}
+        
+        response = self.client.get(url, dict(parameters, file_format='xlsx'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {'type': 'unknown', 'file_format': 'arrow'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        with mock.patch.dict('sys.modules', {'pyarrow': None, 'pyarrow.parquet': None}):
+            response = self.client.get(url, parameters)
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+        
+        # Citizen extracts need the reporting permission and a jurisdiction
+        response = self.client.get(url, {'type': 'citizens', 'state_id': self.state_id})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        
+        from django.contrib.auth.models import Permission
+        from django.contrib.contenttypes.models import ContentType
+        
+        permission = Permission.objects.create(
+            codename='generate_reports',
+            name='Can generate reports',
+            content_type=ContentType.objects.get_for_model(DemographicStats),
+        )
+        self.user.user_permissions.add(permission)
+        self.user = User.objects.get(pk=self.user.pk)
+        self.client.force_authenticate(user=self.user)
+        
+        response = self.client.get(url, {'type': 'citizens'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_citizen_extract_jurisdiction(self):
+        """
+        Test citizen extracts are refused outside the user's jurisdiction
+        """
+        from django.contrib.auth.models import Permission
+        from django.contrib.contenttypes.models import ContentType
+        
+        permission = Permission.objects.create(
+            codename='generate_reports',
+            name='Can generate reports',
+            content_type=ContentType.objects.get_for_model(DemographicStats),
+        )
+        self.user.user_permissions.add(permission)
+        self.user = User.objects.get(pk=self.user.pk)
+        self.client.force_authenticate(user=self.user)
+        
+        # The user administers LGA 1 of state 1
+        def has_jurisdiction(state_id=None, lga_id=None, ward_id=None):
+            return state_id == 1 and lga_id in (None, 1)
+        
+        url = reverse('reports-export')
+        with mock.patch.object(
+            User, 'has_jurisdiction', side_effect=has_jurisdiction, create=True
+        ) as jurisdiction, mock.patch.dict('sys.modules', {'pyarrow': None, 'pyarrow.parquet': None}):
+            for parameters in [{'state_id': 2}, {'state_id': 1, 'lga_id': 2}]:
+                response = self.client.get(url, {'type': 'citizens', **parameters})
+                self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+            
+            # LGAs are only taken with their state, and ids must be numbers
+            for parameters in [{'lga_id': 1}, {'state_id': 'one'}, {'state_id': 1, 'lga_id': '1; --'}]:
+                response = self.client.get(url, {'type': 'citizens', **parameters})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            
+            # Within the jurisdiction the extract goes ahead
+            response = self.client.get(url, {'type': 'citizens', 'state_id': '1', 'lga_id': '1'})
+            self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+        
+        jurisdiction.assert_called_with(state_id=1, lga_id=1)
+    
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_export_parquet(self):
+        """
+        Test stats export as Parquet with dictionary encoded dimensions
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        response = self.client.get(reverse('reports-export'), {
+            'type': 'demographic', 'file_format': 'parquet', 'report_date': self.test_date.isoformat()
+        })
+        self.assertEqual(response['Content-Type'], 'application/vnd.apache.parquet')
+        table = pq.read_table(pa.BufferReader(b''.join(response.streaming_content)))
+        
+        self.assertEqual(sorted(table.column('gender').to_pylist()), ['Female', 'Male'])
+        self.assertTrue(pa.types.is_dictionary(table.schema.field('gender').type))
+        self.assertEqual(sum(table.column('count').to_pylist()), 167)
+    
+    def test_citizen_extract_scope(self):
+        """
+        Test citizen extracts hold only the jurisdiction's citizens
+        """
+        for index, (state_id, lga_id) in enumerate([(1, 1), (1, 2), (2, 3)]):
+            Citizen.objects.create(
+                first_name=f'Citizen{index}',
+                last_name='Test',
+                gender='Female',
+                date_of_birth='1990-01-01',
+                phone_number=f'0801234567{index}',
+                email=f'citizen{index}@example.com',
+                address='123 Main St',
+                residence_state_id=state_id,
+                residence_lga_id=lga_id,
+                residence_ward_id=index + 1
+            )
+        
+        self.assertEqual(citizen_extract(state_id=1).count(), 2)
+        self.assertEqual(citizen_extract(lga_id=3).count(), 1)
+        self.assertNotIn('email', [path for path, name in CITIZEN_EXTRACT_COLUMNS])
+    
     def test_run_aggregation_api(self):
         """
         Test run aggregation API endpoint
@@ -584,9 +841,237 @@ class ReportAPITestCase(TestCase):
             'lga_id': self.lga_id
         }, format='json')
         
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['message'], 'Data aggregation queued')
+        self.assertEqual(response.data['status'], JOB_QUEUED)
+        
+        # Progress is polled from the job's URL
+        response = self.client.get(response.data['status_url'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['state'], self.state_id)
+        self.assertEqual(response.data['lga'], self.lga_id)
+    
+    def test_report_chart_urls(self):
+        """
+        Test reports link to charts rendered by the chart endpoint
+        """
+        with mock.patch.object(ReportGenerator, 'submit_chart') as submit_chart:
+            response = self.client.get(reverse('reports-demographic'), {
+                'state_id': self.state_id,
+                'report_date': self.test_date.isoformat()
+            })
+        
+        # Linked charts are only drawn when fetched
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        submit_chart.assert_not_called()
+        gender_section = response.data['sections'][0]
+        self.assertNotIn('chart', gender_section)
+        self.assertIn('chart=gender', gender_section['chart_url'])
+        
+        # Charts are SVG unless another format is asked for
+        response = self.client.get(gender_section['chart_url'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertIn(b'<svg', response.content)
+    
+    def test_chart_formats(self):
+        """
+        Test charts can be rendered as SVG, PNG or WebP
+        """
+        url = reverse('reports-chart')
+        signatures = {'svg': b'<svg', 'png': b'\x89PNG', 'webp': b'WEBP'}
+        
+        for chart_format, signature in signatures.items():
+            response = self.client.get(url, {
+                'report': 'demographic',
+                'chart': 'gender',
+                'report_date': self.test_date.isoformat(),
+                'chart_format': chart_format
+            })
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn(signature, response.content[:200])
+        
+        # Report chart URLs carry the format through
+        response = self.client.get(reverse('reports-demographic'), {'chart_format': 'webp'})
+        self.assertIn('chart_format=webp', response.data['sections'][0]['chart_url'])
+    
+    def test_report_data_only(self):
+        """
+        Test reports can be requested without charts
+        """
+        response = self.client.get(reverse('reports-executive-dashboard'), {
+            'report_date': self.test_date.isoformat(),
+            'charts': 'none'
+        })
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for entry in response.data['charts']:
+            self.assertNotIn('chart', entry)
+            self.assertNotIn('chart_url', entry)
+    
+    def test_report_inline_charts(self):
+        """
+        Test reports can embed their charts as base64 images
+        """
+        response = self.client.get(reverse('reports-occupation'), {
+            'report_date': self.test_date.isoformat(),
+            'charts': 'inline',
+            'chart_format': 'png'
+        })
+        
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIn('message', response.data)
-        self.assertEqual(response.data['message'], 'Data aggregation completed successfully')
+        section = response.data['sections'][0]
+        self.assertNotIn('chart_url', section)
+        self.assertEqual(section['chart_content_type'], 'image/png')
+        self.assertTrue(base64.b64decode(section['chart_image']).startswith(b'\x89PNG'))
+    
+    def test_chart_api_errors(self):
+        """
+        Test the chart endpoint rejects unknown reports and charts
+        """
+        url = reverse('reports-chart')
+        
+        response = self.client.get(url, {'report': 'unknown', 'chart': 'gender'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        response = self.client.get(url, {'report': 'demographic', 'chart': 'religion'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        
+        response = self.client.get(url, {'report': 'demographic', 'chart': 'gender', 'chart_format': 'gif'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_report_cache(self):
+        """
+        Test reports are served from the report cache until the aggregator
+        writes their date and scope
+        """
+        ReportMetadata.objects.create(
+            report_name='demographic_aggregation',
+            last_generated=timezone.now(),
+            is_cached=True,
+            cache_expiry=timezone.now() + timedelta(days=1)
+        )
+        url = reverse('reports-demographic')
+        parameters = {'state_id': self.state_id, 'report_date': self.test_date.isoformat()}
+        
+        response = self.client.get(url, parameters)
+        self.assertEqual(response['X-Report-Cache'], 'miss')
+        
+        cached = self.client.get(url, parameters)
+        self.assertEqual(cached['X-Report-Cache'], 'hit')
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(json.loads(cached.content)['title'], 'Demographic Report')
+        
+        # Each format is cached on its own
+        response = self.client.get(url, {**parameters, 'charts': 'none'})
+        self.assertEqual(response['X-Report-Cache'], 'miss')
+        
+        # Another state's run leaves the report cached; its own state's does not
+        with self.captureOnCommitCallbacks(execute=True):
+            DataAggregator(stat_date=self.test_date).rebuild_rollups(state_id=self.state_id + 1)
+        self.assertEqual(self.client.get(url, parameters)['X-Report-Cache'], 'hit')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            DataAggregator(stat_date=self.test_date).rebuild_rollups(state_id=self.state_id)
+        self.assertEqual(self.client.get(url, parameters)['X-Report-Cache'], 'miss')
+        
+        response = self.client.get(reverse('reports-cache-stats'))
+        self.assertEqual(response.data['hits'], 2)
+        self.assertEqual(response.data['misses'], 3)
+        self.assertEqual(response.data['hit_ratio'], 0.4)
+    
+    def test_report_cache_follows_metadata(self):
+        """
+        Test reports are not cached when their aggregation metadata does not
+        allow it
+        """
+        ReportMetadata.objects.create(
+            report_name='occupation_aggregation',
+            last_generated=timezone.now(),
+            is_cached=False
+        )
+        url = reverse('reports-occupation')
+        
+        for _ in range(2):
+            response = self.client.get(url, {'report_date': self.test_date.isoformat()})
+            self.assertEqual(response['X-Report-Cache'], 'miss')
+        
+        # An expired entry is as good as none
+        ReportMetadata.objects.create(
+            report_name='all_aggregations',
+            last_generated=timezone.now(),
+            is_cached=True,
+            cache_expiry=timezone.now() - timedelta(minutes=1)
+        )
+        self.assertEqual(ReportGenerator().cache_timeout('occupation'), 0)
+    
+    @override_settings(REPORT_CACHE_REFRESH_WORKERS=0)
+    def test_report_cache_serves_stale(self):
+        """
+        Test expired reports are served while they are regenerated
+        """
+        ReportMetadata.objects.create(
+            report_name='all_aggregations',
+            last_generated=timezone.now(),
+            is_cached=True,
+            cache_expiry=timezone.now() + timedelta(hours=1)
+        )
+        url = reverse('reports-executive-dashboard')
+        parameters = {'report_date': self.test_date.isoformat(), 'charts': 'none'}
+        response = self.client.get(url, parameters)
+        self.assertEqual(response['X-Report-Cache'], 'miss')
+        
+        # Two minutes past expiry, within the stale timeout
+        later = time.time() + 3600 + 120
+        with mock.patch('reporting.report_cache.time.time', return_value=later):
+            stale = self.client.get(url, parameters)
+            self.assertEqual(stale['X-Report-Cache'], 'stale')
+            self.assertEqual(stale.content, response.content)
+            
+            # The refresh cached it afresh and released the lock
+            self.assertEqual(self.client.get(url, parameters)['X-Report-Cache'], 'hit')
+            report_cache = ReportCache()
+            self.assertTrue(report_cache.acquire(
+                report_cache.key('executive_dashboard', self.test_date, variant='none:svg')
+            ))
+        
+        self.assertEqual(self.client.get(reverse('reports-cache-stats')).data['stale_hits'], 1)
+    
+    def test_report_cache_coalesces(self):
+        """
+        Test requests for a report another request is generating wait for
+        its entry instead of generating it again
+        """
+        report_cache = ReportCache()
+        key = report_cache.key('demographic', self.test_date, variant='none:svg')
+        self.assertTrue(report_cache.acquire(key))
+        self.assertFalse(report_cache.acquire(key))
+        
+        # The lock holder caches the report a moment later
+        timer = threading.Timer(0.1, report_cache.set, [key, b'{"title": "Demographic Report"}', 60])
+        timer.start()
+        with mock.patch.object(ReportGenerator, 'generate_demographic_report') as generate:
+            response = self.client.get(reverse('reports-demographic'), {
+                'report_date': self.test_date.isoformat(),
+                'charts': 'none'
+            })
+        timer.join()
+        
+        self.assertEqual(response['X-Report-Cache'], 'coalesced')
+        self.assertEqual(json.loads(response.content)['title'], 'Demographic Report')
+        generate.assert_not_called()
+        
+        # A lock released without an entry sends the waiter to generate it
+        report_cache.cache.delete(key)
+        with self.settings(REPORT_CACHE_LOCK_WAIT=1):
+            timer = threading.Timer(0.1, report_cache.release, [key])
+            timer.start()
+            response = self.client.get(reverse('reports-demographic'), {
+                'report_date': self.test_date.isoformat(),
+                'charts': 'none'
+            })
+            timer.join()
+        self.assertEqual(response['X-Report-Cache'], 'miss')
     
     def test_unauthorized_access(self):
         """
@@ -601,5 +1086,1587 @@ class ReportAPITestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+class ParallelAggregatorTestCase(TestCase):
+    """
+    Test cases for the partitioned aggregation driver
+    """
+    
+    def setUp(self):
+        """
+        Set up citizens across two states
+        """
+        residences = [(1, 1, 1), (1, 1, 2), (1, 2, 3), (2, 3, 4)]
+        for index, (state_id, lga_id, ward_id) in enumerate(residences):
+            Citizen.objects.create(
+                first_name=f'Citizen{index}',
+                last_name='Test',
+                gender='Male' if index % 2 else 'Female',
+                date_of_birth='1990-01-01',
+                phone_number=f'0801234567{index}',
+                email=f'citizen{index}@example.com',
+                address='123 Main St',
+                residence_state_id=state_id,
+                residence_lga_id=lga_id,
+                residence_ward_id=ward_id
+            )
+    
+    def test_plan_partitions_by_state(self):
+        """
+        Test that small states become one partition each, largest first
+        """
+        partitions = ParallelAggregator().plan_partitions()
+        
+        self.assertEqual(partitions, [
+            AggregationPartition(1, None, 3),
+            AggregationPartition(2, None, 1),
+        ])
+    
+    def test_plan_partitions_splits_large_states(self):
+        """
+        Test that states above the threshold are split by LGA
+        """
+        partitions = ParallelAggregator(lga_split_threshold=2).plan_partitions()
+        
+        self.assertEqual(partitions, [
+            AggregationPartition(1, 1, 2),
+            AggregationPartition(1, 2, 1),
+            AggregationPartition(2, None, 1),
+        ])
+    
+    def test_failed_partitions_are_retried(self):
+        """
+        Test that a failing partition is retried and reported
+        """
+        calls = []
+        
+        def flaky_partition(partition, stat_date, memory_target_mb=None):
+            calls.append(partition.state_id)
+            if partition.state_id == 2 and calls.count(2) == 1:
+                raise RuntimeError('worker lost')
+            return 0.5
+        
+        with mock.patch('reporting.parallel_aggregator._aggregate_partition', flaky_partition):
+            summary = ParallelAggregator(workers=1, max_retries=1).run()
+        
+        self.assertEqual(calls.count(2), 2)
+        self.assertEqual(summary['failed'], [])
+        self.assertEqual(summary['citizen_count'], 4)
+        
+        retried = [result for result in summary['partitions'] if result['state_id'] == 2][0]
+        self.assertEqual(retried['attempts'], 2)
+        self.assertTrue(retried['success'])
+    
+    def test_partition_gives_up_after_max_retries(self):
+        """
+        Test that a partition failing every attempt is reported as failed
+        """
+        with mock.patch(
+            'reporting.parallel_aggregator._aggregate_partition',
+            side_effect=RuntimeError('database unavailable')
+        ):
+            summary = ParallelAggregator(workers=1, max_retries=2).run(state_id=2)
+        
+        self.assertEqual(len(summary['failed']), 1)
+        self.assertEqual(summary['failed'][0]['attempts'], 3)
+        self.assertEqual(summary['failed'][0]['error'], 'database unavailable')
+    
+    def test_failed_run_skips_rollups(self):
+        """
+        Test that rollups and metadata are left alone when a partition fails
+        """
+        stages = []
+        with mock.patch(
+            'reporting.parallel_aggregator._aggregate_partition',
+            side_effect=RuntimeError('database unavailable')
+        ), mock.patch.object(DataAggregator, 'rebuild_rollups') as rebuild_rollups:
+            summary = ParallelAggregator(workers=1, max_retries=0).run(
+                on_stage=lambda name, partitions: stages.append(name)
+            )
+        
+        self.assertEqual(len(summary['failed']), 2)
+        self.assertEqual(stages, ['partitions'])
+        rebuild_rollups.assert_not_called()
+        self.assertFalse(ReportMetadata.objects.filter(report_name='parallel_aggregation').exists())
+
+
+class StreamingAggregationTestCase(TestCase):
+    """
+    Test cases for chunked streaming aggregation
+    """
+    
+    def setUp(self):
+        """
+        Set up citizens spread over a few wards
+        """
+        for index in range(7):
+            Citizen.objects.create(
+                first_name=f'Citizen{index}',
+                last_name='Test',
+                gender='Male' if index % 3 else 'Female',
+                date_of_birth=date(1960 + index * 7, 1, 1),
+                phone_number=f'0801234567{index}',
+                email=f'citizen{index}@example.com',
+                address='123 Main St',
+                religion='Christianity' if index % 2 else 'Islam',
+                residence_state_id=1,
+                residence_lga_id=1,
+                residence_ward_id=index % 2 + 1
+            )
+    
+    def _demographic_rows(self):
+        """
+        Get today's demographic stats as comparable tuples
+        """
+        return sorted(fact_queryset(DemographicStats).values_list(
+            'ward_id', 'gender', 'age_group', 'religion', 'count', 'percentage'
+        ), key=str)
+    
+    def test_streaming_matches_single_pass(self):
+        """
+        Test that chunked aggregation produces the same stats as one pass
+        """
+        DataAggregator().aggregate_demographics()
+        single_pass = self._demographic_rows()
+        
+        DataAggregator(chunk_size=2).aggregate_demographics()
+        streamed = self._demographic_rows()
+        
+        self.assertGreater(len(single_pass), 0)
+        self.assertEqual(streamed, single_pass)
+    
+    def test_memory_target_sets_chunk_size(self):
+        """
+        Test that a memory target is translated into a chunk size
+        """
+        aggregator = DataAggregator(memory_target_mb=64)
+        
+        self.assertIsNone(DataAggregator()._streaming_chunk_size(8))
+        self.assertEqual(aggregator._streaming_chunk_size(8), 64 * 1024 * 1024 // (8 * 200))
+        self.assertEqual(DataAggregator(chunk_size=500)._streaming_chunk_size(8), 500)
+    
+    def test_frames_hold_codes(self):
+        """
+        Test that frames are read as typed arrays and vocabulary codes
+        """
+        df = DataAggregator()._read_frame(
+            Citizen.objects.order_by('pk'),
+            ['residence_ward_id', 'gender', 'religion', 'date_of_birth', 'family__household_size']
+        )
+        
+        self.assertEqual(len(df), 7)
+        self.assertFalse((df.dtypes == object).any())
+        self.assertIsInstance(df['gender'].dtype, pd.CategoricalDtype)
+        self.assertEqual(list(df['gender'][:2]), ['Female', 'Male'])
+        self.assertEqual(df['date_of_birth'].iloc[1], pd.Timestamp(1967, 1, 1))
+        self.assertTrue(df['family__household_size'].isna().all())
+    
+    def test_streaming_memory_is_bounded(self):
+        """
+        Test that peak memory does not grow with the number of citizens
+        """
+        def add_citizens(count):
+            # Citizens spread over 40 wards of two states
+            offset = Citizen.objects.count()
+            Citizen.objects.bulk_create([
+                Citizen(
+                    first_name=f'Citizen{offset + index}',
+                    last_name='Test',
+                    gender='Male' if index % 2 else 'Female',
+                    date_of_birth=date(1960 + index % 40, 1, 1),
+                    religion=['Christianity', 'Islam', 'Other'][index % 3],
+                    residence_state_id=index % 40 // 20 + 1,
+                    residence_lga_id=index % 40 // 5 + 1,
+                    residence_ward_id=index % 40 + 1
+                )
+                for index in range(count)
+            ], batch_size=1000)
+        
+        def peak_memory():
+            aggregator = DataAggregator(chunk_size=2000)
+            tracemalloc.start()
+            counts = aggregator._count_by_dimension(
+                Citizen.objects.all(), ['gender', 'religion'], ['gender', 'religion']
+            )
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            
+            # Every citizen is counted, reading one chunk at a time
+            citizen_count = Citizen.objects.count()
+            self.assertEqual(int(counts['gender'].sum()), citizen_count)
+            self.assertGreaterEqual(aggregator.timings.stages['query'].calls, citizen_count // 2000)
+            return peak
+        
+        add_citizens(3993)
+        peak_memory()
+        small_run = peak_memory()
+        
+        add_citizens(20000)
+        large_run = peak_memory()
+        
+        # Six times the citizens must not need meaningfully more memory
+        # (garbage awaiting collection adds some noise), and the whole run
+        # must stay within a small fixed budget
+        self.assertLess(large_run, small_run * 2)
+        self.assertLess(large_run, 4 * 1024 * 1024)
+
+
+class AgeEngineTestCase(TestCase):
+    """
+    Test cases for the vectorized age engine
+    """
+    
+    def setUp(self):
+        """
+        Set up the reference date
+        """
+        self.today = date(2025, 3, 15)
+    
+    def test_completed_years(self):
+        """
+        Test exact completed years around birthdays
+        """
+        ages = completed_years(
+            [date(2000, 3, 15), date(2000, 3, 16), date(2000, 3, 14), None],
+            self.today
+        )
+        
+        self.assertEqual(list(ages[:3]), [25, 24, 25])
+        self.assertTrue(np.isnan(ages[3]))
+    
+    def test_leap_day_birthdays(self):
+        """
+        Test that leap day birthdays are reached on 1 March in common years
+        """
+        dob = [date(2004, 2, 29)]
+        
+        self.assertEqual(completed_years(dob, date(2025, 2, 28))[0], 20)
+        self.assertEqual(completed_years(dob, date(2025, 3, 1))[0], 21)
+        self.assertEqual(completed_years(dob, date(2024, 2, 29))[0], 20)
+    
+    def test_matches_calendar_arithmetic(self):
+        """
+        Test against a scalar calendar computation for many dates
+        """
+        rng = np.random.default_rng(1)
+        start = np.datetime64('1900-01-01')
+        dates = start + rng.integers(0, 46000, 5000).astype('timedelta64[D]')
+        
+        for today in [self.today, date(2024, 2, 29), date(2025, 12, 31)]:
+            expected = [
+                today.year - d.year - ((today.month, today.day) < (d.month, d.day))
+                for d in dates.astype(object)
+            ]
+            self.assertEqual(list(completed_years(dates, today).astype(int)), expected)
+    
+    def test_assign_age_groups(self):
+        """
+        Test mapping dates of birth onto age groups at the boundaries
+        """
+        groups = assign_age_groups([
+            date(2025, 3, 15),  # born today, age 0
+            date(2019, 3, 16),  # age 5
+            date(2019, 3, 15),  # age 6
+            date(1959, 3, 15),  # age 66
+            date(1959, 3, 16),  # age 65
+            date(1904, 3, 15),  # age 121
+            date(2025, 3, 16),  # born tomorrow
+            None,
+        ], self.today)
+        
+        self.assertEqual(list(groups.categories), AGE_GROUP_LABELS)
+        self.assertEqual(
+            [None if pd.isna(group) else group for group in groups],
+            ['0-5', '0-5', '6-12', '65+', '51-65', None, None, None]
+        )
+    
+    def test_boundaries_are_ascending(self):
+        """
+        Test that birth-date boundaries are sorted for searchsorted
+        """
+        boundaries = age_group_boundaries(date(2024, 2, 29))
+        
+        self.assertTrue((np.diff(boundaries.astype(np.int64)) > 0).all())
+        self.assertEqual(boundaries[-1], np.datetime64('2024-02-29'))
+        self.assertEqual(boundaries[-2], np.datetime64('2018-02-28'))
+    
+    def test_order_age_groups(self):
+        """
+        Test sorting report rows into age order
+        """
+        rows = [{'age_group': label} for label in ['65+', '13-18', '0-5', '6-12']]
+        
+        self.assertEqual(
+            [row['age_group'] for row in order_age_groups(rows)],
+            ['0-5', '6-12', '13-18', '65+']
+        )
+
+
+class VocabularyTestCase(TestCase):
+    """
+    Test cases for dimension category vocabularies
+    """
+    
+    def test_codes_are_stable_across_chunks(self):
+        """
+        Test that codes assigned in one chunk keep their meaning in the next
+        """
+        vocabulary = CategoryVocabulary(['Male', 'Female'])
+        
+        first = vocabulary.encode(['Female', None, 'Other'])
+        second = vocabulary.encode(['Other', 'Male', 'Unknown'])
+        
+        self.assertEqual(list(first), [1, -1, 2])
+        self.assertEqual(list(second), [2, 0, 3])
+        self.assertEqual(vocabulary.decode(3), 'Unknown')
+    
+    def test_encode_categorical(self):
+        """
+        Test encoding an existing Categorical through its categories
+        """
+        vocabulary = CategoryVocabulary(['3-4', '1'])
+        values = pd.Categorical(['1', None, '2', '1'], categories=['1', '2', '3-4'])
+        
+        self.assertEqual(list(vocabulary.encode(values)), [1, -1, 2, 1])
+    
+    def test_encode_frame(self):
+        """
+        Test that frame dimension columns become Categoricals
+        """
+        registry = VocabularyRegistry()
+        df = pd.DataFrame({'gender': ['Female', 'Male', None], 'ward': [1, 2, 3]})
+        
+        registry.encode_frame(df, ['gender'])
+        
+        self.assertEqual(df['gender'].dtype.name, 'category')
+        self.assertEqual(list(df['gender'].cat.codes), [1, 0, -1])
+        self.assertIs(registry.get('gender'), registry.get('gender'))
+
+
+class InterestAggregationTestCase(TestCase):
+    """
+    Test cases for set-based interests aggregation
+    """
+    
+    def setUp(self):
+        """
+        Set up citizens with several interests each
+        """
+        interests = [
+            [('Sport', 'Football', None), ('Cultural', None, 'Dance')],
+            [('Sport', 'Football', None), ('Sport', 'Basketball', None)],
+            [],
+            [('Cultural', 'Football', 'Masquerade')],
+        ]
+        for index, citizen_interests in enumerate(interests):
+            citizen = Citizen.objects.create(
+                first_name=f'Citizen{index}',
+                last_name='Test',
+                gender='Female',
+                date_of_birth='1990-01-01',
+                phone_number=f'0801234567{index}',
+                email=f'citizen{index}@example.com',
+                address='123 Main St',
+                residence_state_id=1,
+                residence_lga_id=1,
+                residence_ward_id=1
+            )
+            for interest_type, sport_name, cultural_activity in citizen_interests:
+                citizen.interests.create(
+                    interest_type=interest_type,
+                    sport_name=sport_name,
+                    cultural_activity=cultural_activity
+                )
+    
+    def _interest_counts(self, field):
+        """
+        Get today's interest counts for one dimension
+        """
+        return dict(fact_queryset(InterestStats).filter(
+            **{f'{field}__isnull': False}
+        ).values_list(field, 'count'))
+    
+    def test_aggregate_interests(self):
+        """
+        Test counts per interest type, sport and cultural activity
+        """
+        DataAggregator().aggregate_interests()
+        
+        self.assertEqual(self._interest_counts('interest_type'), {'Sport': 3, 'Cultural': 2})
+        self.assertEqual(self._interest_counts('sport_name'), {'Football': 2, 'Basketball': 1})
+        self.assertEqual(self._interest_counts('cultural_activity'), {'Dance': 1, 'Masquerade': 1})
+    
+    def test_streaming_keeps_citizen_interests_together(self):
+        """
+        Test that chunking never splits one citizen's interests
+        """
+        DataAggregator(chunk_size=1).aggregate_interests()
+        
+        self.assertEqual(self._interest_counts('interest_type'), {'Sport': 3, 'Cultural': 2})
+        self.assertEqual(self._interest_counts('sport_name'), {'Football': 2, 'Basketball': 1})
+
+class RollupAggregationTestCase(TestCase):
+    """
+    Test cases for LGA, state and national rollup rows
+    """
+    
+    def setUp(self):
+        """
+        Set up citizens in two states
+        """
+        locations = [(1, 1, 1), (1, 1, 2), (1, 2, 3), (2, 3, 4)]
+        for index in range(8):
+            state_id, lga_id, ward_id = locations[index % len(locations)]
+            Citizen.objects.create(
+                first_name=f'Citizen{index}',
+                last_name='Test',
+                gender='Male' if index % 3 else 'Female',
+                date_of_birth=date(1970, 1, 1),
+                phone_number=f'0801234567{index}',
+                email=f'citizen{index}@example.com',
+                address='123 Main St',
+                religion='Christianity',
+                residence_state_id=state_id,
+                residence_lga_id=lga_id,
+                residence_ward_id=ward_id
+            )
+        
+        self.aggregator = DataAggregator()
+        self.aggregator.aggregate_demographics()
+    
+    def _gender_counts(self, level, **filters):
+        """
+        Get gender counts and percentages at a level
+        """
+        rows = fact_queryset(DemographicStats).filter(
+            level=level, gender__isnull=False, **filters
+        ).values_list('gender', 'count', 'percentage')
+        return {gender: (count, float(percentage)) for gender, count, percentage in rows}
+    
+    def test_rollups_sum_ward_rows(self):
+        """
+        Test that each level's counts sum the wards below it
+        """
+        self.assertEqual(self._gender_counts(LEVEL_NATIONAL), {
+            'Male': (5, 62.5), 'Female': (3, 37.5)
+        })
+        self.assertEqual(self._gender_counts(LEVEL_STATE, state_id=1), {
+            'Male': (4, 66.67), 'Female': (2, 33.33)
+        })
+        self.assertEqual(self._gender_counts(LEVEL_LGA, state_id=1, lga_id=1), {
+            'Male': (3, 75.0), 'Female': (1, 25.0)
+        })
+        
+        # Rollup rows leave the levels below them empty
+        national = fact_queryset(DemographicStats).filter(level=LEVEL_NATIONAL)
+        self.assertFalse(national.exclude(state_id__isnull=True).exists())
+        state = fact_queryset(DemographicStats).filter(level=LEVEL_STATE)
+        self.assertFalse(state.exclude(lga_id__isnull=True).exists())
+    
+    def test_rerun_replaces_rollups(self):
+        """
+        Test that aggregating again does not duplicate rollup rows
+        """
+        self.aggregator.aggregate_demographics()
+        
+        self.assertEqual(self._gender_counts(LEVEL_NATIONAL), {
+            'Male': (5, 62.5), 'Female': (3, 37.5)
+        })
+    
+    def test_scoped_run_only_rebuilds_its_state(self):
+        """
+        Test that a state-scoped run leaves other states' rows alone
+        """
+        self.aggregator.aggregate_demographics(state_id=2)
+        
+        self.assertEqual(self._gender_counts(LEVEL_STATE, state_id=1), {
+            'Male': (4, 66.67), 'Female': (2, 33.33)
+        })
+        self.assertEqual(self._gender_counts(LEVEL_NATIONAL), {
+            'Male': (5, 62.5), 'Female': (3, 37.5)
+        })
+    
+    def test_report_reads_rollup_level(self):
+        """
+        Test that reports read the rollup rows for their scope
+        """
+        generator = ReportGenerator()
+        
+        report = generator.generate_demographic_report(state_id=1)
+        sections = report['report']['sections']
+        section = next(s for s in sections if s['title'] == 'Gender Distribution')
+        gender = {row['gender']: row['total'] for row in section['data']}
+        
+        self.assertEqual(gender, {'Male': 4, 'Female': 2})
+
+class DashboardSnapshotTestCase(TestCase):
+    """
+    Test cases for the executive dashboard snapshots
+    """
+    
+    def setUp(self):
+        """
+        Set up citizens in two states and aggregate them
+        """
+        locations = [(1, 1, 1), (1, 1, 2), (1, 2, 3), (2, 3, 4)]
+        household_sizes = [3, 5, 2, 7, 4, None, None, None]
+        family_model = Citizen._meta.get_field('family').related_model
+        for index in range(8):
+            state_id, lga_id, ward_id = locations[index % len(locations)]
+            family = None
+            if household_sizes[index]:
+                family = family_model.objects.create(household_size=household_sizes[index])
+            Citizen.objects.create(
+                family=family,
+                first_name=f'Citizen{index}',
+                last_name='Test',
+                gender='Male' if index % 3 else 'Female',
+                date_of_birth=date(1970, 1, 1),
+                phone_number=f'0801234567{index}',
+                email=f'citizen{index}@example.com',
+                address='123 Main St',
+                religion='Christianity',
+                residence_state_id=state_id,
+                residence_lga_id=lga_id,
+                residence_ward_id=ward_id
+            )
+        
+        self.today = timezone.now().date()
+        DataAggregator(stat_date=self.today).aggregate_scope()
+    
+    def _population(self, dashboard):
+        """
+        Get the total population metric of a dashboard
+        """
+        return next(
+            metric['value'] for metric in dashboard['metrics'] if metric['name'] == 'Total Population'
+        )
+    
+    def test_run_writes_snapshots(self):
+        """
+        Test that a run snapshots the dashboard nationally and per state
+        """
+        snapshots = {
+            snapshot.state_id: snapshot
+            for snapshot in DashboardSnapshot.objects.filter(stat_date=self.today)
+        }
+        
+        self.assertEqual(set(snapshots), {None, 1, 2})
+        self.assertEqual(snapshots[None].level, LEVEL_NATIONAL)
+        self.assertEqual(snapshots[None].total_population, 8)
+        self.assertEqual(snapshots[1].total_population, 6)
+        self.assertEqual(snapshots[2].total_population, 2)
+        self.assertEqual(snapshots[1].age_distribution[0]['total'], 6)
+    
+    def test_mean_household_size(self):
+        """
+        Test that snapshots hold the mean size of the scope's households
+        """
+        snapshots = {
+            snapshot.state_id: snapshot
+            for snapshot in DashboardSnapshot.objects.filter(stat_date=self.today)
+        }
+        
+        # Citizens without a family record are not households
+        self.assertAlmostEqual(snapshots[None].avg_household_size, 21 / 5)
+        self.assertAlmostEqual(snapshots[1].avg_household_size, 14 / 4)
+        self.assertAlmostEqual(snapshots[2].avg_household_size, 7.0)
+        
+        state = HouseholdStats.objects.get(stat_date=self.today, level=LEVEL_STATE, state_id=1)
+        self.assertEqual((state.household_count, state.member_count), (4, 14))
+        
+        # A state's run re-sums the national households
+        DataAggregator(stat_date=self.today).aggregate_scope(state_id=2)
+        national = DashboardSnapshot.objects.get(stat_date=self.today, state__isnull=True)
+        self.assertAlmostEqual(national.avg_household_size, 21 / 5)
+    
+    def test_dashboard_is_one_read(self):
+        """
+        Test that the dashboard is read from its snapshot in one query
+        """
+        generator = ReportGenerator()
+        with self.assertNumQueries(1):
+            result = generator.generate_executive_dashboard(state_id=1)
+        
+        self.assertEqual(self._population(result['dashboard']), 6)
+        self.assertEqual([chart['title'] for chart in result['dashboard']['charts']], ['Age Distribution'])
+        
+        # Dates without snapshots are computed from the stats
+        DashboardSnapshot.objects.all().delete()
+        result = generator.generate_executive_dashboard(state_id=1)
+        self.assertEqual(self._population(result['dashboard']), 6)
+        self.assertEqual(result['dashboard']['trends'], [])
+    
+    def test_trends(self):
+        """
+        Test that trend sparklines cover the latest snapshot dates
+        """
+        for days in [3, 2, 1]:
+            DashboardSnapshot.objects.create(
+                stat_date=self.today - timedelta(days=days),
+                level=LEVEL_NATIONAL,
+                total_population=8 - days,
+                employed_count=days,
+                unemployed_count=days,
+                avg_household_size=4.0
+            )
+        
+        with self.settings(REPORT_DASHBOARD_TREND_DATES=3):
+            dashboard = ReportGenerator().generate_executive_dashboard()['dashboard']
+        
+        population, employment, household = dashboard['trends']
+        self.assertEqual(population['dates'], [self.today - timedelta(days=days) for days in [2, 1, 0]])
+        self.assertEqual(population['values'], [6, 7, 8])
+        self.assertEqual(employment['values'], [50.0, 50.0, 0])
+        self.assertEqual(household['values'], [4.0, 4.0, 4.2])
+    
+    def test_state_run_replaces_its_snapshots(self):
+        """
+        Test that a state's run leaves other states' snapshots alone
+        """
+        other_state = DashboardSnapshot.objects.get(stat_date=self.today, state_id=1)
+        
+        DataAggregator(stat_date=self.today).aggregate_scope(state_id=2)
+        
+        snapshots = DashboardSnapshot.objects.filter(stat_date=self.today)
+        self.assertEqual(snapshots.count(), 3)
+        self.assertEqual(snapshots.get(state_id=1).pk, other_state.pk)
+        self.assertEqual(snapshots.get(state__isnull=True).total_population, 8)
+
+class StatsCubeTestCase(TestCase):
+    """
+    Test cases for the memory-mapped report cubes
+    """
+    
+    def setUp(self):
+        """
+        Set up ward rows in two LGAs and a cube store in a scratch directory
+        """
+        self.today = timezone.now().date()
+        rows = [
+            (1, 1, 1, 'Male', 30, 60.0), (1, 1, 1, 'Female', 20, 40.0),
+            (1, 1, 2, 'Male', 10, 50.0), (1, 1, 2, 'Female', 10, 50.0),
+            (1, 2, 3, 'Male', 5, 100.0),
+        ]
+        for state_id, lga_id, ward_id, gender, count, percentage in rows:
+            DemographicStats.objects.create(
+                stat_date=self.today,
+                state_id=state_id,
+                lga_id=lga_id,
+                ward_id=ward_id,
+                gender=gender,
+                count=count,
+                percentage=percentage
+            )
+        bump_stats_version(self.today)
+        
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = CubeStore(directory.name)
+    
+    def test_slice_matches_queryset(self):
+        """
+        Test that slicing the cube gives the ORM's totals and averages
+        """
+        stats = self.store.slice(DemographicStats, self.today, state_id=1, lga_id=1)
+        
+        expected = DemographicStats.objects.filter(
+            stat_date=self.today, lga_id=1, gender__isnull=False
+        ).values('gender').annotate(
+            total=models.Sum('count'),
+            avg_percentage=models.Avg('percentage')
+        ).order_by('-total')
+        
+        self.assertEqual(
+            [(row['gender'], row['total'], row['avg_percentage']) for row in stats.totals('gender')],
+            [(row['gender'], row['total'], float(row['avg_percentage'])) for row in expected]
+        )
+        self.assertEqual(stats.total('gender'), 70)
+        self.assertEqual(stats.total('gender', 'Male'), 40)
+        self.assertEqual(stats.total('religion'), 0)
+    
+    def test_slice_prefers_rollups(self):
+        """
+        Test that a scope reads its rollup rows when they exist
+        """
+        DemographicStats.objects.create(
+            stat_date=self.today, state_id=1, level=LEVEL_STATE,
+            gender='Male', count=45, percentage=60.0
+        )
+        
+        stats = self.store.slice(DemographicStats, self.today, state_id=1)
+        
+        self.assertEqual(stats.totals('gender'), [
+            {'gender': 'Male', 'total': 45, 'avg_percentage': 60.0}
+        ])
+    
+    def test_cube_is_memory_mapped_and_shared(self):
+        """
+        Test that the cube is loaded from files and reused until its
+        version moves on
+        """
+        cube = self.store.get(DemographicStats, self.today)
+        
+        self.assertIsInstance(cube.arrays['gender'], np.memmap)
+        self.assertIs(self.store.get(DemographicStats, self.today), cube)
+        
+        # Another store over the same directory maps the published files
+        other = CubeStore(self.store.directory)
+        self.assertIs(other.get(DemographicStats, self.today), cube)
+        
+        DemographicStats.objects.create(
+            stat_date=self.today, state_id=1, lga_id=2, ward_id=3,
+            gender='Female', count=5, percentage=50.0
+        )
+        
+        # Rows are only read again once aggregation moves the version on,
+        # and checking it does not touch the stats
+        with self.assertNumQueries(1):
+            self.assertIs(self.store.get(DemographicStats, self.today), cube)
+        
+        bump_stats_version(self.today)
+        rebuilt = self.store.get(DemographicStats, self.today)
+        self.assertIsNot(rebuilt, cube)
+        self.assertEqual(rebuilt.slice().total('gender'), 80)
+    
+    def test_reads_do_not_version_dates(self):
+        """
+        Test that dates never aggregated have no cube and get no version
+        """
+        yesterday = self.today - timedelta(days=1)
+        DemographicStats.objects.create(
+            stat_date=yesterday, state_id=1, lga_id=1, ward_id=1,
+            gender='Male', count=1, percentage=100.0
+        )
+        
+        self.assertIsNone(self.store.get(DemographicStats, yesterday))
+        self.assertEqual(self.store.slice(DemographicStats, yesterday).total('gender'), 0)
+        self.assertFalse(StatsVersion.objects.filter(stat_date=yesterday).exists())
+    
+    def test_loaded_cubes_are_bounded(self):
+        """
+        Test that a process keeps only the most recently used cubes
+        """
+        with override_settings(REPORT_CUBE_CACHE_SIZE=2):
+            store = CubeStore(self.store.directory)
+            for model in [DemographicStats, OccupationStats, HealthcareStats]:
+                store.get(model, self.today)
+        
+        self.assertLessEqual(len(olap_cube._loaded_cubes), 2)
+        self.assertNotIn((DemographicStats._meta.label, self.today), olap_cube._loaded_cubes)
+    
+    def test_build_sums_duplicate_cells(self):
+        """
+        Test that rows sharing a location and value are summed
+        """
+        DemographicStats.objects.create(
+            stat_date=self.today, state_id=1, lga_id=1, ward_id=1,
+            gender='Male', count=3, percentage=None
+        )
+        
+        cube = StatsCube.build(DemographicStats, self.today)
+        male = cube.slice(state_id=1, lga_id=1).totals('gender')[0]
+        
+        self.assertEqual(male, {'gender': 'Male', 'total': 43, 'avg_percentage': 55.0})
+    
+    def test_missing_date_is_empty(self):
+        """
+        Test that a date without stats gives an empty slice
+        """
+        stats = self.store.slice(DemographicStats, self.today - timedelta(days=1))
+        
+        self.assertFalse(stats.exists())
+        self.assertEqual(stats.totals('gender'), [])
+
+class CrossTabTestCase(TestCase):
+    """
+    Test cases for cross-tabulated stats
+    """
+    
+    def setUp(self):
+        """
+        Set up citizens with genders, ages and employment in two wards
+        """
+        Occupation = Citizen._meta.get_field('occupation').related_model
+        
+        # Ages 29-30, 10-11 and 79-80 whatever day the tests run
+        year = timezone.now().year
+        people = [
+            ('Male', date(year - 30, 1, 1), 'Employed', 1),
+            ('Male', date(year - 30, 6, 1), 'Employed', 1),
+            ('Female', date(year - 30, 3, 1), 'Unemployed', 1),
+            ('Female', date(year - 11, 3, 1), None, 2),
+            ('Male', date(year - 80, 3, 1), 'Retired', 2),
+        ]
+        for index, (gender, date_of_birth, employment_status, ward_id) in enumerate(people):
+            occupation = None
+            if employment_status:
+                occupation = Occupation.objects.create(employment_status=employment_status)
+            Citizen.objects.create(
+                first_name=f'Citizen{index}',
+                last_name='Test',
+                gender=gender,
+                date_of_birth=date_of_birth,
+                phone_number=f'0801234567{index}',
+                email=f'citizen{index}@example.com',
+                address='123 Main St',
+                religion='Islam',
+                residence_state_id=1,
+                residence_lga_id=1,
+                residence_ward_id=ward_id,
+                occupation=occupation
+            )
+        
+        self.user = User.objects.create_user(username='crosstab', password='testpassword')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+    
+    def _cells(self, tab_name, level):
+        """
+        Get a tab's cell counts at a level
+        """
+        rows = CrossTabStats.objects.filter(tab_name=tab_name, level=level).values_list(
+            'ward_id', 'value_1', 'value_2', 'value_3', 'count'
+        )
+        return sorted(rows, key=str)
+    
+    def test_count_combinations(self):
+        """
+        Test that combined codes are counted per location and cell
+        """
+        cells, counts = count_combinations(
+            np.array([0, 0, 1, 1, 1]),
+            2,
+            [np.array([0, 0, 1, -1, 1]), np.array([1, 1, 0, 0, 2])],
+            [2, 3]
+        )
+        
+        self.assertEqual(
+            list(zip(*[axis.tolist() for axis in cells], counts.tolist())),
+            [(0, 0, 1, 2), (1, 1, 0, 1), (1, 1, 2, 1)]
+        )
+    
+    def test_aggregate_crosstabs(self):
+        """
+        Test that the demographic pass writes the configured cross-tabs
+        """
+        DataAggregator().aggregate_demographics()
+        
+        self.assertEqual(self._cells('age_gender', LEVEL_WARD), sorted([
+            (1, '26-35', 'Male', None, 2),
+            (1, '26-35', 'Female', None, 1),
+            (2, '6-12', 'Female', None, 1),
+            (2, '65+', 'Male', None, 1),
+        ], key=str))
+        self.assertEqual(self._cells('employment_age', LEVEL_NATIONAL), sorted([
+            (None, 'Employed', '26-35', None, 2),
+            (None, 'Unemployed', '26-35', None, 1),
+            (None, 'Retired', '65+', None, 1),
+        ], key=str))
+        self.assertEqual(self._cells('age_gender_religion', LEVEL_LGA), sorted([
+            (None, '26-35', 'Male', 'Islam', 2),
+            (None, '26-35', 'Female', 'Islam', 1),
+            (None, '6-12', 'Female', 'Islam', 1),
+            (None, '65+', 'Male', 'Islam', 1),
+        ], key=str))
+        
+        # Percentages are shares of the tab's total at each location
+        national = CrossTabStats.objects.get(
+            tab_name='age_gender', level=LEVEL_NATIONAL, value_1='26-35', value_2='Male'
+        )
+        self.assertEqual(float(national.percentage), 40.0)
+    
+    def test_streaming_matches_single_pass(self):
+        """
+        Test that cross-tabs counted in chunks match a single pass
+        """
+        DataAggregator().aggregate_demographics()
+        single_pass = self._cells('age_gender', LEVEL_WARD)
+        
+        DataAggregator(chunk_size=2).aggregate_demographics()
+        
+        self.assertEqual(self._cells('age_gender', LEVEL_WARD), single_pass)
+    
+    def test_crosstab_api(self):
+        """
+        Test the cross-tab report API
+        """
+        DataAggregator().aggregate_demographics()
+        
+        response = self.client.get(reverse('reports-crosstab'), {'tab': 'age_gender'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['dimensions'], ['age_group', 'gender'])
+        self.assertEqual(response.data['total'], 5)
+        self.assertEqual(response.data['matrix'], {
+            'rows': ['6-12', '26-35', '65+'],
+            'columns': ['Male', 'Female'],
+            'counts': [[0, 1], [2, 1], [1, 0]]
+        })
+        
+        response = self.client.get(reverse('reports-crosstab'), {'tab': 'unknown'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class StarSchemaTestCase(TestCase):
+    """
+    Test cases for the stats fact table and its legacy-shaped adapter
+    """
+    
+    def setUp(self):
+        """
+        Set up citizens in two wards and aggregate their demographics
+        """
+        for index in range(4):
+            Citizen.objects.create(
+                first_name=f'Citizen{index}',
+                last_name='Test',
+                gender='Male' if index % 2 else 'Female',
+                date_of_birth=date(1980, 1, 1),
+                phone_number=f'0801234567{index}',
+                email=f'citizen{index}@example.com',
+                address='123 Main St',
+                religion='Islam',
+                residence_state_id=1,
+                residence_lga_id=1,
+                residence_ward_id=index % 2 + 1
+            )
+        
+        self.today = timezone.now().date()
+        DataAggregator().aggregate_demographics()
+    
+    def test_aggregation_writes_facts(self):
+        """
+        Test that stats are stored as facts with shared lookups
+        """
+        # Ward, LGA and state rows plus the national row
+        gender = StatDimension.objects.get(family='demographic', field='gender')
+        self.assertEqual(StatFact.objects.filter(dimension=gender).count(), 2 + 2 + 2 + 2)
+        
+        # Each value and location is stored once however many facts use it
+        self.assertEqual(
+            sorted(StatValue.objects.filter(dimension=gender).values_list('value', flat=True)),
+            ['Female', 'Male']
+        )
+        self.assertEqual(StatLocation.objects.filter(level=LEVEL_WARD).count(), 2)
+    
+    def test_legacy_tables_are_kept_for_custom_reports(self):
+        """
+        Test that raw SQL over the legacy tables sees the current stats
+        """
+        user = User.objects.create_user(username='analyst', email='analyst@example.com', password='password')
+        custom_report = CustomReport.objects.create(
+            user=user,
+            report_name='Gender by level',
+            report_query=(
+                "SELECT level, SUM(count) AS total FROM reporting_demographicstats "
+                "WHERE gender IS NOT NULL AND stat_date = :stat_date GROUP BY level ORDER BY level"
+            )
+        )
+        
+        result = ReportGenerator().execute_custom_report(
+            custom_report.pk, {'stat_date': self.today.isoformat()}
+        )
+        self.assertTrue(result['success'], result.get('message'))
+        self.assertEqual(
+            [(row['level'], row['total']) for row in result['report']['data']],
+            [(LEVEL_LGA, 4), (LEVEL_NATIONAL, 4), (LEVEL_STATE, 4), (LEVEL_WARD, 4)]
+        )
+        
+        # A rerun replaces the rows rather than adding to them
+        DataAggregator().aggregate_demographics(state_id=1)
+        self.assertEqual(DemographicStats.objects.filter(level=LEVEL_WARD, gender__isnull=False).count(), 2)
+        
+        # Without raw SQL readers left, only facts are written
+        with self.settings(REPORT_WRITE_LEGACY_STATS=False):
+            DemographicStats.objects.all().delete()
+            DataAggregator().aggregate_demographics()
+        self.assertFalse(DemographicStats.objects.exists())
+    
+    def test_adapter_has_legacy_shape(self):
+        """
+        Test that facts read back with the legacy columns
+        """
+        rows = stats_queryset(DemographicStats, self.today).filter(
+            level=LEVEL_WARD, gender__isnull=False
+        ).values_list('state_id', 'lga_id', 'ward_id', 'gender', 'religion', 'count', 'percentage')
+        
+        self.assertEqual(sorted(rows), [
+            (1, 1, 1, 'Female', None, 2, Decimal('100.00')),
+            (1, 1, 2, 'Male', None, 2, Decimal('100.00')),
+        ])
+        
+        total = stats_queryset(DemographicStats, self.today).filter(
+            level=LEVEL_NATIONAL, religion__isnull=False
+        ).aggregate(total=models.Sum('count'))['total']
+        self.assertEqual(total, 4)
+    
+    def test_legacy_rows_are_read_for_older_dates(self):
+        """
+        Test that dates without facts fall back to the legacy table
+        """
+        older = self.today - timedelta(days=1)
+        DemographicStats.objects.create(stat_date=older, gender='Male', count=9, percentage=100)
+        
+        stats = stats_queryset(DemographicStats, older)
+        
+        self.assertIs(stats.model, DemographicStats)
+        self.assertEqual(list(stats.values_list('gender', 'count')), [('Male', 9)])
+    
+    def test_reports_read_facts(self):
+        """
+        Test that reports and exports are served from the facts
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        generator = ReportGenerator(CubeStore(directory.name))
+        
+        result = generator.generate_demographic_report(state_id=1)
+        section = next(s for s in result['report']['sections'] if s['title'] == 'Gender Distribution')
+        self.assertEqual(
+            {row['gender']: row['total'] for row in section['data']},
+            {'Male': 2, 'Female': 2}
+        )
+        
+        user = User.objects.create_user(username='facts', password='testpassword')
+        client = APIClient()
+        client.force_authenticate(user=user)
+        response = client.get(reverse('reports-export-csv'), {'type': 'demographic'})
+        
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:6], ['stat_id', 'stat_date', 'state', 'lga', 'ward', 'level'])
+        self.assertEqual(len(lines), 1 + 2 * 3)  # Two wards; gender, age group and religion
+
+class ExplainReportsCommandTestCase(TestCase):
+    """
+    Test cases for the explain_reports management command
+    """
+    
+    def test_explain_seeded_reports(self):
+        """
+        Test that every report's queries are explained and the seed is rolled back
+        """
+        out = StringIO()
+        call_command('explain_reports', seed_wards=30, stdout=out)
+        output = out.getvalue()
+        
+        self.assertIn('Seeded 30 wards', output)
+        for name in ['cube build demographic', 'demographic (national)', 'family (lga 1)',
+                     'crosstab age_gender (state 1)', 'executive_dashboard (state 1)',
+                     'export interest (lga 1)']:
+            self.assertIn(name, output)
+        self.assertRegex(output, r'\d+ of \d+ queries use sequential scans')
+        
+        self.assertFalse(StatFact.objects.exists())
+        self.assertFalse(CrossTabStats.objects.exists())
+
+
+class IncrementalAggregationTestCase(TestCase):
+    """
+    Test cases for watermark-driven incremental aggregation
+    """
+    
+    def setUp(self):
+        """
+        Set up citizens in three wards
+        """
+        self.today = timezone.now().date()
+        self.yesterday = self.today - timedelta(days=1)
+        self.citizens = [
+            Citizen.objects.create(
+                first_name=f'Citizen{index}',
+                last_name='Test',
+                gender='Male' if index % 2 else 'Female',
+                date_of_birth=date(self.today.year - 40, 1, 1),
+                phone_number=f'0801234567{index}',
+                email=f'citizen{index}@example.com',
+                address='123 Main St',
+                religion='Islam',
+                residence_state_id=1,
+                residence_lga_id=1,
+                residence_ward_id=index % 3 + 1
+            )
+            for index in range(6)
+        ]
+    
+    def _ward_stats(self, stat_date):
+        """
+        Get every level's gender stats of a date
+        """
+        return sorted(fact_queryset(DemographicStats).filter(
+            stat_date=stat_date, gender__isnull=False
+        ).values_list('level', 'state_id', 'lga_id', 'ward_id', 'gender', 'count'))
+    
+    def test_first_run_aggregates_every_ward(self):
+        """
+        Test that a run without earlier stats aggregates everything
+        """
+        summary = IncrementalAggregator(stat_date=self.yesterday).run()
+        
+        self.assertIsNone(summary['carried_from'])
+        self.assertEqual(summary['changed_wards'], [1, 2, 3])
+        self.assertEqual(AggregationWatermark.objects.count(), 3)
+        self.assertTrue(ReportMetadata.objects.filter(report_name='incremental_aggregation').exists())
+    
+    def test_second_run_only_aggregates_changed_wards(self):
+        """
+        Test that unchanged wards are carried forward and match a full run
+        """
+        IncrementalAggregator(stat_date=self.yesterday).run()
+        
+        citizen = self.citizens[0]
+        citizen.gender = 'Male'
+        citizen.save()
+        
+        summary = IncrementalAggregator(stat_date=self.today).run()
+        
+        self.assertEqual(summary['carried_from'], self.yesterday)
+        self.assertEqual(summary['changed_wards'], [citizen.residence_ward_id])
+        self.assertEqual(summary['ward_count'], 3)
+        
+        incremental = self._ward_stats(self.today)
+        StatFact.objects.filter(stat_date=self.today).delete()
+        DataAggregator(stat_date=self.today).aggregate_all_data()
+        self.assertEqual(incremental, self._ward_stats(self.today))
+        
+        # Yesterday's stats are left as they were
+        self.assertIn((LEVEL_WARD, 1, 1, 1, 'Female', 1), self._ward_stats(self.yesterday))
+        self.assertIn((LEVEL_WARD, 1, 1, 1, 'Male', 2), incremental)
+    
+    def test_scoped_run_before_incremental_run(self):
+        """
+        Test that wards outside a scoped run's state are kept by a later
+        incremental run on the same date
+        """
+        for index in range(2):
+            Citizen.objects.create(
+                first_name=f'Other{index}',
+                last_name='Test',
+                gender='Female',
+                date_of_birth=date(self.today.year - 40, 1, 1),
+                phone_number=f'0809876543{index}',
+                email=f'other{index}@example.com',
+                address='1 Other St',
+                religion='Islam',
+                residence_state_id=2,
+                residence_lga_id=2,
+                residence_ward_id=4
+            )
+        IncrementalAggregator(stat_date=self.yesterday).run()
+        
+        # A state's run only writes that state's wards for today
+        DataAggregator(stat_date=self.today).aggregate_scope(state_id=2)
+        citizen = self.citizens[0]
+        citizen.gender = 'Male'
+        citizen.save()
+        
+        summary = IncrementalAggregator(stat_date=self.today).run()
+        
+        self.assertEqual(summary['changed_wards'], [citizen.residence_ward_id])
+        incremental = self._ward_stats(self.today)
+        StatFact.objects.filter(stat_date=self.today).delete()
+        DataAggregator(stat_date=self.today).aggregate_all_data()
+        self.assertEqual(incremental, self._ward_stats(self.today))
+        self.assertIn((LEVEL_NATIONAL, None, None, None, 'Female', 4), incremental)
+    
+    def test_related_record_edits_move_the_watermark(self):
+        """
+        Test that editing a citizen's family or interests re-aggregates the
+        citizen's ward
+        """
+        family_model = Citizen._meta.get_field('family').related_model
+        interest_model = Citizen._meta.get_field('interests').related_model
+        family = family_model.objects.create(household_size=3)
+        Citizen.objects.filter(pk=self.citizens[0].pk).update(family=family)
+        interest = interest_model.objects.create(citizen=self.citizens[2], interest_type='Sport')
+        IncrementalAggregator(stat_date=self.yesterday).run()
+        
+        family.household_size = 6
+        family.save()
+        interest.delete()
+        
+        summary = IncrementalAggregator(stat_date=self.today).run()
+        
+        self.assertEqual(
+            summary['changed_wards'],
+            sorted({self.citizens[0].residence_ward_id, self.citizens[2].residence_ward_id})
+        )
+    
+    def test_emptied_ward_is_cleared(self):
+        """
+        Test that a ward whose citizens were all deleted loses its stats
+        """
+        IncrementalAggregator(stat_date=self.yesterday).run()
+        Citizen.objects.filter(residence_ward_id=3).delete()
+        
+        summary = IncrementalAggregator(stat_date=self.today).run()
+        
+        self.assertEqual(summary['changed_wards'], [3])
+        self.assertFalse(fact_queryset(DemographicStats).filter(
+            stat_date=self.today, ward_id=3
+        ).exists())
+        national = fact_queryset(DemographicStats).filter(
+            stat_date=self.today, level=LEVEL_NATIONAL, gender__isnull=False
+        ).aggregate(total=models.Sum('count'))['total']
+        self.assertEqual(national, 4)
+        self.assertFalse(AggregationWatermark.objects.filter(ward_id=3).exists())
+    
+    def test_birthday_changes_age_group(self):
+        """
+        Test that a ward is re-aggregated when a citizen changes age group
+        """
+        IncrementalAggregator(stat_date=self.yesterday).run()
+        
+        # Turns 18 today without the record changing
+        Citizen.objects.filter(pk=self.citizens[1].pk).update(
+            date_of_birth=self.today.replace(year=self.today.year - 18)
+            if (self.today.month, self.today.day) != (2, 29) else date(self.today.year - 18, 3, 1)
+        )
+        AggregationWatermark.objects.filter(ward_id=self.citizens[1].residence_ward_id).update(
+            last_updated_at=Citizen.objects.get(pk=self.citizens[1].pk).updated_at
+        )
+        
+        summary = IncrementalAggregator(stat_date=self.today).run()
+        
+        self.assertEqual(summary['changed_wards'], [self.citizens[1].residence_ward_id])
+
+class AggregationJobTestCase(TestCase):
+    """
+    Test cases for background aggregation jobs
+    """
+    
+    def setUp(self):
+        """
+        Set up citizens in two states
+        """
+        residences = [(1, 1, 1), (1, 2, 2), (2, 3, 3)]
+        for index, (state_id, lga_id, ward_id) in enumerate(residences):
+            Citizen.objects.create(
+                first_name=f'Citizen{index}',
+                last_name='Test',
+                gender='Male' if index % 2 else 'Female',
+                date_of_birth=date(timezone.now().year - 30, 1, 1),
+                phone_number=f'0801234567{index}',
+                email=f'citizen{index}@example.com',
+                address='123 Main St',
+                residence_state_id=state_id,
+                residence_lga_id=lga_id,
+                residence_ward_id=ward_id
+            )
+    
+    def test_job_is_enqueued_after_commit(self):
+        """
+        Test that a new job is handed to the executor once committed
+        """
+        with mock.patch('reporting.aggregation_jobs.enqueue_job') as enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                job, created = submit_job(state_id=1)
+        
+        self.assertTrue(created)
+        enqueue.assert_called_once_with(job)
+    
+    def test_covered_submissions_are_merged(self):
+        """
+        Test that submissions inside an active job's scope join it
+        """
+        job, _ = submit_job(state_id=1)
+        
+        merged, created = submit_job(state_id=1, lga_id=2)
+        
+        self.assertFalse(created)
+        self.assertEqual(merged.pk, job.pk)
+        self.assertEqual(merged.submission_count, 2)
+        
+        # Other states do not overlap
+        _, created = submit_job(state_id=2)
+        self.assertTrue(created)
+    
+    def test_wider_overlapping_submission_is_refused(self):
+        """
+        Test that a scope containing an active job's scope is refused
+        """
+        job, _ = submit_job(state_id=1, lga_id=1)
+        
+        with self.assertRaises(ScopeConflict) as context:
+            submit_job()
+        self.assertEqual(context.exception.job.pk, job.pk)
+        
+        # Finished jobs no longer hold their scope
+        AggregationJob.objects.filter(pk=job.pk).update(status=JOB_COMPLETED)
+        _, created = submit_job()
+        self.assertTrue(created)
+    
+    def test_submission_insert_is_conditional(self):
+        """
+        Test that the insert itself refuses a scope an active job overlaps
+        """
+        job, _ = submit_job(state_id=1)
+        
+        # A submission that raced past the lookup still inserts nothing
+        self.assertIsNone(_create_unless_overlapping(_overlapping(1, 2), None, 1, 2))
+        self.assertIsNone(_create_unless_overlapping(_overlapping(None, None), None, None, None))
+        self.assertEqual(AggregationJob.objects.count(), 1)
+        
+        created = _create_unless_overlapping(_overlapping(2, None), None, 2, None)
+        self.assertEqual((created.state_id, created.lga_id, created.status), (2, None, JOB_QUEUED))
+        self.assertNotEqual(created.pk, job.pk)
+        
+        # Jobs whose heartbeat stopped no longer hold their scope
+        AggregationJob.objects.filter(pk=job.pk).update(
+            status=JOB_RUNNING, updated_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertIsNotNone(_create_unless_overlapping(_overlapping(1, 2), None, 1, 2))
+    
+    def test_heartbeat_runs_on_a_timer(self):
+        """
+        Test that a running job's heartbeat moves between progress updates
+        """
+        job, _ = submit_job(state_id=1)
+        
+        with mock.patch.object(JobHeartbeat, 'beat') as beat:
+            with JobHeartbeat(job, interval=0.01):
+                time.sleep(0.2)
+            beats = beat.call_count
+            time.sleep(0.05)
+        
+        self.assertGreaterEqual(beats, 2)
+        self.assertEqual(beat.call_count, beats)
+        
+        # Only running jobs are touched
+        stale = timezone.now() - timedelta(hours=1)
+        AggregationJob.objects.filter(pk=job.pk).update(updated_at=stale)
+        JobHeartbeat(job).beat()
+        self.assertEqual(AggregationJob.objects.get(pk=job.pk).updated_at, stale)
+        
+        AggregationJob.objects.filter(pk=job.pk).update(status=JOB_RUNNING)
+        JobHeartbeat(job).beat()
+        self.assertGreater(AggregationJob.objects.get(pk=job.pk).updated_at, stale)
+    
+    def test_run_job_records_progress(self):
+        """
+        Test that a run records its stages and partitions
+        """
+        job, _ = submit_job(state_id=1)
+        
+        # In-process partitions close their connections, which would drop
+        # the in-memory test database
+        with mock.patch('reporting.parallel_aggregator.db.connections.close_all'):
+            job = run_job(job.pk)
+        
+        self.assertEqual(job.status, JOB_COMPLETED)
+        self.assertEqual([stage['name'] for stage in job.progress['stages']], ['partitions', 'rollups'])
+        self.assertTrue(all(stage['finished_at'] for stage in job.progress['stages']))
+        self.assertEqual(job.progress['partitions'], [{
+            'state_id': 1, 'lga_id': None, 'citizen_count': 2, 'status': JOB_COMPLETED,
+            'duration': job.progress['partitions'][0]['duration'], 'attempts': 1, 'error': None,
+        }])
+        self.assertTrue(fact_queryset(DemographicStats).filter(level=LEVEL_STATE, state_id=1).exists())
+        self.assertFalse(fact_queryset(DemographicStats).filter(state_id=2).exists())
+        
+        # A job is only ever run once
+        self.assertIsNone(run_job(job.pk))
+    
+    def test_failed_job(self):
+        """
+        Test that a job whose partitions fail is marked failed
+        """
+        job, _ = submit_job(state_id=1, lga_id=1)
+        
+        with mock.patch(
+            'reporting.parallel_aggregator._aggregate_partition',
+            side_effect=RuntimeError('worker lost')
+        ):
+            job = run_job(job.pk)
+        
+        self.assertEqual(job.status, JOB_FAILED)
+        self.assertEqual(job.progress['partitions'][0]['status'], JOB_FAILED)
+        self.assertIn('failed after retries', job.error)
+
+class AggregationTimingTestCase(TestCase):
+    """
+    Test cases for per-stage aggregation timings
+    """
+    
+    def setUp(self):
+        """
+        Set up citizens in one ward
+        """
+        for index in range(3):
+            Citizen.objects.create(
+                first_name=f'Citizen{index}',
+                last_name='Test',
+                gender='Male' if index % 2 else 'Female',
+                date_of_birth=date(timezone.now().year - 30, 1, 1),
+                phone_number=f'0801234567{index}',
+                email=f'citizen{index}@example.com',
+                address='123 Main St',
+                residence_state_id=1,
+                residence_lga_id=1,
+                residence_ward_id=1
+            )
+    
+    def test_stages_are_recorded(self):
+        """
+        Test that every aggregation call stores its stages with row counts
+        """
+        DataAggregator(chunk_size=2).aggregate_demographics(state_id=1)
+        
+        run = AggregationRun.objects.get(run_name='demographic_aggregation')
+        self.assertEqual(run.state_id, 1)
+        self.assertEqual(run.row_count, 3)
+        self.assertGreater(run.peak_memory_bytes, 0)
+        
+        stages = {timing.stage: timing for timing in run.stages.all()}
+        self.assertEqual(
+            set(stages), {'query', 'frame', 'groupby', 'clear', 'percentages', 'insert', 'rollups'}
+        )
+        
+        # Streaming reads two chunks, whose stages add up
+        self.assertEqual(stages['query'].calls, 2)
+        self.assertEqual(stages['groupby'].row_count, 3)
+        self.assertGreater(stages['insert'].row_count, 0)
+        
+        # Sub-second durations are kept
+        metadata = ReportMetadata.objects.get(report_name='demographic_aggregation')
+        self.assertIsInstance(metadata.generation_duration, float)
+    
+    def test_history_is_kept(self):
+        """
+        Test that repeated runs add history rows instead of overwriting
+        """
+        aggregator = DataAggregator()
+        aggregator.aggregate_occupations()
+        aggregator.aggregate_occupations()
+        
+        self.assertEqual(AggregationRun.objects.filter(run_name='occupation_aggregation').count(), 2)
+    
+    def test_timings_command_flags_regressions(self):
+        """
+        Test that a stage much slower than its history is flagged
+        """
+        for duration in [0.5, 0.6, 3.0]:
+            run = AggregationRun.objects.create(
+                run_name='demographic_aggregation', stat_date=timezone.now().date(), duration=duration
+            )
+            AggregationStageTiming.objects.create(run=run, stage='groupby', duration=duration, row_count=10)
+            AggregationStageTiming.objects.create(run=run, stage='query', duration=0.2, row_count=10)
+        
+        out = StringIO()
+        call_command('aggregation_timings', stdout=out)
+        output = out.getvalue()
+        
+        self.assertRegex(output, r'groupby .*REGRESSED')
+        self.assertNotRegex(output, r'query .*REGRESSED')
+        self.assertIn('1 stage(s) regressed', output)
+
+class RunBenchmarksCommandTestCase(TestCase):
+    """
+    Test cases for the run_benchmarks management command
+    """
+    
+    def setUp(self):
+        """
+        Pick a handful of quick benchmarks
+        """
+        self.only = ['citizen.validate_id', 'aggregate.demographics', 'report.demographic', 'export_csv.demographic']
+        self.output = tempfile.NamedTemporaryFile(suffix='.json', delete=False).name
+    
+    def test_results_are_written(self):
+        """
+        Test that every selected benchmark is timed and the data rolled back
+        """
+        out = StringIO()
+        call_command(
+            'run_benchmarks', scales='30,60', repeat=2, warmup=0, only=self.only,
+            output=self.output, stdout=out
+        )
+        
+        with open(self.output) as f:
+            results = json.load(f)
+        
+        self.assertEqual(sorted(results['scales']), ['30', '60'])
+        for scale_results in results['scales'].values():
+            self.assertEqual(sorted(scale_results), sorted(self.only))
+            for result in scale_results.values():
+                self.assertEqual(result['status'], 'ok', result.get('reason'))
+                self.assertEqual(result['runs'], 2)
+                self.assertGreater(result['median'], 0)
+        self.assertIn('Benchmarks completed', out.getvalue())
+        
+        self.assertFalse(Citizen.objects.exists())
+        self.assertFalse(StatFact.objects.exists())
+    
+    def test_baseline_regression_fails(self):
+        """
+        Test that a benchmark slower than the baseline fails the run
+        """
+        call_command(
+            'run_benchmarks', scales='30', repeat=1, warmup=0, only=self.only,
+            save_baseline=self.output, stdout=StringIO()
+        )
+        
+        # Pretend the baseline was ten times faster
+        with open(self.output) as f:
+            baseline = json.load(f)
+        for result in baseline['scales']['30'].values():
+            result['median'] /= 10
+        with open(self.output, 'w') as f:
+            json.dump(baseline, f)
+        
+        out = StringIO()
+        with self.assertRaisesRegex(CommandError, 'regressed'):
+            call_command(
+                'run_benchmarks', scales='30', repeat=1, warmup=0, only=self.only,
+                baseline=self.output, stdout=out
+            )
+        self.assertIn('REGRESSION aggregate.demographics', out.getvalue())
+    
+    def test_web_worker_startup_skips_heavy_modules(self):
+        """
+        Test that loading every view does not import pandas, NumPy or the
+        chart libraries
+        """
+        call_command(
+            'run_benchmarks', scales='1', repeat=1, warmup=0, only=['startup.*'],
+            output=self.output, stdout=StringIO()
+        )
+        
+        with open(self.output) as f:
+            result = json.load(f)['scales']['1']['startup.web_worker']
+        
+        self.assertEqual(result['status'], 'ok', result.get('reason'))
+        self.assertGreater(result['import_seconds'], 0)
+        self.assertEqual(result['heavy_modules'], [])
+    
+    def test_lazy_module(self):
+        """
+        Test that a lazy module is imported on first attribute access
+        """
+        module = LazyModule('json.decoder')
+        self.assertNotIn('_module', module.__dict__)
+        self.assertIs(module.JSONDecoder, json.decoder.JSONDecoder)
+        self.assertIn('_module', module.__dict__)
+        
+        # Modules already imported are returned as they are
+        self.assertIs(lazy_import('json'), json)
+    
+    def test_chart_formats_measure_payload(self):
+        """
+        Test that the chart benchmarks record each format's payload size
+        """
+        call_command(
+            'run_benchmarks', scales='30', repeat=1, warmup=0, only=['aggregate.demographics', 'chart.*'],
+            output=self.output, stdout=StringIO()
+        )
+        
+        with open(self.output) as f:
+            results = json.load(f)['scales']['30']
+        
+        self.assertEqual(sorted(results), ['aggregate.demographics', 'chart.png', 'chart.svg', 'chart.webp'])
+        for chart_format in ['png', 'svg', 'webp']:
+            result = results[f'chart.{chart_format}']
+            self.assertEqual(result['status'], 'ok', result.get('reason'))
+            self.assertGreater(result['charts'], 0)
+            self.assertGreater(result['bytes'], 0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,24 +2,32 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.reverse import reverse
 from django.http import HttpResponse
 from django.utils import timezone
+import base64
 import json
 import csv
 from io import StringIO
 from .models import (
     DemographicStats, OccupationStats, HealthcareStats, 
-    FamilyStats, InterestStats, ReportMetadata, CustomReport
+    FamilyStats, InterestStats, ReportMetadata, CustomReport, AggregationJob,
+    LEVEL_WARD
 )
-from .serializers import (
-    DemographicStatsSerializer, OccupationStatsSerializer, 
-    HealthcareStatsSerializer, FamilyStatsSerializer, 
-    InterestStatsSerializer, ReportMetadataSerializer,
-    CustomReportSerializer
+from .serializers import ReportMetadataSerializer, CustomReportSerializer, AggregationJobSerializer
+from .aggregation_jobs import submit_job, ScopeConflict
+from .report_generator import ReportGenerator, REPORT_TYPES
+from .report_cache import ReportCache, refresh_in_background
+from .charts import CHART_CONTENT_TYPES, DEFAULT_CHART_FORMAT, strip_charts
+from .crosstabs import CROSS_TABS
+from .star_schema import stats_queryset, export_columns
+from .exports import (
+    EXPORT_MODELS, COLUMNAR_FORMATS, CITIZEN_EXTRACT_COLUMNS, CITIZEN_EXTRACT_DIMENSIONS,
+    streaming_csv_response, streaming_columnar_response, citizen_extract
 )
-from .data_aggregator import DataAggregator
-from .report_generator import ReportGenerator
+from citizen.models import Citizen
 from datetime import datetime
+from urllib.parse import urlencode
 
 class ReportViewSet(viewsets.ViewSet):
     """
@@ -46,21 +54,23 @@ class ReportViewSet(viewsets.ViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
         
-        # Generate report
-        report_generator = ReportGenerator()
-        result = report_generator.generate_demographic_report(
-            state_id=state_id,
-            lga_id=lga_id,
-            report_date=report_date
-        )
-        
-        if result['success']:
-            return Response(result['report'])
-        else:
+        # Get chart format
+        chart_format = request.query_params.get('chart_format', DEFAULT_CHART_FORMAT)
+        if chart_format not in CHART_CONTENT_TYPES:
             return Response(
-                {'error': result['message']},
-                status=status.HTTP_404_NOT_FOUND
+                {'error': f"Invalid chart format. Use one of: {', '.join(CHART_CONTENT_TYPES)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Serve the report from the report cache, generating it on a miss
+        return self._cached_report(
+            request, 'demographic', chart_format, state_id, lga_id, report_date,
+            lambda report_generator: report_generator.generate_demographic_report(
+                state_id=state_id,
+                lga_id=lga_id,
+                report_date=report_date
             )
+        )
     
     @action(detail=False, methods=['get'])
     def occupation(self, request):
@@ -81,21 +91,23 @@ class ReportViewSet(viewsets.ViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
         
-        # Generate report
-        report_generator = ReportGenerator()
-        result = report_generator.generate_occupation_report(
-            state_id=state_id,
-            lga_id=lga_id,
-            report_date=report_date
-        )
-        
-        if result['success']:
-            return Response(result['report'])
-        else:
+        # Get chart format
+        chart_format = request.query_params.get('chart_format', DEFAULT_CHART_FORMAT)
+        if chart_format not in CHART_CONTENT_TYPES:
             return Response(
-                {'error': result['message']},
-                status=status.HTTP_404_NOT_FOUND
+                {'error': f"Invalid chart format. Use one of: {', '.join(CHART_CONTENT_TYPES)}."},
+                status=status.HTTP_400_BAD_REQUEST
             )
+        
+        # Serve the report from the report cache, generating it on a miss
+        return self._cached_report(
+            request, 'occupation', chart_format, state_id, lga_id, report_date,
+            lambda report_generator: report_generator.generate_occupation_report(
+                state_id=state_id,
+                lga_id=lga_id,
+                report_date=report_date
+            )
+        )
     
     @action(detail=False, methods=['get'])
     def healthcare(self, request):
@@ -116,21 +128,23 @@ class ReportViewSet(viewsets.ViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
         
-        # Generate report
-        report_generator = ReportGenerator()
-        result = report_generator.generate_healthcare_report(
-            state_id=state_id,
-            lga_id=lga_id,
-            report_date=report_date
-        )
-        
-        if result['success']:
-            return Response(result['report'])
-        else:
+        # Get chart format
+        chart_format = request.query_params.get('chart_format', DEFAULT_CHART_FORMAT)
+        if chart_format not in CHART_CONTENT_TYPES:
             return Response(
-                {'error': result['message']},
-                status=status.HTTP_404_NOT_FOUND
+                {'error': f"Invalid chart format. Use one of: {', '.join(CHART_CONTENT_TYPES)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Serve the report from the report cache, generating it on a miss
+        return self._cached_report(
+            request, 'healthcare', chart_format, state_id, lga_id, report_date,
+            lambda report_generator: report_generator.generate_healthcare_report(
+                state_id=state_id,
+                lga_id=lga_id,
+                report_date=report_date
             )
+        )
     
     @action(detail=False, methods=['get'])
     def family(self, request):
@@ -151,21 +165,23 @@ class ReportViewSet(viewsets.ViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
         
-        # Generate report
-        report_generator = ReportGenerator()
-        result = report_generator.generate_family_report(
-            state_id=state_id,
-            lga_id=lga_id,
-            report_date=report_date
-        )
-        
-        if result['success']:
-            return Response(result['report'])
-        else:
+        # Get chart format
+        chart_format = request.query_params.get('chart_format', DEFAULT_CHART_FORMAT)
+        if chart_format not in CHART_CONTENT_TYPES:
             return Response(
-                {'error': result['message']},
-                status=status.HTTP_404_NOT_FOUND
+                {'error': f"Invalid chart format. Use one of: {', '.join(CHART_CONTENT_TYPES)}."},
+                status=status.HTTP_400_BAD_REQUEST
             )
+        
+        # Serve the report from the report cache, generating it on a miss
+        return self._cached_report(
+            request, 'family', chart_format, state_id, lga_id, report_date,
+            lambda report_generator: report_generator.generate_family_report(
+                state_id=state_id,
+                lga_id=lga_id,
+                report_date=report_date
+            )
+        )
     
     @action(detail=False, methods=['get'])
     def interests(self, request):
@@ -177,6 +193,50 @@ class ReportViewSet(viewsets.ViewSet):
         lga_id = request.query_params.get('lga_id')
         report_date = request.query_params.get('report_date')
         
+        if report_date:
+            try:
+                report_date = datetime.strptime(report_date, '%Y-%m-%d').date()
+            except ValueError:
+                return Response(
+                    {'error': 'Invalid date format. Use YYYY-MM-DD.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        # Get chart format
+        chart_format = request.query_params.get('chart_format', DEFAULT_CHART_FORMAT)
+        if chart_format not in CHART_CONTENT_TYPES:
+            return Response(
+                {'error': f"Invalid chart format. Use one of: {', '.join(CHART_CONTENT_TYPES)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Serve the report from the report cache, generating it on a miss
+        return self._cached_report(
+            request, 'interests', chart_format, state_id, lga_id, report_date,
+            lambda report_generator: report_generator.generate_interests_report(
+                state_id=state_id,
+                lga_id=lga_id,
+                report_date=report_date
+            )
+        )
+    
+    @action(detail=False, methods=['get'])
+    def crosstab(self, request):
+        """
+        Generate a cross-tabulation report (e.g. the age x gender pyramid)
+        """
+        # Get parameters
+        tab_name = request.query_params.get('tab')
+        state_id = request.query_params.get('state_id')
+        lga_id = request.query_params.get('lga_id')
+        report_date = request.query_params.get('report_date')
+        
+        if tab_name not in CROSS_TABS:
+            return Response(
+                {'error': f"Invalid cross-tab. Use one of: {', '.join(CROSS_TABS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         if report_date:
             try:
                 report_date = datetime.strptime(report_date, '%Y-%m-%d').date()
@@ -188,7 +248,8 @@ class ReportViewSet(viewsets.ViewSet):
         
         # Generate report
         report_generator = ReportGenerator()
-        result = report_generator.generate_interests_report(
+        result = report_generator.generate_crosstab_report(
+            tab_name,
             state_id=state_id,
             lga_id=lga_id,
             report_date=report_date
@@ -220,25 +281,273 @@ class ReportViewSet(viewsets.ViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
         
-        # Generate dashboard
+        # Get chart format
+        chart_format = request.query_params.get('chart_format', DEFAULT_CHART_FORMAT)
+        if chart_format not in CHART_CONTENT_TYPES:
+            return Response(
+                {'error': f"Invalid chart format. Use one of: {', '.join(CHART_CONTENT_TYPES)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Serve the dashboard from the report cache, generating it on a miss
+        return self._cached_report(
+            request, 'executive_dashboard', chart_format, state_id, None, report_date,
+            lambda report_generator: report_generator.generate_executive_dashboard(
+                state_id=state_id,
+                report_date=report_date
+            )
+        )
+    
+    @action(detail=False, methods=['get'])
+    def chart(self, request):
+        """
+        Render one chart of a report as an image
+        """
+        # Get parameters
+        report_type = request.query_params.get('report')
+        chart_id = request.query_params.get('chart')
+        state_id = request.query_params.get('state_id')
+        lga_id = request.query_params.get('lga_id')
+        report_date = request.query_params.get('report_date')
+        
+        if report_type not in REPORT_TYPES:
+            return Response(
+                {'error': f"Invalid report. Use one of: {', '.join(REPORT_TYPES)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not chart_id:
+            return Response(
+                {'error': 'Chart is required.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if report_date:
+            try:
+                report_date = datetime.strptime(report_date, '%Y-%m-%d').date()
+            except ValueError:
+                return Response(
+                    {'error': 'Invalid date format. Use YYYY-MM-DD.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        # Get chart format
+        chart_format = request.query_params.get('chart_format', DEFAULT_CHART_FORMAT)
+        if chart_format not in CHART_CONTENT_TYPES:
+            return Response(
+                {'error': f"Invalid chart format. Use one of: {', '.join(CHART_CONTENT_TYPES)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Render chart
         report_generator = ReportGenerator()
-        result = report_generator.generate_executive_dashboard(
+        result = report_generator.generate_chart(
+            report_type,
+            chart_id,
             state_id=state_id,
-            report_date=report_date
+            lga_id=lga_id,
+            report_date=report_date,
+            image_format=chart_format
         )
         
-        if result['success']:
-            return Response(result['dashboard'])
-        else:
+        if not result['success']:
             return Response(
                 {'error': result['message']},
                 status=status.HTTP_404_NOT_FOUND
             )
+        
+        return HttpResponse(result['image'], content_type=CHART_CONTENT_TYPES[chart_format])
+    
+    @action(detail=False, methods=['get'], url_path='cache-stats')
+    def cache_stats(self, request):
+        """
+        Get the report cache's hit and miss totals
+        """
+        return Response(ReportCache().stats())
+    
+    def _cached_report(self, request, report_type, chart_format, state_id, lga_id, report_date, generate):
+        """
+        Serve a report from the report cache, or generate and cache it
+        
+        Reports are cached as the JSON bytes of their response, so a hit is
+        a few cache reads with no queries or serialization. Other renderers
+        (e.g. the browsable API) always generate the report.
+        
+        When many requests want a report that is not cached, e.g. the
+        morning rush on the executive dashboard, one of them generates it
+        under the report's cache lock while the others, in any web worker,
+        wait for its entry. An expired report keeps being served while one
+        request regenerates it in the background.
+        
+        Args:
+            generate (callable): Called with a report generator on a miss;
+                returns the generator's result
+        """
+        if request.accepted_renderer.format != 'json':
+            report_generator, report, message = self._generate_report(request, report_type, chart_format, generate)
+            return self._report_response(report, message)
+        
+        # Chart URLs are absolute, so the host is part of the format
+        charts = request.query_params.get('charts') or 'url'
+        variant = f"{charts}:{chart_format}"
+        if charts not in ['none', 'inline']:
+            variant = f"{variant}:{request.build_absolute_uri('/')}"
+        
+        report_cache = ReportCache()
+        key = report_cache.key(report_type, report_date or timezone.now().date(), state_id, lga_id, variant)
+        entry = report_cache.get(key, report_type)
+        if entry is not None:
+            content, fresh = entry
+            if not fresh and report_cache.acquire(key):
+                refresh_in_background(
+                    self._refresh_report, request, report_type, chart_format, generate, report_cache, key
+                )
+            return self._cached_response(content, 'hit' if fresh else 'stale')
+        
+        # Requests that lose the race for the lock wait for the winner's
+        # entry, and only generate the report themselves if none comes
+        locked = report_cache.acquire(key)
+        if not locked:
+            content = report_cache.wait(key)
+            if content is not None:
+                return self._cached_response(content, 'coalesced')
+        
+        try:
+            report_generator, report, message = self._generate_report(request, report_type, chart_format, generate)
+        except Exception:
+            if locked:
+                report_cache.release(key)
+            raise
+        
+        response = self._report_response(report, message)
+        if report is None:
+            if locked:
+                report_cache.release(key)
+            return response
+        
+        # Cache the bytes once the response is rendered, for as long as the
+        # report's aggregation metadata allows, then let the waiters in
+        timeout = report_generator.cache_timeout(report_type)
+        
+        def store(rendered):
+            if timeout:
+                report_cache.set(key, rendered.content, timeout)
+            if locked:
+                report_cache.release(key)
+        
+        response['X-Report-Cache'] = 'miss'
+        response.add_post_render_callback(store)
+        return response
+    
+    def _refresh_report(self, request, report_type, chart_format, generate, report_cache, key):
+        """
+        Regenerate an expired report in the background, then release its
+        lock
+        """
+        try:
+            report_generator, report, message = self._generate_report(request, report_type, chart_format, generate)
+            timeout = report_generator.cache_timeout(report_type)
+            if report is not None and timeout:
+                content = request.accepted_renderer.render(
+                    report, request.accepted_media_type, {'request': request, 'view': self}
+                )
+                report_cache.set(key, content, timeout)
+        finally:
+            report_cache.release(key)
+    
+    def _generate_report(self, request, report_type, chart_format, generate):
+        """
+        Generate a report and replace its chart specs as the client asked
+        
+        Returns:
+            tuple: The report generator, then the report and None, or None
+            and the error message when there is no data
+        """
+        report_generator = self._report_generator(request, chart_format)
+        result = generate(report_generator)
+        if not result['success']:
+            return report_generator, None, result['message']
+        
+        report = result['dashboard'] if report_type == 'executive_dashboard' else result['report']
+        return report_generator, self._with_charts(request, report_type, report, report_generator, chart_format), None
+    
+    def _report_response(self, report, message):
+        """
+        Respond with a generated report, or 404 when there is no data
+        """
+        if report is None:
+            return Response(
+                {'error': message},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(report)
+    
+    def _cached_response(self, content, result):
+        """
+        Respond with a serialized report from the report cache
+        """
+        response = HttpResponse(content, content_type='application/json')
+        response['X-Report-Cache'] = result
+        return response
+    
+    def _report_generator(self, request, chart_format):
+        """
+        Get a report generator, which starts drawing the report's charts
+        while its sections are queried only when they are to be inlined
+        
+        Chart URLs are drawn when, and if, the client fetches them.
+        """
+        if request.query_params.get('charts') == 'inline':
+            return ReportGenerator(prerender_format=chart_format)
+        return ReportGenerator()
+    
+    def _with_charts(self, request, report_type, report, report_generator, chart_format):
+        """
+        Replace a report's chart specs with what the client asked for
+        
+        By default each section gets the URL of its chart. ?charts=inline
+        embeds the images as base64 instead, and ?charts=none returns only
+        the data.
+        """
+        charts = request.query_params.get('charts')
+        if charts == 'none':
+            return strip_charts(report)
+        
+        if charts == 'inline':
+            for entry in report.get('sections', []) + report.get('charts', []):
+                chart = entry.pop('chart', None)
+                if chart:
+                    image = report_generator.render_chart(chart, chart_format)
+                    entry['chart_image'] = base64.b64encode(image).decode('utf-8')
+                    entry['chart_content_type'] = CHART_CONTENT_TYPES[chart_format]
+            return report
+        
+        # Chart URLs name the resolved date so they stay valid after midnight
+        parameters = report['parameters']
+        query = {
+            'report': report_type,
+            'report_date': parameters['report_date'].isoformat(),
+            'chart_format': chart_format
+        }
+        for key in ['state_id', 'lga_id']:
+            if parameters.get(key):
+                query[key] = parameters[key]
+        
+        chart_url = reverse('reports-chart', request=request)
+        for entry in report.get('sections', []) + report.get('charts', []):
+            chart = entry.pop('chart', None)
+            if chart:
+                entry['chart_url'] = f"{chart_url}?{urlencode({**query, 'chart': chart['id']})}"
+        
+        return report
     
     @action(detail=False, methods=['post'])
     def run_aggregation(self, request):
         """
-        Run data aggregation process
+        Queue a data aggregation job
+        
+        Returns the job at once; a submission covered by a queued or running
+        job joins that job instead of starting another.
         """
         # Check if user has permission
         if not request.user.has_perm('reporting.generate_reports'):
@@ -251,36 +560,44 @@ class ReportViewSet(viewsets.ViewSet):
         state_id = request.data.get('state_id')
         lga_id = request.data.get('lga_id')
         
-        # Run aggregation
-        aggregator = DataAggregator()
-        
-        if state_id and lga_id:
-            # Aggregate for specific LGA
-            aggregator.aggregate_demographics(state_id=state_id, lga_id=lga_id)
-            aggregator.aggregate_occupations(state_id=state_id, lga_id=lga_id)
-            aggregator.aggregate_healthcare(state_id=state_id, lga_id=lga_id)
-            aggregator.aggregate_family_structures(state_id=state_id, lga_id=lga_id)
-            aggregator.aggregate_interests(state_id=state_id, lga_id=lga_id)
-        elif state_id:
-            # Aggregate for specific state
-            aggregator.aggregate_demographics(state_id=state_id)
-            aggregator.aggregate_occupations(state_id=state_id)
-            aggregator.aggregate_healthcare(state_id=state_id)
-            aggregator.aggregate_family_structures(state_id=state_id)
-            aggregator.aggregate_interests(state_id=state_id)
-        else:
-            # Aggregate all data
-            aggregator.aggregate_all_data()
+        try:
+            job, created = submit_job(request.user, state_id=state_id, lga_id=lga_id)
+        except ScopeConflict as e:
+            return Response(
+                {'error': str(e), 'job_id': e.job.job_id},
+                status=status.HTTP_409_CONFLICT
+            )
         
         return Response({
-            'message': 'Data aggregation completed successfully',
+            'message': 'Data aggregation queued' if created else 'Joined running data aggregation',
+            'job_id': job.job_id,
+            'status': job.status,
+            'status_url': reverse('reports-aggregation-job', kwargs={'job_id': job.job_id}, request=request),
             'timestamp': timezone.now()
-        })
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=False, methods=['get'], url_path=r'aggregation-jobs/(?P<job_id>\d+)')
+    def aggregation_job(self, request, job_id=None):
+        """
+        Get the status and stage/partition progress of an aggregation job
+        """
+        try:
+            job = AggregationJob.objects.get(pk=job_id)
+        except AggregationJob.DoesNotExist:
+            return Response(
+                {'error': 'Aggregation job not found.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        return Response(AggregationJobSerializer(job).data)
     
     @action(detail=False, methods=['get'])
     def export_csv(self, request):
         """
         Export report data as CSV
+        
+        Rows are streamed from the database as they are written, gzipped
+        when the client accepts it.
         """
         # Get parameters
         report_type = request.query_params.get('type')
@@ -294,49 +611,116 @@ class ReportViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Build filter conditions
-        filters = {'stat_date': report_date}
+        # Build filter conditions; exports hold ward rows, not rollups
+        filters = {'stat_date': report_date, 'level': LEVEL_WARD}
         if state_id:
             filters['state_id'] = state_id
         if lga_id:
             filters['lga_id'] = lga_id
         
         # Get data based on report type
-        if report_type == 'demographic':
-            data = DemographicStats.objects.filter(**filters)
-            serializer = DemographicStatsSerializer
-        elif report_type == 'occupation':
-            data = OccupationStats.objects.filter(**filters)
-            serializer = OccupationStatsSerializer
-        elif report_type == 'healthcare':
-            data = HealthcareStats.objects.filter(**filters)
-            serializer = HealthcareStatsSerializer
-        elif report_type == 'family':
-            data = FamilyStats.objects.filter(**filters)
-            serializer = FamilyStatsSerializer
-        elif report_type == 'interests':
-            data = InterestStats.objects.filter(**filters)
-            serializer = InterestStatsSerializer
-        else:
+        model = EXPORT_MODELS.get(report_type)
+        if model is None:
             return Response(
                 {'error': f'Invalid report type: {report_type}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Serialize data
-        serialized_data = serializer(data, many=True).data
+        # Rows come from the fact table or, for older dates, the legacy
+        # table, in the legacy table's columns either way; they are
+        # streamed as they are fetched
+        return streaming_csv_response(
+            request,
+            stats_queryset(model, report_date).filter(**filters),
+            export_columns(model),
+            f'{report_type}_report_{report_date}.csv'
+        )
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Export a stats family, or a jurisdiction's citizens, as Parquet or
+        an Arrow IPC stream
         
-        # Create CSV
-        csv_buffer = StringIO()
-        writer = csv.DictWriter(csv_buffer, fieldnames=serialized_data[0].keys() if serialized_data else [])
-        writer.writeheader()
-        writer.writerows(serialized_data)
+        Columnar files keep the column types and load into pandas or other
+        dataframe libraries without parsing. ?type=citizens exports the
+        citizens of a state or LGA, without names or contact details.
+        """
+        # Get parameters
+        report_type = request.query_params.get('type')
+        file_format = request.query_params.get('file_format', 'parquet')
+        state_id = request.query_params.get('state_id')
+        lga_id = request.query_params.get('lga_id')
+        report_date = request.query_params.get('report_date', timezone.now().date().isoformat())
         
-        # Create response
-        response = HttpResponse(csv_buffer.getvalue(), content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{report_type}_report_{report_date}.csv"'
+        if file_format not in COLUMNAR_FORMATS:
+            return Response(
+                {'error': f"Invalid file format. Use one of: {', '.join(COLUMNAR_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        return response
+        if report_type == 'citizens':
+            # Citizen rows need the reporting permission and a jurisdiction
+            if not request.user.has_perm('reporting.generate_reports'):
+                return Response(
+                    {'error': 'You do not have permission to export citizens.'},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+            if not state_id:
+                return Response(
+                    {'error': 'A state is required for citizen extracts.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            try:
+                state_id = int(state_id)
+                lga_id = int(lga_id) if lga_id else None
+            except ValueError:
+                return Response(
+                    {'error': 'State and LGA ids must be integers.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # Only the user's own state or LGA may be extracted
+            if not request.user.has_jurisdiction(state_id=state_id, lga_id=lga_id):
+                return Response(
+                    {'error': 'You do not have jurisdiction over these citizens.'},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+            
+            columns, names = zip(*CITIZEN_EXTRACT_COLUMNS)
+            export_args = (
+                citizen_extract(state_id, lga_id), Citizen, list(columns), file_format,
+                f"citizens_{lga_id or state_id}_{timezone.now().date().isoformat()}"
+            )
+            export_kwargs = {'names': list(names), 'dimensions': CITIZEN_EXTRACT_DIMENSIONS}
+        else:
+            model = EXPORT_MODELS.get(report_type)
+            if model is None:
+                return Response(
+                    {'error': f'Invalid report type: {report_type}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # Build filter conditions; exports hold ward rows, not rollups
+            filters = {'stat_date': report_date, 'level': LEVEL_WARD}
+            if state_id:
+                filters['state_id'] = state_id
+            if lga_id:
+                filters['lga_id'] = lga_id
+            
+            export_args = (
+                stats_queryset(model, report_date).filter(**filters), model, export_columns(model),
+                file_format, f'{report_type}_report_{report_date}'
+            )
+            export_kwargs = {'dimensions': model.dimension_fields + ['level']}
+        
+        try:
+            return streaming_columnar_response(*export_args, **export_kwargs)
+        except ImportError:
+            return Response(
+                {'error': 'Columnar exports need pyarrow, which is not installed.'},
+                status=status.HTTP_501_NOT_IMPLEMENTED
+            )
 
 class CustomReportViewSet(viewsets.ModelViewSet):
     """
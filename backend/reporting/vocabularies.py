@@ -0,0 +1,122 @@
+from .age_engine import AGE_GROUP_LABELS
+from .lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Household size and children count groups produced by the aggregator
+HOUSEHOLD_SIZE_GROUPS = ['1', '2', '3-4', '5-6', '7-10', '10+']
+CHILDREN_COUNT_GROUPS = ['0', '1', '2', '3', '4-5', '6-10', '10+']
+
+# Known values of each dimension column, in display order. Values not
+# listed here are still accepted and appended as they are first seen.
+KNOWN_CATEGORIES = {
+    'gender': ['Male', 'Female'],
+    'age_group': AGE_GROUP_LABELS,
+    'religion': ['Christianity', 'Islam', 'Traditional', 'Other'],
+    'ethnicity': ['Yoruba', 'Igbo', 'Hausa', 'Fulani', 'Ijaw', 'Kanuri', 'Ibibio', 'Tiv', 'Other'],
+    'education__level': ['None', 'Primary', 'Secondary', 'Tertiary', 'University', 'Postgraduate'],
+    'occupation__employment_status': ['Employed', 'Unemployed', 'Self-employed', 'Student', 'Retired'],
+    'occupation__income_level': ['Low', 'Middle', 'High'],
+    'health__blood_group': ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'],
+    'health__immunization_status': ['Complete', 'Partial', 'None'],
+    'household_size_group': HOUSEHOLD_SIZE_GROUPS,
+    'children_count_group': CHILDREN_COUNT_GROUPS,
+    'family__marital_status': ['Single', 'Married', 'Divorced', 'Widowed'],
+    'interest_type': ['Sport', 'Cultural'],
+}
+
+class CategoryVocabulary:
+    """
+    Append-only mapping between the values of one dimension and integer codes
+    
+    Codes never change once assigned, so counts keyed by code can be
+    accumulated across chunks and only decoded when stats are written.
+    """
+    
+    def __init__(self, categories=()):
+        self.categories = []
+        self._codes = {}
+        self._lookup(categories)
+    
+    def __len__(self):
+        return len(self.categories)
+    
+    def encode(self, values):
+        """
+        Encode values as integer codes
+        
+        Args:
+            values: Sequence, Series or Categorical of values
+        
+        Returns:
+            numpy.ndarray: int32 codes, -1 for missing values
+        """
+        if isinstance(values, pd.Series):
+            values = values.array
+        elif not isinstance(values, (pd.Categorical, np.ndarray)):
+            values = np.asarray(values, dtype=object)
+        
+        # Categoricals only need their (few) categories translated
+        if isinstance(values, pd.Categorical):
+            codes, uniques = values.codes, values.categories
+        else:
+            codes, uniques = pd.factorize(values)
+        
+        if len(uniques) == 0:
+            return np.full(len(codes), -1, dtype=np.int32)
+        
+        translated = self._lookup(uniques)[codes]
+        return np.where(codes >= 0, translated, -1).astype(np.int32)
+    
+    def to_categorical(self, values):
+        """
+        Convert values to a Categorical over this vocabulary
+        """
+        return pd.Categorical.from_codes(self.encode(values), categories=self.categories)
+    
+    def decode(self, code):
+        """
+        Get the value for a code
+        """
+        return self.categories[code]
+    
+    def _lookup(self, values):
+        """
+        Get codes for values, registering any that are new
+        """
+        codes = np.empty(len(values), dtype=np.int32)
+        for index, value in enumerate(values):
+            code = self._codes.get(value)
+            if code is None:
+                code = len(self.categories)
+                self.categories.append(value)
+                self._codes[value] = code
+            codes[index] = code
+        return codes
+
+class VocabularyRegistry:
+    """
+    Registry of category vocabularies, one per dimension column
+    """
+    
+    def __init__(self, known_categories=None):
+        self.known_categories = KNOWN_CATEGORIES if known_categories is None else known_categories
+        self._vocabularies = {}
+    
+    def get(self, dimension):
+        """
+        Get the vocabulary for a dimension, seeded with its known values
+        """
+        if dimension not in self._vocabularies:
+            self._vocabularies[dimension] = CategoryVocabulary(
+                self.known_categories.get(dimension, ())
+            )
+        return self._vocabularies[dimension]
+    
+    def encode_frame(self, df, dimensions):
+        """
+        Replace the dimension columns of a DataFrame with Categoricals
+        """
+        for dimension in dimensions:
+            df[dimension] = self.get(dimension).to_categorical(df[dimension])
@@ -0,0 +1,46 @@
+import React, { useState, useEffect } from 'react';
+import axios from 'axios';
+import { Spin } from 'antd';
+
+// Report chart fetched through axios, so the request carries the API's
+// Authorization header, which a plain <img src> would not send
+const ChartImage = ({ url, alt }) => {
+  const [objectUrl, setObjectUrl] = useState(null);
+  const [failed, setFailed] = useState(false);
+
+  useEffect(() => {
+    let cancelled = false;
+    let blobUrl = null;
+
+    const fetchChart = async () => {
+      setObjectUrl(null);
+      setFailed(false);
+
+      try {
+        const response = await axios.get(url, { responseType: 'blob' });
+        if (cancelled) return;
+        blobUrl = URL.createObjectURL(response.data);
+        setObjectUrl(blobUrl);
+      } catch (err) {
+        if (cancelled) return;
+        setFailed(true);
+        console.error('Error fetching chart:', err);
+      }
+    };
+
+    fetchChart();
+
+    // Release the image when the chart changes or leaves the page
+    return () => {
+      cancelled = true;
+      if (blobUrl) URL.revokeObjectURL(blobUrl);
+    };
+  }, [url]);
+
+  if (failed) return <p className="chart-error">Chart unavailable.</p>;
+  if (!objectUrl) return <Spin />;
+
+  return <img src={objectUrl} alt={alt} style={{ width: '100%' }} />;
+};
+
+export default ChartImage;
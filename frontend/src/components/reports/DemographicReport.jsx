@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import axios from 'axios';
 import { Card, Row, Col, Select, DatePicker, Spin, Alert, Table, Button } from 'antd';
 import { DownloadOutlined } from '@ant-design/icons';
+import ChartImage from './ChartImage';
 
 const { Option } = Select;
 
@@ -186,11 +187,9 @@ const DemographicReport = () => {
             <Card title={section.title} key={index} className="report-section">
               <Row gutter={16}>
                 <Col span={12}>
-                  <img
-                    src={`data:image/png;base64,${section.chart}`}
-                    alt={section.title}
-                    style={{ width: '100%' }}
-                  />
+                  {section.chart_url && (
+                    <ChartImage url={section.chart_url} alt={section.title} />
+                  )}
                 </Col>
                 <Col span={12}>
                   <Table
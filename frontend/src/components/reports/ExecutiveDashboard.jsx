@@ -2,9 +2,29 @@ import React, { useState, useEffect } from 'react';
 import axios from 'axios';
 import { Card, Row, Col, Statistic, Select, DatePicker, Spin, Alert } from 'antd';
 import { UserOutlined, BriefcaseOutlined, HomeOutlined } from '@ant-design/icons';
+import ChartImage from './ChartImage';
 
 const { Option } = Select;
 
+// Inline line chart of a metric's values over the latest stat dates
+const Sparkline = ({ values, width = 160, height = 32 }) => {
+  if (!values || values.length < 2) return null;
+
+  const min = Math.min(...values);
+  const range = Math.max(...values) - min || 1;
+  const points = values.map((value, index) => {
+    const x = (index / (values.length - 1)) * width;
+    const y = height - ((value - min) / range) * height;
+    return `${x.toFixed(1)},${y.toFixed(1)}`;
+  });
+
+  return (
+    <svg width={width} height={height} className="sparkline">
+      <polyline points={points.join(' ')} fill="none" stroke="#1890ff" strokeWidth="1.5" />
+    </svg>
+  );
+};
+
 const ExecutiveDashboard = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
@@ -73,6 +93,11 @@ const ExecutiveDashboard = () => {
     }
   };
 
+  const getTrendValues = (metricName) => {
+    const trend = (dashboard.trends || []).find(trend => trend.name === metricName);
+    return trend ? trend.values : null;
+  };
+
   return (
     <div className="executive-dashboard">
       <h1>Executive Dashboard</h1>
@@ -132,6 +157,7 @@ const ExecutiveDashboard = () => {
                     value={metric.value}
                     prefix={getIconForMetric(metric.icon)}
                   />
+                  <Sparkline values={getTrendValues(metric.name)} />
                 </Card>
               </Col>
             ))}
@@ -141,11 +167,7 @@ const ExecutiveDashboard = () => {
             {dashboard.charts.map((chart, index) => (
               <Col span={12} key={index}>
                 <Card title={chart.title}>
-                  <img
-                    src={`data:image/png;base64,${chart.image}`}
-                    alt={chart.title}
-                    style={{ width: '100%' }}
-                  />
+                  <ChartImage url={chart.chart_url} alt={chart.title} />
                 </Card>
               </Col>
             ))}